@@ -0,0 +1,86 @@
+"""Bring clienti under migrations with a unique index on codice
+
+Revision ID: 3e5a9b1c7d20
+Revises: 8d3f61a0c7b2
+Create Date: 2026-10-17 14:22:37.904116
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3e5a9b1c7d20"
+down_revision = "8d3f61a0c7b2"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "ragione_sociale",
+    "alias",
+    "cap",
+    "localita",
+    "indirizzo",
+    "pv",
+    "nz",
+    "telefono",
+    "codice_fiscale",
+    "partita_iva",
+)
+
+
+def _invalid_index(name: str) -> bool:
+    # Un CREATE INDEX CONCURRENTLY fallito lascia l'indice INVALID, e
+    # IF NOT EXISTS al tentativo successivo non lo ricreerebbe
+    bind = op.get_bind()
+    return (
+        bind.execute(
+            sa.text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).scalar()
+        is not None
+    )
+
+
+def upgrade():
+    # Sui database esistenti la tabella è stata creata da initial_client.py,
+    # a volte con solo una parte delle colonne
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS clienti "
+        "(id serial PRIMARY KEY, codice varchar NOT NULL)"
+    )
+    for column in COLUMNS:
+        op.execute(f"ALTER TABLE clienti ADD COLUMN IF NOT EXISTS {column} varchar")
+
+    # I caricamenti ripetuti hanno lasciato righe doppie: si tiene la prima
+    op.execute("DELETE FROM clienti WHERE codice IS NULL OR trim(codice) = ''")
+    op.execute(
+        """
+        DELETE FROM clienti c USING clienti d
+        WHERE upper(trim(d.codice)) = upper(trim(c.codice)) AND d.id < c.id
+        """
+    )
+    op.execute(
+        "UPDATE clienti SET codice = upper(trim(codice)) "
+        "WHERE codice <> upper(trim(codice))"
+    )
+    op.execute("ALTER TABLE clienti ALTER COLUMN codice SET NOT NULL")
+
+    # CONCURRENTLY non può stare in una transazione; così l'indice si crea
+    # senza bloccare le letture e le scritture sulla tabella
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS clienti_codice_key")
+        if _invalid_index("ix_clienti_codice_norm"):
+            op.execute("DROP INDEX CONCURRENTLY ix_clienti_codice_norm")
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_codice_norm "
+            "ON clienti (upper(trim(codice)))"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_clienti_codice_norm")
+    op.execute("ALTER TABLE clienti ALTER COLUMN codice DROP NOT NULL")
@@ -0,0 +1,53 @@
+"""Add storage for filtered CSV results
+
+Revision ID: 5b7e0c2d9f41
+Revises: 1a31ce608336
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b7e0c2d9f41"
+down_revision = "1a31ce608336"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "csv_risultati",
+        sa.Column("giorno", sa.Date(), nullable=False),
+        sa.Column(
+            "filename", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False
+        ),
+        sa.Column("intestazione", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("righe", sa.Integer(), nullable=False),
+        sa.Column("totale_cents", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "content_hash", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False
+        ),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("giorno"),
+    )
+    # Righe filtrate, partizionate per mese di `giorno`; le partizioni
+    # vengono create dall'applicazione al primo salvataggio del mese
+    op.execute(
+        """
+        CREATE TABLE csv_righe (
+            giorno date NOT NULL,
+            riga integer NOT NULL,
+            codice varchar NOT NULL,
+            importo_cents bigint,
+            linea text NOT NULL,
+            PRIMARY KEY (giorno, riga)
+        ) PARTITION BY RANGE (giorno)
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE csv_righe")
+    op.drop_table("csv_risultati")
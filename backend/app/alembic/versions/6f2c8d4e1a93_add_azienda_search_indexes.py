@@ -0,0 +1,104 @@
+"""Add azienda table with search indexes
+
+Revision ID: 6f2c8d4e1a93
+Revises: 3e5a9b1c7d20
+Create Date: 2026-10-17 15:40:12.118529
+
+"""
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6f2c8d4e1a93"
+down_revision = "3e5a9b1c7d20"
+branch_labels = None
+depends_on = None
+
+# Colonne cercate per sottostringa con gli indici trigram
+TRGM_COLUMNS = ("ragione_sociale", "citta")
+
+
+def _has_pg_trgm() -> bool:
+    bind = op.get_bind()
+    return (
+        bind.execute(
+            sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        ).scalar()
+        is not None
+    )
+
+
+def upgrade():
+    op.create_table(
+        "azienda",
+        sa.Column("codice", sqlmodel.sql.sqltypes.AutoString(length=10), nullable=False),
+        sa.Column(
+            "ragione_sociale", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False
+        ),
+        sa.Column("nazione", sqlmodel.sql.sqltypes.AutoString(length=100), nullable=False),
+        sa.Column(
+            "provincia", sqlmodel.sql.sqltypes.AutoString(length=100), nullable=False
+        ),
+        sa.Column("citta", sqlmodel.sql.sqltypes.AutoString(length=100), nullable=False),
+        sa.Column("via", sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column("cap", sqlmodel.sql.sqltypes.AutoString(length=20), nullable=False),
+        sa.Column("telefono", sqlmodel.sql.sqltypes.AutoString(length=30), nullable=True),
+        sa.Column(
+            "codice_fiscale", sqlmodel.sql.sqltypes.AutoString(length=16), nullable=True
+        ),
+        sa.Column(
+            "partita_iva", sqlmodel.sql.sqltypes.AutoString(length=11), nullable=True
+        ),
+        sa.PrimaryKeyConstraint("codice"),
+    )
+    # Ricerca per prefisso: B-tree con text_pattern_ops, usabili da LIKE 'abc%'
+    # con qualunque collation
+    op.execute(
+        "CREATE INDEX ix_azienda_ragione_sociale_prefix "
+        "ON azienda (lower(ragione_sociale) text_pattern_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_azienda_codice_prefix ON azienda (upper(codice) text_pattern_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_azienda_partita_iva_prefix "
+        "ON azienda (partita_iva text_pattern_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_azienda_citta_prefix ON azienda (lower(citta) text_pattern_ops)"
+    )
+
+    # Ricerca per sottostringa (LIKE '%abc%'): GIN trigram. Se l'estensione
+    # non è disponibile la ricerca funziona comunque, ma con una scansione
+    if _has_pg_trgm():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRGM_COLUMNS:
+            op.execute(
+                f"CREATE INDEX ix_azienda_{column}_trgm "
+                f"ON azienda USING gin (lower({column}) gin_trgm_ops)"
+            )
+
+    # Qualunque modifica svuota le cache di ricerca dei worker
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_aziende_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('aziende_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER azienda_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON azienda
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_aziende_changed()
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("azienda")
+    op.execute("DROP FUNCTION notify_aziende_changed()")
@@ -0,0 +1,70 @@
+"""Add NOTIFY trigger on versions
+
+Revision ID: 8d3f61a0c7b2
+Revises: 5b7e0c2d9f41
+Create Date: 2026-10-17 11:04:09.552810
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8d3f61a0c7b2"
+down_revision = "5b7e0c2d9f41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # La tabella è stata creata fuori dalle migrazioni sui database esistenti
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS versions (
+            id serial PRIMARY KEY,
+            giorno date NOT NULL,
+            versione varchar(50) NOT NULL,
+            CONSTRAINT versions_giorno_key UNIQUE (giorno)
+        )
+        """
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_versions_giorno ON versions (giorno)")
+    # Ogni modifica segnala il giorno su versions_changed, così le cache
+    # dei worker vengono invalidate; TRUNCATE le svuota del tutto
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_versions_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('versions_changed', '');
+                RETURN NULL;
+            END IF;
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM pg_notify('versions_changed', OLD.giorno::text);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM pg_notify('versions_changed', NEW.giorno::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER versions_notify
+        AFTER INSERT OR UPDATE OR DELETE ON versions
+        FOR EACH ROW EXECUTE FUNCTION notify_versions_changed()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER versions_notify_truncate
+        AFTER TRUNCATE ON versions
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_versions_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER versions_notify_truncate ON versions")
+    op.execute("DROP TRIGGER versions_notify ON versions")
+    op.execute("DROP FUNCTION notify_versions_changed()")
@@ -0,0 +1,53 @@
+"""Notify user changes to the authenticated-user caches
+
+Revision ID: 9b4e2f7a1c35
+Revises: 6f2c8d4e1a93
+Create Date: 2026-10-17 17:05:48.326174
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9b4e2f7a1c35"
+down_revision = "6f2c8d4e1a93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Il payload è l'id dell'utente: gli altri worker scartano solo quello.
+    # Dopo un TRUNCATE il payload è vuoto e si scarta tutto
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_users_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('users_changed', '');
+            ELSE
+                PERFORM pg_notify('users_changed', OLD.id::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_notify
+        AFTER UPDATE OR DELETE ON "user"
+        FOR EACH ROW EXECUTE FUNCTION notify_users_changed()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_notify_truncate
+        AFTER TRUNCATE ON "user"
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_users_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER user_notify_truncate ON "user"')
+    op.execute('DROP TRIGGER user_notify ON "user"')
+    op.execute("DROP FUNCTION notify_users_changed()")
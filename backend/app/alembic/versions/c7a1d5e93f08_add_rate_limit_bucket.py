@@ -0,0 +1,63 @@
+"""Add shared token buckets for login throttling
+
+Revision ID: c7a1d5e93f08
+Revises: 9b4e2f7a1c35
+Create Date: 2026-10-17 18:12:09.551837
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c7a1d5e93f08"
+down_revision = "9b4e2f7a1c35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # UNLOGGED: niente WAL; dopo un crash i bucket ripartono pieni
+    op.execute(
+        """
+        CREATE UNLOGGED TABLE rate_limit_bucket (
+            key varchar PRIMARY KEY,
+            tokens double precision NOT NULL,
+            updated_at timestamptz NOT NULL
+        )
+        """
+    )
+    # Un solo round trip per tentativo; restituisce 0 se la richiesta passa,
+    # altrimenti i secondi da attendere
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION rate_limit_take(
+            p_key varchar, p_capacity double precision, p_rate double precision
+        ) RETURNS double precision AS $$
+        DECLARE
+            v_tokens double precision;
+        BEGIN
+            INSERT INTO rate_limit_bucket AS b (key, tokens, updated_at)
+            VALUES (p_key, p_capacity, clock_timestamp())
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = least(
+                    p_capacity,
+                    b.tokens
+                    + extract(epoch FROM clock_timestamp() - b.updated_at) * p_rate
+                ),
+                updated_at = clock_timestamp()
+            RETURNING tokens INTO v_tokens;
+            IF v_tokens >= 1 THEN
+                UPDATE rate_limit_bucket SET tokens = v_tokens - 1 WHERE key = p_key;
+                RETURN 0;
+            END IF;
+            RETURN (1 - v_tokens) / p_rate;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        "DROP FUNCTION rate_limit_take(varchar, double precision, double precision)"
+    )
+    op.execute("DROP TABLE rate_limit_bucket")
@@ -1,17 +1,22 @@
-from collections.abc import Generator
+import ipaddress
+import math
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import async_engine, async_read_engine, engine, read_engine
 from app.models import TokenPayload, User
+from app.services.rate_limit import RateLimited, login_throttle
+from app.services.user_cache import UserPrincipal, user_cache
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -23,11 +28,33 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Expired attributes would be reloaded with implicit IO, which an
+    # AsyncSession can't do: keep them loaded after commit
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+def get_read_db() -> Generator[Session, None, None]:
+    with Session(read_engine) as session:
+        yield session
+
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+# Read-only routes: served by the replica when POSTGRES_REPLICA_DSN is set,
+# so they may lag slightly behind writes made through SessionDep
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def _token_subject(token: str) -> str | None:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -38,7 +65,10 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+    return token_data.sub
+
+
+def _check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,12 +76,106 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    return _check_user(session.get(User, _token_subject(token)))
+
+
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    return _check_user(await session.get(User, _token_subject(token)))
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
+# For `async def` routes: the user is bound to their AsyncSession
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
+
+
+async def get_current_principal(token: TokenDep) -> UserPrincipal:
+    """Who is making the request, from the user cache when possible.
 
+    Cheaper than CurrentUser for routes that only check the id or the role:
+    no query on cache hits, and no ORM object to keep around.
+    """
+    user_id = _token_subject(token)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    principal = user_cache.get(user_id)
+    if principal is None:
+        generation = user_cache.generation
+        async with AsyncSession(async_engine) as session:
+            user = _check_user(await session.get(User, user_id))
+        principal = UserPrincipal.from_user(user)
+        user_cache.put(user_id, principal, generation=generation)
+    return principal
+
+
+CurrentPrincipal = Annotated[UserPrincipal, Depends(get_current_principal)]
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+
+def get_current_active_superuser(current_user: CurrentPrincipal) -> UserPrincipal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    trusted = [entry for entry in settings.FORWARDED_ALLOW_IPS if entry]
+    if "*" in trusted:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        # Not an IP (e.g. a unix socket): only an exact match is trusted
+        return host in trusted
+    for entry in trusted:
+        try:
+            if address in ipaddress.ip_network(entry, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def client_ip(request: Request) -> str | None:
+    """Client address, read from X-Forwarded-For only past trusted proxies.
+
+    The header is walked from the right: the first hop that is not a trusted
+    proxy is the client. Without trusted proxies the header is ignored, so
+    clients can't pick their own address.
+    """
+    ip = request.client.host if request.client else None
+    if ip is None or not _is_trusted_proxy(ip):
+        return ip
+    forwarded = request.headers.get("x-forwarded-for", "")
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        ip = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return ip
+
+
+def _throttle(request: Request, username: str) -> None:
+    if not settings.LOGIN_RATE_LIMIT_ENABLED:
+        return
+    ip = client_ip(request)
+    try:
+        login_throttle.check(ip=ip, username=username)
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+
+def throttle_login(
+    request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> None:
+    """Reject login floods before any user lookup or password hashing."""
+    _throttle(request, form_data.username)
+
+
+def throttle_password_recovery(request: Request, email: str) -> None:
+    _throttle(request, email)
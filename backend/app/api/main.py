@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import items, login, private, users, utils, versions
+from app.api.routes import aziende, items, login, private, users, utils, versions
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -9,6 +9,7 @@ api_router.include_router(users.router)
 api_router.include_router(utils.router)
 api_router.include_router(items.router)
 api_router.include_router(versions.router)
+api_router.include_router(aziende.router)
 
 
 if settings.ENVIRONMENT == "local":
@@ -0,0 +1,93 @@
+import base64
+import binascii
+import uuid
+from collections.abc import Sequence
+from typing import Any, Literal
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+# "exact": count(*) come prima; "estimated": stima dalle statistiche di
+# PostgreSQL (pg_class.reltuples); "none": nessun conteggio
+CountMode = Literal["exact", "estimated", "none"]
+
+
+def encode_cursor(last_id: uuid.UUID) -> str:
+    """Cursore opaco per la pagina che segue la riga con id `last_id`."""
+    return base64.urlsafe_b64encode(last_id.bytes).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        return uuid.UUID(bytes=base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def next_cursor(rows: Sequence[Any], limit: int) -> str | None:
+    # Una pagina incompleta è l'ultima
+    if not rows or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].id)
+
+
+_RELTUPLES_SQL = text(
+    "SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)"
+)
+
+
+def _estimate(reltuples: float | None) -> int | None:
+    # -1 (o nessuna riga): la tabella non è mai stata analizzata
+    if reltuples is None or reltuples < 0:
+        return None
+    return int(reltuples)
+
+
+def _count_statement(statement: SelectOfScalar[Any]) -> SelectOfScalar[int]:
+    return select(func.count()).select_from(statement.subquery())
+
+
+def count_rows(
+    session: Session,
+    statement: SelectOfScalar[Any],
+    mode: CountMode,
+    *,
+    table: type[SQLModel] | None = None,
+) -> int | None:
+    """Conteggio delle righe di `statement` secondo `mode`.
+
+    La stima da pg_class.reltuples (aggiornata da ANALYZE/autovacuum) vale
+    solo per l'intera tabella (`table`); per le query filtrate, o se la
+    tabella non ha statistiche, si conta esattamente.
+    """
+    if mode == "none":
+        return None
+    if mode == "estimated" and table is not None:
+        params = {"name": table.__tablename__}
+        estimate = _estimate(session.execute(_RELTUPLES_SQL, params).scalar())
+        if estimate is not None:
+            return estimate
+    return session.exec(_count_statement(statement)).one()
+
+
+async def count_rows_async(
+    session: AsyncSession,
+    statement: SelectOfScalar[Any],
+    mode: CountMode,
+    *,
+    table: type[SQLModel] | None = None,
+) -> int | None:
+    """Come `count_rows`, per le route asincrone."""
+    if mode == "none":
+        return None
+    if mode == "estimated" and table is not None:
+        params = {"name": table.__tablename__}
+        result = await session.execute(_RELTUPLES_SQL, params)
+        estimate = _estimate(result.scalar())
+        if estimate is not None:
+            return estimate
+    return (await session.exec(_count_statement(statement))).one()
@@ -0,0 +1,126 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import col, func, select
+
+from app import crud
+from app.api.deps import (
+    SessionDep,
+    get_current_active_superuser,
+    get_current_principal,
+)
+from app.models import (
+    Azienda,
+    AziendaCreate,
+    AziendaPublic,
+    AziendaUpdate,
+    AziendePublic,
+    Message,
+)
+from app.services.aziende_cache import aziende_search_cache, search_key
+
+# Anagrafica condivisa: la lettura è per tutti gli utenti autenticati,
+# le modifiche solo per i superuser
+router = APIRouter(
+    prefix="/aziende", tags=["aziende"], dependencies=[Depends(get_current_principal)]
+)
+
+
+@router.get("/", response_model=AziendePublic)
+def read_aziende(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+    """
+    Retrieve aziende, ordered by codice.
+    """
+    count_statement = select(func.count()).select_from(Azienda)
+    count = session.exec(count_statement).one()
+    statement = select(Azienda).order_by(col(Azienda.codice)).offset(skip).limit(limit)
+    aziende = session.exec(statement).all()
+    return AziendePublic(data=aziende, count=count)
+
+
+@router.get("/search", response_model=list[AziendaPublic])
+def search_aziende(
+    session: SessionDep,
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=50),
+) -> Any:
+    """
+    Typeahead search over ragione sociale, codice, partita IVA and città.
+    """
+    key = search_key(q, limit)
+    cached = aziende_search_cache.get(key)
+    if cached is not None:
+        return cached
+    generation = aziende_search_cache.generation
+    results = [
+        AziendaPublic.model_validate(azienda)
+        for azienda in crud.search_aziende(session=session, q=q, limit=limit)
+    ]
+    aziende_search_cache.put(key, results, generation=generation)
+    return results
+
+
+@router.get("/{codice}", response_model=AziendaPublic)
+def read_azienda(session: SessionDep, codice: str) -> Any:
+    """
+    Get azienda by codice.
+    """
+    azienda = session.get(Azienda, codice)
+    if not azienda:
+        raise HTTPException(status_code=404, detail="Azienda not found")
+    return azienda
+
+
+@router.post(
+    "/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=AziendaPublic,
+)
+def create_azienda(*, session: SessionDep, azienda_in: AziendaCreate) -> Any:
+    """
+    Create new azienda.
+    """
+    if session.get(Azienda, azienda_in.codice):
+        raise HTTPException(
+            status_code=400, detail="An azienda with this codice already exists"
+        )
+    azienda = crud.create_azienda(session=session, azienda_in=azienda_in)
+    # Il trigger avvisa anche gli altri worker; qui si svuota subito
+    aziende_search_cache.invalidate()
+    return azienda
+
+
+@router.put(
+    "/{codice}",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=AziendaPublic,
+)
+def update_azienda(
+    *, session: SessionDep, codice: str, azienda_in: AziendaUpdate
+) -> Any:
+    """
+    Update an azienda.
+    """
+    azienda = session.get(Azienda, codice)
+    if not azienda:
+        raise HTTPException(status_code=404, detail="Azienda not found")
+    azienda.sqlmodel_update(azienda_in.model_dump(exclude_unset=True))
+    session.add(azienda)
+    session.commit()
+    session.refresh(azienda)
+    aziende_search_cache.invalidate()
+    return azienda
+
+
+@router.delete("/{codice}", dependencies=[Depends(get_current_active_superuser)])
+def delete_azienda(session: SessionDep, codice: str) -> Message:
+    """
+    Delete an azienda.
+    """
+    azienda = session.get(Azienda, codice)
+    if not azienda:
+        raise HTTPException(status_code=404, detail="Azienda not found")
+    session.delete(azienda)
+    session.commit()
+    aziende_search_cache.invalidate()
+    return Message(message="Azienda deleted successfully")
@@ -1,17 +1,22 @@
 import uuid
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlmodel import col, delete, select
+from starlette.concurrency import run_in_threadpool
 
 from app import crud
 from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    CurrentPrincipal,
     CurrentUser,
+    ReadSessionDep,
     SessionDep,
     get_current_active_superuser,
 )
+from app.api.pagination import CountMode, count_rows, decode_cursor, next_cursor
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
 from app.models import (
     Item,
     Message,
@@ -20,11 +25,20 @@ from app.models import (
     UserCreate,
     UserPublic,
     UserRegister,
+    UsersImportReport,
     UsersPublic,
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.services import user_import
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import user_cache
+from app.utils import (
+    generate_new_account_email,
+    generate_new_account_emails,
+    send_email,
+    send_emails,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -34,40 +48,53 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: CountMode = "exact",
+) -> Any:
     """
-    Retrieve users.
+    Retrieve users, ordered by id.
+
+    Pass the `next_cursor` of a page as `cursor` to get the next one without
+    scanning the skipped rows; `skip` is ignored when a cursor is given.
     """
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    total = count_rows(session, select(User), count, table=User)
 
-    statement = select(User).offset(skip).limit(limit)
+    statement = select(User).order_by(col(User.id)).limit(limit)
+    if cursor is not None:
+        statement = statement.where(col(User.id) > decode_cursor(cursor))
+    else:
+        statement = statement.offset(skip)
     users = session.exec(statement).all()
 
-    return UsersPublic(data=users, count=count)
+    return UsersPublic(data=users, count=total, next_cursor=next_cursor(users, limit))
 
 
 @router.post(
     "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
 )
-def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
+async def create_user(*, session: AsyncSessionDep, user_in: UserCreate) -> Any:
     """
     Create new user.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await crud.get_user_by_email_async(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
 
-    user = crud.create_user(session=session, user_create=user_in)
+    user = await crud.create_user_async(session=session, user_create=user_in)
     if settings.emails_enabled and user_in.email:
         email_data = generate_new_account_email(
             email_to=user_in.email, username=user_in.email, password=user_in.password
         )
-        send_email(
+        await run_in_threadpool(
+            send_email,
             email_to=user_in.email,
             subject=email_data.subject,
             html_content=email_data.html_content,
@@ -75,6 +102,50 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
     return user
 
 
+@router.post(
+    "/import",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UsersImportReport,
+)
+async def import_users(
+    session: AsyncSessionDep, file: UploadFile = File(...), notify: bool = False
+) -> Any:
+    """
+    Create many users from a CSV (with an email,password,full_name header)
+    or JSON lines file.
+
+    Emails already registered or repeated in the file are skipped; the report
+    has one entry per row. With `notify`, new users get the new-account email.
+    """
+    try:
+        fmt = user_import.detect_format(file.filename, file.content_type)
+        rows = list(user_import.parse_rows(await file.read(), fmt))
+    except user_import.UserImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(rows) > settings.USERS_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many rows: at most {settings.USERS_IMPORT_MAX_ROWS} per file",
+        )
+
+    report, created = await user_import.import_users(
+        session, rows, batch_size=settings.USERS_IMPORT_BATCH_SIZE
+    )
+    if notify and created and settings.emails_enabled:
+        await run_in_threadpool(_send_new_account_emails, created)
+    return report
+
+
+def _send_new_account_emails(created: list[user_import.CreatedUser]) -> None:
+    # Rendering the templates is CPU work: it runs in the threadpool too
+    emails = generate_new_account_emails(
+        (user.email, user.email, user.password) for user in created
+    )
+    send_emails(
+        [(user.email, data) for user, data in zip(created, emails, strict=True)]
+    )
+
+
 @router.patch("/me", response_model=UserPublic)
 def update_user_me(
     *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
@@ -94,31 +165,34 @@ def update_user_me(
     session.add(current_user)
     session.commit()
     session.refresh(current_user)
+    user_cache.invalidate(current_user.id)
     return current_user
 
 
 @router.patch("/me/password", response_model=Message)
-def update_password_me(
-    *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
+async def update_password_me(
+    *, session: AsyncSessionDep, body: UpdatePassword, current_user: AsyncCurrentUser
 ) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await password_hasher.verify(
+        body.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(
             status_code=400, detail="New password cannot be the same as the current one"
         )
-    hashed_password = get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
+    current_user.hashed_password = await password_hasher.hash(body.new_password)
     session.add(current_user)
-    session.commit()
+    await session.commit()
+    user_cache.invalidate(current_user.id)
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(current_user: AsyncCurrentUser) -> Any:
     """
     Get current user.
     """
@@ -134,36 +208,38 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
+    user_id = current_user.id
     session.delete(current_user)
     session.commit()
+    user_cache.invalidate(user_id)
     return Message(message="User deleted successfully")
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDep, user_in: UserRegister) -> Any:
+async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await crud.get_user_by_email_async(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
+    user = await crud.create_user_async(session=session, user_create=user_create)
     return user
 
 
 @router.get("/{user_id}", response_model=UserPublic)
 def read_user_by_id(
-    user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
+    user_id: uuid.UUID, session: SessionDep, current_user: CurrentPrincipal
 ) -> Any:
     """
     Get a specific user by id.
     """
     user = session.get(User, user_id)
-    if user == current_user:
+    if user and user.id == current_user.id:
         return user
     if not current_user.is_superuser:
         raise HTTPException(
@@ -202,12 +278,13 @@ def update_user(
             )
 
     db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    user_cache.invalidate(user_id)
     return db_user
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
 def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: uuid.UUID
+    session: SessionDep, current_user: CurrentPrincipal, user_id: uuid.UUID
 ) -> Message:
     """
     Delete a user.
@@ -215,7 +292,7 @@ def delete_user(
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user.id == current_user.id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
@@ -223,4 +300,5 @@ def delete_user(
     session.exec(statement)  # type: ignore
     session.delete(user)
     session.commit()
+    user_cache.invalidate(user_id)
     return Message(message="User deleted successfully")
@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.models import Message, PasswordHasherStats, RateLimitStats
+from app.services.password_hasher import password_hasher
+from app.services.rate_limit import login_throttle
 from app.utils import generate_test_email, send_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
@@ -26,6 +28,30 @@ def test_email(email_to: EmailStr) -> Message:
     return Message(message="Test email sent")
 
 
+@router.get(
+    "/password-hasher/stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=PasswordHasherStats,
+)
+def read_password_hasher_stats() -> PasswordHasherStats:
+    """
+    Concurrency and queue depth of the password hashing pool.
+    """
+    return password_hasher.stats()
+
+
+@router.get(
+    "/rate-limit/stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=RateLimitStats,
+)
+def read_rate_limit_stats() -> RateLimitStats:
+    """
+    Allowed and rejected login / password recovery attempts.
+    """
+    return login_throttle.stats()
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
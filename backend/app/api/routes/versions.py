@@ -1,20 +1,67 @@
+import asyncio
+import hashlib
+import io
+import shutil
+import tempfile
 import uuid
-from typing import Any
-from sqlalchemy import text
-
-from fastapi import APIRouter, HTTPException, FastAPI, UploadFile, File
-from fastapi.responses import StreamingResponse
-
-from sqlmodel import func, select
-
-from app.api.deps import CurrentUser, SessionDep
-from app.models import BaseVersion, Versions, Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import IO, Any
+
+from fastapi import APIRouter, Depends, HTTPException, FastAPI, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from sqlmodel import Session, func, select
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.api.deps import (
+    AsyncReadSessionDep,
+    CurrentUser,
+    SessionDep,
+    get_current_active_superuser,
+    get_current_principal,
+)
+from app.core.config import settings
+from app.core.db import read_engine
+from app.core.executors import run_in_db_thread
+from app.models import BaseVersion, CsvCacheStats, CsvJobPublic, CsvRisultato, CsvRisultatoPublic, Versions, VersionsBulk, VersionsPublic, Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+
+from app.services.clienti_index import clienti_index
+from app.services.csv_batch import collect_batch_files, write_batch_zip
+from app.services.csv_columnar import should_use_columnar, stream_filtered_csv_columnar
+from app.services.compression import (
+    Compression,
+    DecompressingReader,
+    compress_chunks,
+    negotiate_encoding,
+    upload_compression,
+)
+from app.services.csv_filter import (
+    READ_CHUNK_SIZE,
+    ByteSource,
+    CsvFilterError,
+    stream_filtered_csv,
+)
+from app.services.csv_store import (
+    ResultSpool,
+    iter_stored_csv,
+    read_stored_totali,
+    try_store_filtered_csv,
+)
+from app.services.csv_tasks import (
+    FilteredCsvFile,
+    filter_csv_bytes,
+    filter_csv_file,
+    run_with_codici,
+)
+from app.services.jobs import CsvJobNotFound, csv_jobs
+from app.services.result_cache import csv_cache, iter_file, key_hasher
+from app.services.versions_cache import versions_cache
 
 from datetime import date
 
-import csv
-import io
-
 import logging
 from logging.config import dictConfig
 
@@ -49,141 +96,417 @@ router = APIRouter(prefix="/versions", tags=["days"])
 
 CODICI_VALIDI = {"2282"}
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _iter_versions_ndjson(start: date, end: date) -> Iterator[str]:
+    # Sessione propria: quella della dipendenza è già chiusa durante lo streaming
+    with Session(read_engine) as session:
+        righe: list[str] = []
+        for version in crud.iter_versions_range(session=session, start=start, end=end):
+            righe.append(version.model_dump_json() + "\n")
+            if len(righe) >= 1000:
+                yield "".join(righe)
+                righe.clear()
+        yield "".join(righe)
+
+
+@router.get("/", response_model=VersionsPublic)
+async def read_versions(
+    request: Request,
+    session: AsyncReadSessionDep,
+    start: date = Query(alias="from"),
+    end: date = Query(alias="to"),
+) -> Any:
+    """Versioni di tutti i giorni dell'intervallo, estremi inclusi."""
+    if start > end:
+        raise HTTPException(status_code=400, detail="Intervallo non valido: 'from' successivo a 'to'")
+    if (end - start).days >= settings.VERSIONS_RANGE_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Intervallo troppo lungo (massimo {settings.VERSIONS_RANGE_MAX_DAYS} giorni)",
+        )
+    ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    if ndjson or (end - start).days >= settings.VERSIONS_RANGE_JSON_MAX_DAYS:
+        return StreamingResponse(_iter_versions_ndjson(start, end), media_type=NDJSON_MEDIA_TYPE)
+    data = await crud.get_versions_range_async(session=session, start=start, end=end)
+    return VersionsPublic(data=data, count=len(data))
+
+
+@router.post("/bulk", response_model=VersionsPublic)
+async def read_versions_bulk(session: AsyncReadSessionDep, body: VersionsBulk) -> Any:
+    """Versioni dei giorni richiesti, nell'ordine della richiesta."""
+    if len(body.giorni) > settings.VERSIONS_BULK_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Troppi giorni richiesti (massimo {settings.VERSIONS_BULK_MAX_DAYS})",
+        )
+    data = await crud.get_versions_async(session=session, giorni=body.giorni)
+    return VersionsPublic(data=data, count=len(data))
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # Confronto debole come da RFC 9110: W/"x" corrisponde a "x"
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
 @router.get("/{giorno}", response_model=BaseVersion)
-def read_version(session: SessionDep, giorno:date) -> Any:
-    logger.info("sonoqui")
+async def read_version(
+    request: Request, response: Response, session: AsyncReadSessionDep, giorno: date
+) -> Any:
+    # La sessione apre una connessione solo alla prima query: con la
+    # versione in cache il database non viene toccato
+    cached = versions_cache.get(giorno)
+    if cached is None:
+        generation = versions_cache.generation
+        try:
+            version = (
+                await session.exec(select(Versions).where(Versions.giorno == giorno))
+            ).first()
+        except Exception as e:
+            logger.error("Errore in read_version: %s", str(e))
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        cached = versions_cache.put(
+            version or BaseVersion(giorno=giorno, versione="0"), generation=generation
+        )
+
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return cached.version
+
+
+@router.get(
+    "/{giorno}/totali",
+    response_model=CsvRisultatoPublic,
+    dependencies=[Depends(get_current_principal)],
+)
+def read_csv_totali(session: SessionDep, giorno: date) -> Any:
+    """Totale, righe e subtotali del CSV filtrato salvato per il giorno."""
+    totali = read_stored_totali(session, giorno)
+    if totali is None:
+        raise HTTPException(status_code=404, detail="Nessun risultato salvato per il giorno")
+    return totali
+
+
+@router.get("/{giorno}/file", dependencies=[Depends(get_current_principal)])
+def download_csv(
+    request: Request, session: SessionDep, giorno: date, subtotali: bool = False
+) -> Any:
+    """CSV filtrato salvato per il giorno, senza ricaricare il file sorgente."""
+    risultato = session.get(CsvRisultato, giorno)
+    if risultato is None:
+        raise HTTPException(status_code=404, detail="Nessun risultato salvato per il giorno")
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    return _csv_stream(
+        iter_stored_csv(risultato, subtotali=subtotali),
+        encoding,
+        _csv_headers(risultato.filename, encoding),
+    )
+
+
+def _csv_headers(filename: str, encoding: Compression | None) -> dict[str, str]:
+    headers = {
+        "Content-Disposition": f"attachment; filename=filtered_{filename}",
+        "Vary": "Accept-Encoding",
+    }
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def _csv_stream(
+    chunks: Iterable[str | bytes],
+    encoding: Compression | None,
+    headers: dict[str, str],
+    background: BackgroundTask | None = None,
+) -> StreamingResponse:
+    if encoding is not None:
+        chunks = compress_chunks(chunks, encoding)
+    return StreamingResponse(
+        chunks, media_type="text/csv", headers=headers, background=background
+    )
+
+
+def _spool_upload(upload: IO[bytes], digest: "hashlib._Hash | None") -> IO[bytes]:
+    # L'UploadFile viene chiuso appena l'endpoint restituisce la risposta,
+    # prima che il corpo sia inviato: lo streaming legge da una copia propria.
+    # Nella stessa lettura si calcola la chiave della cache
+    spool = tempfile.TemporaryFile()
     try:
-        version = session.exec(
-            select(Versions).where(Versions.giorno == giorno)
-        ).first()
-        if not version:
-            return BaseVersion(giorno=giorno, versione="0")
-        return version
-    except Exception as e:
-        print(f"Errore in read_version: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+        while chunk := upload.read(READ_CHUNK_SIZE):
+            if digest is not None:
+                digest.update(chunk)
+            spool.write(chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _closing_chunks(chunks: Iterable[str], source: IO[bytes]) -> Iterator[str]:
+    """Restituisce i blocchi invariati e chiude `source` a fine streaming."""
+    with source:
+        yield from chunks
 
 
 @router.post("/create/{giorno}")
-async def upload_csv(session: SessionDep, giorno: date, file: UploadFile = File(...)) -> Any:
+async def upload_csv(
+    request: Request,
+    giorno: date,
+    file: UploadFile = File(...),
+    subtotali: bool = False,
+) -> Any:
     logger.info("Inizio elaborazione file %s", file.filename)
 
     try:
-        # Verifica estensione file
-        if not file.filename.lower().endswith(".csv"):
-            raise HTTPException(status_code=400, detail="File non valido: richiesto formato CSV")
-
-        # Lettura e decodifica contenuto
-        content = await file.read()
-        try:
-            decoded_content = content.decode("utf-8")
-        except UnicodeDecodeError:
-            raise HTTPException(status_code=400, detail="Encoding non supportato (richiesto UTF-8)")
-
-        # Analisi struttura file
-        reader = csv.DictReader(io.StringIO(decoded_content), delimiter=";")
-        if not reader.fieldnames or "Codice committente" not in reader.fieldnames:
-            raise HTTPException(status_code=400,
-                                detail="Struttura file non valida: colonna 'Codice committente' mancante")
-
-        # Verifica che esista la colonna Importo totale
-        importo_col = None
-        for col in ["Importo totale", "Importo Totale", "IMPORTO TOTALE", "Totale"]:
-            if col in reader.fieldnames:
-                importo_col = col
-                break
-
-        if not importo_col:
-            raise HTTPException(status_code=400,
-                                detail="Struttura file non valida: colonna 'Importo totale' mancante")
-
-        # Estrazione codici unici
-        codici_file = {
-            str(row.get("Codice committente", "")).strip().upper()
-            for row in csv.DictReader(io.StringIO(decoded_content), delimiter=";")
-            if str(row.get("Codice committente", "")).strip()
-        }
-
-        # Verifica codici nel database
-        if not codici_file:
-            raise HTTPException(status_code=400, detail="Nessun codice committente trovato nel file")
-
-        # MODIFICA: Utilizza una lista di parametri invece di un singolo parametro per la lista
-        if len(codici_file) == 1:
-            # Caso speciale per un solo elemento
-            codici_validi = {
-                str(codice[0]) for codice in
-                session.execute(
-                    text("SELECT codice FROM clienti WHERE codice = :codice"),
-                    {"codice": next(iter(codici_file))}
-                ).fetchall()
-            }
-        else:
-            # Caso generale per più elementi
-            # Creiamo una lista di parametri (:codice0, :codice1, ecc.)
-            params = {f"codice{i}": codice for i, codice in enumerate(codici_file)}
-            placeholders = ", ".join(f":codice{i}" for i in range(len(codici_file)))
-            query = text(f"SELECT codice FROM clienti WHERE codice IN ({placeholders})")
-
-            codici_validi = {
-                str(codice[0]) for codice in
-                session.execute(query, params).fetchall()
-            }
-
-        # Filtraggio righe e calcolo totale
-        output_stream = io.StringIO()
-        writer = csv.DictWriter(output_stream, fieldnames=reader.fieldnames, delimiter=";")
-        writer.writeheader()
-
-        rows_processed = 0
-        totale = 0.0
-
-        # Prima passata: filtra le righe e calcola il totale
-        filtered_rows = []
-        for row in csv.DictReader(io.StringIO(decoded_content), delimiter=";"):
-            codice = str(row.get("Codice committente", "")).strip().upper()
-            if codice and codice in codici_validi:
-                filtered_rows.append(row)
-                try:
-                    # Gestione più accurata dei formati numerici
-                    importo_str = row[importo_col].strip()
-                    # Rimuove eventuali simboli di valuta e spazi
-                    importo_str = importo_str.replace("€", "").replace(" ", "")
-                    # Sostituisce la virgola con il punto se presente
-                    if "," in importo_str:
-                        importo_str = importo_str.replace(".", "").replace(",", ".")
-                    # Converte in float
-                    importo = float(importo_str)
-                    totale += importo
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Importo non valido nella riga: {row} - Errore: {str(e)}")
-                    continue
-                rows_processed += 1
-
-        if rows_processed == 0:
-            raise HTTPException(status_code=400, detail="Nessun codice committente valido trovato")
-
-        # Seconda passata: scrive le righe filtrate
-        for row in filtered_rows:
-            writer.writerow(row)
-
-        # Aggiunge la riga del totale
-        total_row = {col: "" for col in reader.fieldnames}
-        # Formatta il totale con 2 decimali e virgola come separatore decimale
-        total_row[importo_col] = "{:,.2f}".format(totale).replace(",", "X").replace(".", ",").replace("X", ".")
-        total_row["Codice committente"] = "TOTALE"
-        writer.writerow(total_row)
-
-        # Preparazione risposta
-        output_stream.seek(0)
-        return StreamingResponse(
-            output_stream,
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=filtered_{file.filename}"}
+        # Verifica estensione file: CSV semplice oppure compresso gzip/zstd
+        filename = file.filename or ""
+        compression = upload_compression(filename)
+        if compression is not None:
+            filename = filename.rsplit(".", 1)[0]
+
+        # Risposta compressa se il client lo accetta
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        headers = _csv_headers(filename, encoding)
+
+        def respond(
+            chunks: Iterable[str | bytes], background: BackgroundTask | None = None
+        ) -> StreamingResponse:
+            return _csv_stream(chunks, encoding, headers, background)
+
+        codici, fingerprint = await run_in_db_thread(clienti_index.snapshot)
+
+        # File piccoli e medi non compressi si filtrano in memoria, gli altri
+        # da una copia su disco; la chiave della cache si calcola nella stessa
+        # lettura dell'upload
+        in_memory = (
+            compression is None
+            and file.size is not None
+            and file.size <= settings.CSV_PROCESS_POOL_MAX_BYTES
         )
-
+        digest = None
+        if csv_cache.enabled:
+            digest = key_hasher(fingerprint, subtotali=subtotali)
+        data = b""
+        spool: IO[bytes] | None = None
+        if in_memory:
+            data = await file.read()
+            if digest is not None:
+                await run_in_threadpool(digest.update, data)
+        else:
+            spool = await run_in_threadpool(_spool_upload, file.file, digest)
+
+        # Stesso file e stessi codici clienti: si riusa il risultato già calcolato
+        key = None
+        if digest is not None:
+            key = digest.hexdigest()
+            cached = await run_in_threadpool(csv_cache.open, key)
+            if cached is not None:
+                logger.info("Risultato in cache per il file %s", file.filename)
+                if spool is not None:
+                    spool.close()
+                response_file, store_file = cached
+                # Il file può venire da un upload per un altro giorno
+                store = BackgroundTask(
+                    try_store_filtered_csv, giorno, filename, store_file
+                )
+                return respond(iter_file(response_file), store)
+
+        # In memoria: filtro completo in un processo separato, così il lavoro
+        # CPU non pesa sull'event loop né sul GIL
+        if spool is None:
+            result = await run_with_codici(
+                filter_csv_bytes,
+                data,
+                codici=codici,
+                fingerprint=fingerprint,
+                subtotali=subtotali,
+            )
+            if key is not None:
+                await run_in_threadpool(csv_cache.put, key, result.content)
+            # Salvataggio del risultato a risposta inviata
+            store = BackgroundTask(
+                try_store_filtered_csv, giorno, filename, io.BytesIO(result.content)
+            )
+            if encoding is None:
+                return Response(
+                    result.content,
+                    media_type="text/csv",
+                    headers=headers,
+                    background=store,
+                )
+            return respond([result.content], store)
+
+        # File grandi o compressi: validazione intestazione ed elaborazione
+        # fino al primo blocco di output; il resto viene filtrato (e
+        # decompresso) mentre la risposta è in invio
+        try:
+            source: ByteSource = spool
+            if compression is not None:
+                source = DecompressingReader(spool, compression)
+            stream = stream_filtered_csv
+            if should_use_columnar(file.size):
+                stream = stream_filtered_csv_columnar
+            # Con subtotali=true prima del TOTALE c'è una riga per ogni
+            # committente
+            chunks = await run_in_threadpool(
+                stream, source, codici.__and__, subtotali=subtotali
+            )
+        except BaseException:
+            spool.close()
+            raise
+        chunks = _closing_chunks(chunks, spool)
+        if key is not None:
+            chunks = csv_cache.tee(key, chunks)
+
+        # Salvataggio del risultato a risposta inviata, dallo spool
+        stored = ResultSpool(giorno, filename)
+        return respond(stored.tee(chunks), BackgroundTask(stored.store))
+
+    except CsvFilterError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
     except HTTPException:
         raise
     except Exception as e:
         logger.error("Errore durante l'elaborazione: %s", str(e))
-        raise HTTPException(status_code=500, detail="Errore interno durante l'elaborazione")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Errore interno durante l'elaborazione")
+
+
+@router.post("/batch")
+async def upload_csv_batch(
+    files: list[UploadFile] = File(...), subtotali: bool = False
+) -> Any:
+    """Filtra più giorni in parallelo; restituisce uno zip con il riepilogo."""
+    logger.info("Inizio elaborazione batch di %d file", len(files))
+
+    workdir = Path(tempfile.mkdtemp(prefix="csv-batch-"))
+    try:
+        batch = await run_in_threadpool(
+            collect_batch_files,
+            [(file.filename or "", file.file) for file in files],
+            workdir,
+        )
+        # Un'unica lettura dei codici clienti per tutti i giorni del batch
+        codici, fingerprint = await run_in_db_thread(clienti_index.snapshot)
+        outcomes = await asyncio.gather(
+            *(
+                run_with_codici(
+                    filter_csv_file,
+                    item.path,
+                    item.output_path,
+                    codici=codici,
+                    fingerprint=fingerprint,
+                    compression=item.compression,
+                    subtotali=subtotali,
+                )
+                for item in batch
+            ),
+            return_exceptions=True,
+        )
+        results: list[FilteredCsvFile | str] = []
+        for item, outcome in zip(batch, outcomes, strict=True):
+            if isinstance(outcome, CsvFilterError):
+                results.append(outcome.detail)
+            elif isinstance(outcome, BaseException):
+                logger.error("Errore durante l'elaborazione di %s: %s", item.filename, str(outcome))
+                results.append("Errore interno durante l'elaborazione")
+            else:
+                results.append(outcome)
+
+        zip_path = workdir / "filtrati.zip"
+        await run_in_threadpool(write_batch_zip, batch, results, zip_path)
+    except CsvFilterError as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=e.detail)
+    except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        logger.error("Errore durante l'elaborazione del batch: %s", str(e))
+        raise HTTPException(status_code=500, detail="Errore interno durante l'elaborazione")
+
+    def finish() -> None:
+        # Salvataggio dei giorni elaborati, poi pulizia dei file temporanei
+        for item, result in zip(batch, results, strict=True):
+            if isinstance(result, FilteredCsvFile):
+                try_store_filtered_csv(
+                    item.giorno, item.csv_name, item.output_path.open("rb")
+                )
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return FileResponse(
+        zip_path,
+        media_type="application/zip",
+        filename="filtrati.zip",
+        background=BackgroundTask(finish),
+    )
+
+
+@router.get(
+    "/cache/stats",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=CsvCacheStats,
+)
+def read_csv_cache_stats() -> Any:
+    """Contatori di hit/miss e occupazione della cache dei risultati CSV."""
+    return csv_cache.stats()
+
+
+@router.post("/jobs/{giorno}", status_code=202, response_model=CsvJobPublic)
+async def create_csv_job(
+    giorno: date, file: UploadFile = File(...), subtotali: bool = False
+) -> Any:
+    logger.info("Job in coda per il file %s", file.filename)
+
+    # CSV semplice oppure compresso gzip/zstd, come per upload_csv
+    filename = file.filename or ""
+    try:
+        compression = upload_compression(filename)
+    except CsvFilterError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
+
+    try:
+        # Spool su disco e lettura dei codici fuori dall'event loop
+        codici = await run_in_db_thread(lambda: clienti_index.codici)
+        return await csv_jobs.submit(
+            giorno=giorno,
+            filename=filename,
+            upload=file.file,
+            codici=codici,
+            compression=compression,
+            subtotali=subtotali,
+        )
+    except Exception as e:
+        logger.error("Errore durante la creazione del job: %s", str(e))
+        raise HTTPException(status_code=500, detail="Errore interno durante l'elaborazione")
+
+
+@router.get("/jobs/{job_id}", response_model=CsvJobPublic)
+def read_csv_job(job_id: uuid.UUID) -> Any:
+    try:
+        return csv_jobs.get(job_id)
+    except CsvJobNotFound:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+
+
+@router.get("/jobs/{job_id}/result")
+def download_csv_job(job_id: uuid.UUID) -> Any:
+    try:
+        job = csv_jobs.get(job_id)
+    except CsvJobNotFound:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    if job.status == "failed":
+        raise HTTPException(status_code=400, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail="Elaborazione non ancora completata")
+    return FileResponse(
+        csv_jobs.result_path(job_id),
+        media_type="text/csv",
+        filename=f"filtered_{job.filename}",
+    )
@@ -1,4 +1,6 @@
+import os
 import secrets
+import tempfile
 import warnings
 from typing import Annotated, Any, Literal
 
@@ -69,6 +71,20 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Pool di ciascun engine (sincrono, asincrono e delle eventuali repliche),
+    # per ogni worker: con N worker il database riceve fino a
+    # N * engine * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connessioni
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    # Le connessioni più vecchie vengono riaperte (secondi; -1 mai)
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Replica in sola lettura per le route che non scrivono; se assente si
+    # usa il database principale. Il ritardo della replica deve restare ben
+    # sotto VERSIONS_CACHE_TTL_SECONDS
+    POSTGRES_REPLICA_DSN: PostgresDsn | None = None
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -85,12 +101,100 @@ class Settings(BaseSettings):
         return self
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
+    # Bytecode dei template delle email compilati; None lo disabilita
+    EMAIL_TEMPLATES_CACHE_DIR: str | None = os.path.join(
+        tempfile.gettempdir(), "email-templates-cache"
+    )
+    # Coda delle email: EMAIL_OUTBOX_WORKERS thread per processo consegnano i
+    # messaggi riusando le connessioni SMTP; dopo un errore si riprova con
+    # attesa crescente (BACKOFF_SECONDS, poi il doppio, ...)
+    EMAIL_OUTBOX_WORKERS: int = 2
+    EMAIL_OUTBOX_BATCH_SIZE: int = 20
+    EMAIL_OUTBOX_POLL_SECONDS: float = 30
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 8
+    EMAIL_OUTBOX_BACKOFF_SECONDS: float = 30
+    # Un messaggio preso in carico da un worker morto torna in coda dopo.
+    # Il lease riparte prima di ogni invio: deve coprire la consegna di un
+    # solo messaggio (connessione, login e invio, SMTP_TIMEOUT_SECONDS l'uno)
+    EMAIL_OUTBOX_LEASE_SECONDS: float = 300
+    SMTP_TIMEOUT_SECONDS: float = 30
+    # Le connessioni inattive da più di così vengono chiuse: molti server le
+    # chiudono comunque dopo qualche minuto
+    SMTP_IDLE_SECONDS: float = 60
 
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
         return bool(self.SMTP_HOST and self.EMAILS_FROM_EMAIL)
 
+    # Indice in memoria dei codici clienti usato dal filtro CSV
+    CLIENTI_INDEX_REFRESH_SECONDS: int = 300
+    CLIENTI_INDEX_LISTEN: bool = True
+    # Cache delle versioni per giorno, invalidata via NOTIFY
+    VERSIONS_CACHE_TTL_SECONDS: int = 60
+    VERSIONS_CACHE_MAX_ENTRIES: int = 1024
+    VERSIONS_CACHE_LISTEN: bool = True
+    # Cache delle ricerche di /aziende/search, invalidata via NOTIFY
+    AZIENDE_SEARCH_CACHE_TTL_SECONDS: int = 300
+    AZIENDE_SEARCH_CACHE_MAX_ENTRIES: int = 2048
+    AZIENDE_SEARCH_CACHE_LISTEN: bool = True
+    # Cache dell'utente autenticato: disattivazioni e cambi di ruolo fatti da
+    # un altro worker valgono al più dopo USER_CACHE_TTL_SECONDS se la
+    # NOTIFY non arriva
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_MAX_ENTRIES: int = 4096
+    USER_CACHE_LISTEN: bool = True
+    # Sotto questa lunghezza si cerca solo per prefisso
+    AZIENDE_SEARCH_MIN_SUBSTRING: int = 3
+    # Intervalli più lunghi di così vengono restituiti in NDJSON, in streaming
+    VERSIONS_RANGE_JSON_MAX_DAYS: int = 366
+    # Limite per qualunque intervallo, anche in NDJSON
+    VERSIONS_RANGE_MAX_DAYS: int = 100 * 366
+    VERSIONS_BULK_MAX_DAYS: int = 1000
+    # Oltre questa dimensione l'upload CSV usa il percorso vettoriale (pandas);
+    # None lo disabilita
+    CSV_COLUMNAR_MIN_BYTES: int | None = 32 * 1024 * 1024
+    # Esecutori: thread per le chiamate bloccanti al DB, processi per il
+    # lavoro CPU-bound (filtro CSV)
+    DB_THREAD_POOL_WORKERS: int = 10
+    PROCESS_POOL_WORKERS: int = 2
+    CPU_TASKS_MAX_CONCURRENCY: int = 4
+    # bcrypt in un pool di processi suo, così i login non competono con i
+    # CSV; oltre PASSWORD_HASH_MAX_CONCURRENCY le richieste attendono in coda
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_CONCURRENCY: int = 4
+    # Token bucket su login e recupero password, per IP e per nome utente:
+    # BURST tentativi subito, poi PER_MINUTE al minuto. "postgres" condivide
+    # i bucket tra i worker
+    LOGIN_RATE_LIMIT_ENABLED: bool = True
+    LOGIN_RATE_LIMIT_BACKEND: Literal["memory", "postgres"] = "memory"
+    LOGIN_RATE_LIMIT_IP_BURST: int = 30
+    LOGIN_RATE_LIMIT_IP_PER_MINUTE: float = 10
+    LOGIN_RATE_LIMIT_USERNAME_BURST: int = 10
+    LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE: float = 3
+    LOGIN_RATE_LIMIT_MAX_KEYS: int = 100_000
+    # Proxy (IP o reti CIDR, es. la rete di Traefik) di cui si legge
+    # X-Forwarded-For per l'IP del client; come --forwarded-allow-ips di
+    # uvicorn, "*" si fida di tutti. Vuoto: si usa l'IP della connessione
+    FORWARDED_ALLOW_IPS: Annotated[list[str] | str, BeforeValidator(parse_cors)] = []
+    # Import massivo di utenti: righe per file e per INSERT
+    USERS_IMPORT_MAX_ROWS: int = 10_000
+    USERS_IMPORT_BATCH_SIZE: int = 1000
+    # Limiti sui dati estratti dagli zip di /versions/batch, per file e in
+    # totale: un archivio piccolo può espandersi di molti ordini di grandezza
+    CSV_BATCH_ZIP_MAX_FILE_BYTES: int = 1024 * 1024 * 1024
+    CSV_BATCH_ZIP_MAX_TOTAL_BYTES: int = 4 * 1024 * 1024 * 1024
+    # Upload fino a questa dimensione vengono filtrati in memoria nel pool di
+    # processi; oltre si usa lo streaming a memoria limitata (colonnare da
+    # CSV_COLUMNAR_MIN_BYTES). Deve restare sotto quella soglia
+    CSV_PROCESS_POOL_MAX_BYTES: int = 16 * 1024 * 1024
+    # Elaborazioni CSV in background: spool su disco
+    CSV_JOBS_DIR: str = os.path.join(tempfile.gettempdir(), "csv-jobs")
+    CSV_JOB_RETENTION_SECONDS: int = 24 * 60 * 60
+    # Cache su disco dei risultati di upload_csv; 0 la disattiva
+    CSV_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), "csv-cache")
+    CSV_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
     EMAIL_TEST_USER: EmailStr = "test@example.com"
     FIRST_SUPERUSER: EmailStr ="admin@example.com"
     FIRST_SUPERUSER_PASSWORD: str="password"
@@ -106,6 +210,19 @@ class Settings(BaseSettings):
             else:
                 raise ValueError(message)
 
+    @model_validator(mode="after")
+    def _check_csv_thresholds(self) -> Self:
+        # Il percorso in memoria ha la precedenza: con le soglie sovrapposte
+        # file da decine di MiB starebbero interi in memoria
+        if (
+            self.CSV_COLUMNAR_MIN_BYTES is not None
+            and self.CSV_PROCESS_POOL_MAX_BYTES >= self.CSV_COLUMNAR_MIN_BYTES
+        ):
+            raise ValueError(
+                "CSV_PROCESS_POOL_MAX_BYTES must be lower than CSV_COLUMNAR_MIN_BYTES"
+            )
+        return self
+
     @model_validator(mode="after")
     def _enforce_non_default_secrets(self) -> Self:
         self._check_default_secret("SECRET_KEY", self.SECRET_KEY)
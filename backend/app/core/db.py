@@ -1,9 +1,49 @@
+from typing import Any
+
+from sqlalchemy import URL, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, create_engine, select, SQLModel
 
 from app import crud
 from app.core.config import settings
 from app.models import User, UserCreate, Versions
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+
+def _pool_options() -> dict[str, Any]:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _replica_url() -> URL | None:
+    if settings.POSTGRES_REPLICA_DSN is None:
+        return None
+    # Same driver as the primary whatever scheme the DSN uses
+    return make_url(str(settings.POSTGRES_REPLICA_DSN)).set(
+        drivername="postgresql+psycopg"
+    )
+
+
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **_pool_options())
+# Same database through psycopg's async mode, for `async def` routes
+# (AsyncSessionDep); scripts and services keep using the sync `engine`
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), **_pool_options()
+)
+
+# Read-only routes (ReadSessionDep, AsyncReadSessionDep) go to the replica
+# when one is configured, everything else to the primary
+_replica = _replica_url()
+read_engine = engine if _replica is None else create_engine(_replica, **_pool_options())
+async_read_engine = (
+    async_engine
+    if _replica is None
+    else create_async_engine(_replica, **_pool_options())
+)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_db_executor: ThreadPoolExecutor | None = None
+_process_pool: ProcessPoolExecutor | None = None
+_cpu_slots: asyncio.Semaphore | None = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    with _lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=settings.DB_THREAD_POOL_WORKERS, thread_name_prefix="db"
+            )
+        return _db_executor
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            # spawn: il processo dell'API ha thread attivi, fork non è sicuro
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _process_pool
+
+
+def _init_worker() -> None:
+    # Import qui: csv_tasks usa run_in_process di questo modulo
+    from app.services.csv_tasks import init_worker
+
+    init_worker()
+
+
+async def run_in_db_thread(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Esegue una chiamata bloccante al database fuori dall'event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_in_process(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Esegue un lavoro CPU-bound nel pool di processi.
+
+    Al massimo CPU_TASKS_MAX_CONCURRENCY richieste alla volta occupano il
+    pool; le altre attendono qui senza bloccare l'event loop. `func` e gli
+    argomenti devono essere serializzabili con pickle.
+    """
+    global _cpu_slots
+    if _cpu_slots is None:
+        _cpu_slots = asyncio.Semaphore(settings.CPU_TASKS_MAX_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    async with _cpu_slots:
+        return await loop.run_in_executor(
+            get_process_pool(), functools.partial(func, *args, **kwargs)
+        )
+
+
+def shutdown() -> None:
+    global _db_executor, _process_pool, _cpu_slots
+    with _lock:
+        if _db_executor is not None:
+            _db_executor.shutdown(wait=False, cancel_futures=True)
+            _db_executor = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+        # Il semaforo è legato all'event loop che lo ha usato
+        _cpu_slots = None
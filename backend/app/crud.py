@@ -1,10 +1,26 @@
 import uuid
+from collections.abc import Iterable, Iterator, Sequence
+from datetime import date
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlmodel import Session, case, col, func, or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
+from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.models import (
+    Azienda,
+    AziendaCreate,
+    BaseVersion,
+    Item,
+    ItemCreate,
+    User,
+    UserCreate,
+    UserUpdate,
+    Versions,
+)
+from app.services.password_hasher import password_hasher
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -17,6 +33,17 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     return db_obj
 
 
+async def create_user_async(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await password_hasher.hash(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    return db_obj
+
+
 def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
@@ -37,6 +64,11 @@ def get_user_by_email(*, session: Session, email: str) -> User | None:
     return session_user
 
 
+async def get_user_by_email_async(*, session: AsyncSession, email: str) -> User | None:
+    statement = select(User).where(User.email == email)
+    return (await session.exec(statement)).first()
+
+
 def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
@@ -46,9 +78,134 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     return db_user
 
 
+async def authenticate_async(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email_async(session=session, email=email)
+    if not db_user:
+        return None
+    # bcrypt è lento di proposito: la verifica gira nel pool dedicato
+    if not await password_hasher.verify(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
     session.commit()
     session.refresh(db_item)
     return db_item
+
+
+def _fill_versions(
+    rows: Iterable[Versions], start: date, end: date
+) -> Iterator[BaseVersion]:
+    # I giorni senza riga hanno versione "0" come in read_version. Si scorre
+    # per ordinale: il giorno dopo `end` non viene mai calcolato, così un
+    # intervallo che arriva a date.max non va in overflow
+    versioni = iter(rows)
+    row = next(versioni, None)
+    for ordinale in range(start.toordinal(), end.toordinal() + 1):
+        giorno = date.fromordinal(ordinale)
+        if row is not None and row.giorno == giorno:
+            yield BaseVersion(giorno=giorno, versione=row.versione)
+            row = next(versioni, None)
+        else:
+            yield BaseVersion(giorno=giorno, versione="0")
+
+
+def _versions_range_statement(start: date, end: date) -> SelectOfScalar[Versions]:
+    return (
+        select(Versions)
+        .where(Versions.giorno >= start, Versions.giorno <= end)
+        .order_by(col(Versions.giorno))
+    )
+
+
+def iter_versions_range(
+    *, session: Session, start: date, end: date, batch_size: int = 1000
+) -> Iterator[BaseVersion]:
+    """Versioni di ogni giorno tra `start` ed `end` inclusi, in ordine.
+
+    Una sola scansione sull'indice di `giorno`, letta a blocchi.
+    """
+    rows = session.exec(
+        _versions_range_statement(start, end).execution_options(yield_per=batch_size)
+    )
+    yield from _fill_versions(rows, start, end)
+
+
+async def get_versions_range_async(
+    *, session: AsyncSession, start: date, end: date
+) -> list[BaseVersion]:
+    """Come `iter_versions_range`, per intervalli che stanno in memoria."""
+    rows = (await session.exec(_versions_range_statement(start, end))).all()
+    return list(_fill_versions(rows, start, end))
+
+
+def _merge_versions(
+    richiesti: list[date], rows: Iterable[Versions]
+) -> list[BaseVersion]:
+    versioni = {row.giorno: row.versione for row in rows}
+    return [
+        BaseVersion(giorno=giorno, versione=versioni.get(giorno, "0"))
+        for giorno in richiesti
+    ]
+
+
+async def get_versions_async(
+    *, session: AsyncSession, giorni: Sequence[date]
+) -> list[BaseVersion]:
+    """Versioni dei giorni richiesti, nello stesso ordine e senza duplicati."""
+    richiesti = list(dict.fromkeys(giorni))
+    rows = await session.exec(
+        select(Versions).where(col(Versions.giorno).in_(richiesti))
+    )
+    return _merge_versions(richiesti, rows)
+
+
+def create_azienda(*, session: Session, azienda_in: AziendaCreate) -> Azienda:
+    db_azienda = Azienda.model_validate(azienda_in)
+    session.add(db_azienda)
+    session.commit()
+    session.refresh(db_azienda)
+    return db_azienda
+
+
+def _like_escape(term: str) -> str:
+    # Il testo cercato non deve poter usare i caratteri jolly di LIKE
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_aziende(*, session: Session, q: str, limit: int) -> list[Azienda]:
+    """Aziende per l'autocompletamento, prima quelle che iniziano per `q`.
+
+    La ricerca per prefisso su ragione sociale, codice, partita IVA e città
+    usa gli indici text_pattern_ops; da AZIENDE_SEARCH_MIN_SUBSTRING
+    caratteri si cerca anche all'interno di ragione sociale e città, con
+    gli indici trigram se l'estensione pg_trgm è installata.
+    """
+    term = _like_escape(q.strip())
+    ragione_sociale = func.lower(Azienda.ragione_sociale)
+    citta = func.lower(Azienda.citta)
+    prefix = term.lower() + "%"
+    nome_prefix = or_(
+        ragione_sociale.like(prefix),
+        func.upper(Azienda.codice).like(term.upper() + "%"),
+    )
+    conditions = [
+        nome_prefix,
+        col(Azienda.partita_iva).like(term + "%"),
+        citta.like(prefix),
+    ]
+    if len(q.strip()) >= settings.AZIENDE_SEARCH_MIN_SUBSTRING:
+        contains = "%" + term.lower() + "%"
+        conditions += [ragione_sociale.like(contains), citta.like(contains)]
+    statement = (
+        select(Azienda)
+        .where(or_(*conditions))
+        .order_by(case((nome_prefix, 0), else_=1), ragione_sociale, Azienda.codice)
+        .limit(limit)
+    )
+    return list(session.exec(statement))
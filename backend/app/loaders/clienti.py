@@ -0,0 +1,331 @@
+"""Caricamento dell'anagrafica clienti da XLSX o CSV.
+
+    python -m app.loaders.clienti CLIENTI.xlsx [--sheet Sheet] [--replace | --sync]
+
+Le righe vengono lette in streaming e scritte con COPY FROM STDIN a blocchi
+in una tabella temporanea, poi inserite in `clienti` in un'unica
+transazione: in caso di errore la tabella resta invariata. Un codice
+ripetuto nel file tiene l'ultima riga; uno già presente viene aggiornato.
+
+Con --sync il file viene caricato in una tabella temporanea e confrontato
+con `clienti` per codice e hash della riga: vengono scritte solo le righe
+nuove o modificate e cancellate quelle che non sono più nel file. Le
+letture di `clienti` (es. `upload_csv`) non vengono mai bloccate.
+
+La tabella è creata dalle migrazioni (modello `app.models.Cliente`).
+"""
+
+import argparse
+import csv
+import logging
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+import psycopg
+from openpyxl import load_workbook  # type: ignore[import-untyped]
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.services.clienti_index import CLIENTI_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Ordine delle colonne nel file sorgente, come nel foglio CLIENTI.xlsx
+COLUMNS = (
+    "codice",
+    "ragione_sociale",
+    "alias",
+    "cap",
+    "localita",
+    "indirizzo",
+    "pv",
+    "nz",
+    "telefono",
+    "codice_fiscale",
+    "partita_iva",
+)
+BATCH_SIZE = 50_000
+
+ClienteRow = tuple[str | None, ...]
+
+_COLUMN_DEFS = ", ".join(f"{column} varchar" for column in COLUMNS)
+_COLUMN_LIST = ", ".join(COLUMNS)
+
+# Tabelle temporanee; `ordine` permette di tenere l'ultima riga quando lo
+# stesso codice compare più volte nel file
+STAGING_TABLE = "clienti_staging"
+SYNC_TABLE = "clienti_sync"
+
+_CREATE_STAGING_SQL = (
+    f"CREATE TEMP TABLE {STAGING_TABLE} (ordine bigserial, {_COLUMN_DEFS}) "
+    "ON COMMIT DROP"
+)
+_CREATE_SYNC_SQL = (
+    f"CREATE TEMP TABLE {SYNC_TABLE} ON COMMIT DROP AS "
+    f"SELECT DISTINCT ON (codice) {_COLUMN_LIST}, "
+    f"md5(row({_COLUMN_LIST})::text) AS hash FROM {STAGING_TABLE} "
+    "ORDER BY codice, ordine DESC"
+)
+_DELETE_SQL = (
+    "DELETE FROM clienti c "
+    f"WHERE NOT EXISTS (SELECT 1 FROM {SYNC_TABLE} s WHERE s.codice = c.codice)"
+)
+# Il conflitto è sull'indice univoco ix_clienti_codice_norm
+_ON_CONFLICT_SQL = "ON CONFLICT ((upper(trim(codice)))) DO UPDATE SET " + ", ".join(
+    f"{column} = EXCLUDED.{column}" for column in COLUMNS[1:]
+)
+# Solo le righe nuove o con hash diverso; xmax = 0 per le righe inserite
+_UPSERT_SQL = (
+    f"INSERT INTO clienti ({_COLUMN_LIST}) "
+    f"SELECT {', '.join(f's.{column}' for column in COLUMNS)} FROM {SYNC_TABLE} s "
+    "LEFT JOIN clienti c ON c.codice = s.codice "
+    f"WHERE c.id IS NULL OR md5(row({', '.join(f'c.{column}' for column in COLUMNS)})"
+    f"::text) <> s.hash {_ON_CONFLICT_SQL} RETURNING xmax = 0"
+)
+# Caricamento senza --sync: una riga per codice, l'ultima del file
+_INSERT_SQL = (
+    f"INSERT INTO clienti ({_COLUMN_LIST}) "
+    f"SELECT DISTINCT ON (codice) {_COLUMN_LIST} FROM {STAGING_TABLE} "
+    f"ORDER BY codice, ordine DESC {_ON_CONFLICT_SQL}"
+)
+
+
+@dataclass(frozen=True)
+class SyncResult:
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+def _cell_text(value: Any) -> str | None:
+    # Excel restituisce i codici numerici come int o float (2282.0)
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def _normalize(values: Iterable[Any]) -> ClienteRow | None:
+    row = [_cell_text(value) for value in islice(values, len(COLUMNS))]
+    # Le righe senza codice non servono al filtro e vengono scartate
+    if not row or row[0] is None:
+        return None
+    row.extend([None] * (len(COLUMNS) - len(row)))
+    # Il codice si confronta come nel filtro CSV: senza spazi e maiuscolo
+    row[0] = row[0].upper()
+    return tuple(row)
+
+
+def iter_xlsx_rows(path: Path, sheet: str | None = None) -> Iterator[ClienteRow]:
+    """Righe del foglio, lette in modalità read-only senza caricarlo tutto."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        rows = worksheet.iter_rows(min_row=2, values_only=True)
+        for values in rows:
+            if (row := _normalize(values)) is not None:
+                yield row
+    finally:
+        workbook.close()
+
+
+def iter_csv_rows(path: Path, delimiter: str = ";") -> Iterator[ClienteRow]:
+    with path.open(encoding="utf-8-sig", newline="") as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        next(reader, None)
+        for values in reader:
+            if (row := _normalize(values)) is not None:
+                yield row
+
+
+def iter_rows(
+    path: Path, *, sheet: str | None = None, delimiter: str = ";"
+) -> Iterator[ClienteRow]:
+    if path.suffix.lower() in (".xlsx", ".xlsm"):
+        return iter_xlsx_rows(path, sheet)
+    if path.suffix.lower() == ".csv":
+        return iter_csv_rows(path, delimiter)
+    raise ValueError(f"Formato non supportato: {path.suffix} (richiesto .xlsx o .csv)")
+
+
+def copy_clienti(
+    conn: psycopg.Connection[Any],
+    rows: Iterable[ClienteRow],
+    *,
+    table: str = "clienti",
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Scrive le righe in `table` con un COPY per blocco di `batch_size`.
+
+    Non esegue il commit: la transazione è gestita da chi chiama.
+    """
+    total = 0
+    iterator = iter(rows)
+    with conn.cursor() as cursor:
+        while batch := list(islice(iterator, batch_size)):
+            with cursor.copy(f"COPY {table} ({_COLUMN_LIST}) FROM STDIN") as copy:
+                for row in batch:
+                    copy.write_row(row)
+            total += len(batch)
+            logger.info("Caricate %d righe", total)
+    return total
+
+
+def insert_clienti(
+    conn: psycopg.Connection[Any],
+    rows: Iterable[ClienteRow],
+    *,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Inserisce le righe in `clienti` passando dalla tabella temporanea.
+
+    I codici sono già normalizzati da `_normalize`, quindi un codice che nel
+    file differisce solo per maiuscole o spazi conta come ripetuto. Non
+    esegue il commit: la transazione è gestita da chi chiama.
+    """
+    conn.execute(_CREATE_STAGING_SQL)
+    read = copy_clienti(conn, rows, table=STAGING_TABLE, batch_size=batch_size)
+    written = conn.execute(_INSERT_SQL).rowcount
+    conn.execute(f"DROP TABLE {STAGING_TABLE}")
+    if read > written:
+        logger.warning(
+            "%d righe con codice ripetuto nel file: tenuta l'ultima", read - written
+        )
+    return written
+
+
+def sync_clienti(
+    conn: psycopg.Connection[Any],
+    rows: Iterable[ClienteRow],
+    *,
+    batch_size: int = BATCH_SIZE,
+) -> SyncResult:
+    """Allinea `clienti` alle righe date, scrivendo solo quelle cambiate.
+
+    Non esegue il commit: la transazione è gestita da chi chiama.
+    """
+    conn.execute(_CREATE_STAGING_SQL)
+    copy_clienti(conn, rows, table=STAGING_TABLE, batch_size=batch_size)
+    conn.execute(_CREATE_SYNC_SQL)
+    conn.execute(f"ANALYZE {SYNC_TABLE}")
+
+    deleted = conn.execute(_DELETE_SQL).rowcount
+    written = [row[0] for row in conn.execute(_UPSERT_SQL)]
+    total = conn.execute(f"SELECT count(*) FROM {SYNC_TABLE}").fetchone()
+    conn.execute(f"DROP TABLE {SYNC_TABLE}, {STAGING_TABLE}")
+    inserted = sum(written)
+    return SyncResult(
+        inserted=inserted,
+        updated=len(written) - inserted,
+        deleted=deleted,
+        unchanged=(total[0] if total else 0) - len(written),
+    )
+
+
+def database_dsn() -> str:
+    url = make_url(str(settings.SQLALCHEMY_DATABASE_URI))
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def load_clienti(
+    path: Path,
+    *,
+    sheet: str | None = None,
+    delimiter: str = ";",
+    replace: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    rows = iter_rows(path, sheet=sheet, delimiter=delimiter)
+    with psycopg.connect(database_dsn()) as conn:
+        if replace:
+            conn.execute("TRUNCATE clienti")
+        total = insert_clienti(conn, rows, batch_size=batch_size)
+        # Avvisa i worker dell'API di ricaricare l'indice dei codici
+        conn.execute(f"NOTIFY {CLIENTI_CHANNEL}")
+    return total
+
+
+def sync_clienti_file(
+    path: Path,
+    *,
+    sheet: str | None = None,
+    delimiter: str = ";",
+    batch_size: int = BATCH_SIZE,
+) -> SyncResult:
+    rows = iter_rows(path, sheet=sheet, delimiter=delimiter)
+    with psycopg.connect(database_dsn()) as conn:
+        result = sync_clienti(conn, rows, batch_size=batch_size)
+        if result.changed:
+            conn.execute(f"NOTIFY {CLIENTI_CHANNEL}")
+    return result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.loaders.clienti",
+        description="Carica l'anagrafica clienti da un file XLSX o CSV.",
+    )
+    parser.add_argument("path", type=Path, help="file .xlsx o .csv")
+    parser.add_argument("--sheet", help="foglio da leggere (XLSX, default: attivo)")
+    parser.add_argument("--delimiter", default=";", help="separatore (CSV)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--replace",
+        action="store_true",
+        help="svuota la tabella prima del caricamento",
+    )
+    mode.add_argument(
+        "--sync",
+        action="store_true",
+        help="scrive solo le righe cambiate e cancella quelle assenti dal file",
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    if args.sync:
+        result = sync_clienti_file(
+            args.path,
+            sheet=args.sheet,
+            delimiter=args.delimiter,
+            batch_size=args.batch_size,
+        )
+        logger.info(
+            "Sincronizzata la tabella 'clienti' in %.1f s: %d inseriti, "
+            "%d aggiornati, %d cancellati, %d invariati",
+            time.monotonic() - start,
+            result.inserted,
+            result.updated,
+            result.deleted,
+            result.unchanged,
+        )
+        return
+
+    total = load_clienti(
+        args.path,
+        sheet=args.sheet,
+        delimiter=args.delimiter,
+        replace=args.replace,
+        batch_size=args.batch_size,
+    )
+    logger.info(
+        "Inseriti %d record nella tabella 'clienti' in %.1f s",
+        total,
+        time.monotonic() - start,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,10 +1,24 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.core import executors
 from app.core.config import settings
+from app.core.db import async_engine, async_read_engine
+from app.services.aziende_cache import aziende_search_cache
+from app.services.clienti_index import clienti_index
+from app.services.email_outbox import email_outbox
+from app.services.email_templates import email_templates
+from app.services.jobs import csv_jobs
+from app.services.password_hasher import password_hasher
+from app.services.pg_listener import pg_listener
+from app.services.user_cache import user_cache
+from app.services.versions_cache import versions_cache
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +28,36 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    clienti_index.start()
+    versions_cache.start()
+    aziende_search_cache.start()
+    user_cache.start()
+    email_templates.preload()
+    email_outbox.start()
+    pg_listener.start()
+    # Job in coda o in corso in un processo che non c'è più
+    csv_jobs.recover()
+    yield
+    pg_listener.stop()
+    email_outbox.stop()
+    clienti_index.stop()
+    versions_cache.stop()
+    aziende_search_cache.stop()
+    user_cache.stop()
+    executors.shutdown()
+    password_hasher.shutdown()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
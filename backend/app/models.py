@@ -1,10 +1,12 @@
 import uuid
-
-from datetime import date
+from datetime import date, datetime
+from typing import Literal
 
 from pydantic import EmailStr
+from sqlalchemy import BigInteger, Column, DateTime, Index, func
 from sqlmodel import Field, Relationship, SQLModel, UniqueConstraint
 
+
 class BaseVersion (SQLModel):
     giorno: date = Field(index=True)
     versione: str = Field(max_length=50)
@@ -15,6 +17,146 @@ class Versions(BaseVersion, table=True):
     id: int | None = Field(default=None, primary_key=True)
 
 
+class VersionsPublic(SQLModel):
+    data: list[BaseVersion]
+    count: int
+
+
+class VersionsBulk(SQLModel):
+    giorni: list[date]
+
+
+# Stato di un'elaborazione CSV in background
+class CsvJobPublic(SQLModel):
+    id: uuid.UUID
+    giorno: date
+    filename: str
+    status: Literal["queued", "running", "done", "failed"]
+    bytes_total: int
+    bytes_processed: int = 0
+    rows_processed: int = 0
+    totale: str | None = None
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+
+
+# Riepilogo del CSV filtrato di un giorno; le righe sono nella tabella
+# partizionata csv_righe (vedi migrazione 5b7e0c2d9f41)
+class CsvRisultato(SQLModel, table=True):
+    __tablename__ = "csv_risultati"
+
+    giorno: date = Field(primary_key=True)
+    filename: str = Field(max_length=255)
+    intestazione: str
+    righe: int
+    totale_cents: int = Field(sa_type=BigInteger)
+    content_hash: str = Field(max_length=64)
+    updated_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+
+class CsvSubtotale(SQLModel):
+    codice: str
+    righe: int
+    totale: str
+
+
+class CsvRisultatoPublic(SQLModel):
+    giorno: date
+    filename: str
+    righe: int
+    totale: str
+    content_hash: str
+    updated_at: datetime
+    subtotali: list[CsvSubtotale] = []
+
+
+# Contatori della cache dei risultati CSV
+class CsvCacheStats(SQLModel):
+    hits: int
+    misses: int
+    entries: int
+    size_bytes: int
+    max_bytes: int
+
+
+# Stato del pool di processi per bcrypt
+class PasswordHasherStats(SQLModel):
+    workers: int
+    max_concurrency: int
+    running: int
+    waiting: int
+    peak_waiting: int
+    completed: int
+
+
+# Contatori del limite sui tentativi di login
+class RateLimitStats(SQLModel):
+    allowed: int
+    rejected_ip: int
+    rejected_username: int
+
+
+# Email in uscita, consegnate in background da app.services.email_outbox.
+# Un messaggio resta "pending" finché non è "sent" o, esauriti i tentativi,
+# "failed"; next_attempt_at è anche la scadenza della presa in carico
+class EmailOutbox(SQLModel, table=True):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index(
+            "ix_email_outbox_pending",
+            "next_attempt_at",
+            postgresql_where=Column("status") == "pending",
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str
+    html_content: str
+    status: str = Field(default="pending", max_length=10)
+    attempts: int = 0
+    last_error: str | None = None
+    next_attempt_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+    sent_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True))
+    )
+
+
+# Anagrafica clienti caricata da `app.loaders.clienti`; i codici sono
+# quelli cercati nella colonna committente dei CSV
+class Cliente(SQLModel, table=True):
+    __tablename__ = "clienti"
+    __table_args__ = (
+        # Stessa normalizzazione del filtro CSV (vedi migrazione 3e5a9b1c7d20)
+        Index(
+            "ix_clienti_codice_norm",
+            func.upper(func.trim(Column("codice"))),
+            unique=True,
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    codice: str
+    ragione_sociale: str | None = None
+    alias: str | None = None
+    cap: str | None = None
+    localita: str | None = None
+    indirizzo: str | None = None
+    pv: str | None = None
+    nz: str | None = None
+    telefono: str | None = None
+    codice_fiscale: str | None = None
+    partita_iva: str | None = None
+
+
 class AziendaBase(SQLModel):
     codice: str = Field(
         primary_key=True,
@@ -63,7 +205,30 @@ class AziendaBase(SQLModel):
 
 
 class Azienda(AziendaBase, table=True):
-    pass
+    # Indici per la ricerca per prefisso (LIKE 'abc%'); quelli trigram per
+    # la ricerca per sottostringa sono nella migrazione 6f2c8d4e1a93
+    __table_args__ = (
+        Index(
+            "ix_azienda_ragione_sociale_prefix",
+            func.lower(Column("ragione_sociale")).label("ragione_sociale"),
+            postgresql_ops={"ragione_sociale": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_azienda_codice_prefix",
+            func.upper(Column("codice")).label("codice"),
+            postgresql_ops={"codice": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_azienda_partita_iva_prefix",
+            "partita_iva",
+            postgresql_ops={"partita_iva": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_azienda_citta_prefix",
+            func.lower(Column("citta")).label("citta"),
+            postgresql_ops={"citta": "text_pattern_ops"},
+        ),
+    )
 
 
 # Modello per la creazione via API
@@ -84,9 +249,14 @@ class AziendaUpdate(SQLModel):
     partita_iva: str | None = Field(default=None, max_length=11)
 
 
-# Modello per la risposta API (include l'ID)
+# Modello per la risposta API (la chiave è il codice)
 class AziendaPublic(AziendaBase):
-    id: uuid.UUID
+    pass
+
+
+class AziendePublic(SQLModel):
+    data: list[AziendaPublic]
+    count: int
 
 # Shared properties
 class UserBase(SQLModel):
@@ -137,7 +307,27 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    # Opaque cursor for the next page, None on the last one
+    next_cursor: str | None = None
+
+
+# Outcome of one row of a bulk user import
+class UserImportResult(SQLModel):
+    line: int
+    email: str | None = None
+    # created; exists (already in the database); duplicate (repeated in the
+    # file); invalid (see detail)
+    status: Literal["created", "exists", "duplicate", "invalid"]
+    detail: str | None = None
+    id: uuid.UUID | None = None
+
+
+class UsersImportReport(SQLModel):
+    created: int
+    skipped: int
+    invalid: int
+    results: list[UserImportResult]
 
 
 # Shared properties
@@ -173,7 +363,9 @@ class ItemPublic(ItemBase):
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    count: int | None
+    # Opaque cursor for the next page, None on the last one
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -195,3 +387,4 @@ class TokenPayload(SQLModel):
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
+
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.models import AziendaPublic
+from app.services.pg_listener import pg_listener
+
+# Canale su cui il trigger di `azienda` segnala una modifica qualsiasi
+AZIENDE_CHANNEL = "aziende_changed"
+
+# Testo cercato (normalizzato) e numero massimo di risultati
+SearchKey = tuple[str, int]
+
+
+def search_key(q: str, limit: int) -> SearchKey:
+    # La ricerca non distingue maiuscole e minuscole
+    return q.strip().lower(), limit
+
+
+class AziendeSearchCache:
+    """Cache LRU con scadenza dei risultati di /aziende/search.
+
+    I prefissi brevi sono i più richiesti durante la digitazione e anche i
+    più costosi, perché corrispondono a molte righe. Ogni modifica alla
+    tabella svuota la cache tramite la NOTIFY su `AZIENDE_CHANNEL`.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: OrderedDict[SearchKey, tuple[float, list[AziendaPublic]]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        # Come in VersionsCache: un risultato letto prima di
+        # un'invalidazione non deve finire in cache
+        self.generation = 0
+
+    def get(self, key: SearchKey) -> list[AziendaPublic] | None:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            expires_at, results = cached
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def put(
+        self, key: SearchKey, results: list[AziendaPublic], *, generation: int
+    ) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self._ttl_seconds, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def start(self) -> None:
+        if settings.AZIENDE_SEARCH_CACHE_LISTEN:
+            pg_listener.subscribe(AZIENDE_CHANNEL, self._on_notify)
+
+    def stop(self) -> None:
+        pg_listener.unsubscribe(AZIENDE_CHANNEL, self._on_notify)
+
+    def _on_notify(self, _payload: str | None) -> None:
+        self.invalidate()
+
+
+aziende_search_cache = AziendeSearchCache(
+    ttl_seconds=settings.AZIENDE_SEARCH_CACHE_TTL_SECONDS,
+    max_entries=settings.AZIENDE_SEARCH_CACHE_MAX_ENTRIES,
+)
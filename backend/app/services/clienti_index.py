@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import threading
+import time
+from collections.abc import Iterable
+
+from sqlalchemy import Engine, func, text
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Cliente
+from app.services.pg_listener import pg_listener
+
+logger = logging.getLogger(__name__)
+
+# Canale su cui chi modifica `clienti` segnala che l'indice va ricaricato
+CLIENTI_CHANNEL = "clienti_changed"
+
+
+def notify_clienti_changed(session: Session) -> None:
+    """Avvisa tutti i worker che l'anagrafica clienti è cambiata.
+
+    La notifica viene consegnata al commit della transazione corrente.
+    """
+    session.execute(text(f"NOTIFY {CLIENTI_CHANNEL}"))
+
+
+class ClientiCodeIndex:
+    """Copia in memoria dei valori di `clienti.codice`.
+
+    I controlli di appartenenza non fanno accessi al database: l'insieme
+    viene caricato una volta e ricaricato quando arriva una NOTIFY su
+    `CLIENTI_CHANNEL`, oppure dopo `refresh_seconds` come rete di sicurezza.
+    """
+
+    def __init__(self, db_engine: Engine, *, refresh_seconds: float) -> None:
+        self._engine = db_engine
+        self._refresh_seconds = refresh_seconds
+        # Codici e relativa impronta, sostituiti insieme a ogni caricamento
+        self._snapshot: tuple[frozenset[str], str] = (frozenset(), "")
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def codici(self) -> frozenset[str]:
+        return self.snapshot()[0]
+
+    @property
+    def fingerprint(self) -> str:
+        return self.snapshot()[1]
+
+    def snapshot(self) -> tuple[frozenset[str], str]:
+        """Codici correnti e la loro impronta SHA-256, tra loro coerenti."""
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._load()
+        return self._snapshot
+
+    def __contains__(self, codice: object) -> bool:
+        return codice in self.codici
+
+    def __len__(self) -> int:
+        return len(self.codici)
+
+    def filter(self, codici: Iterable[str]) -> set[str]:
+        validi = self.codici
+        return {codice for codice in codici if codice in validi}
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._load()
+
+    def start(self) -> None:
+        # Se il caricamento fallisce l'indice verrà caricato al primo utilizzo
+        self._reload_quietly()
+        if settings.CLIENTI_INDEX_LISTEN:
+            pg_listener.subscribe(CLIENTI_CHANNEL, self._on_notify)
+
+    def stop(self) -> None:
+        pg_listener.unsubscribe(CLIENTI_CHANNEL, self._on_notify)
+
+    def _is_stale(self) -> bool:
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self._refresh_seconds
+        )
+
+    def _load(self) -> None:
+        codici = frozenset(self._fetch_codici())
+        digest = hashlib.sha256("\n".join(sorted(codici)).encode()).hexdigest()
+        self._snapshot = (codici, digest)
+        self._loaded_at = time.monotonic()
+        logger.info("Indice clienti caricato: %d codici", len(codici))
+
+    def _fetch_codici(self) -> list[str]:
+        with Session(self._engine) as session:
+            # Stessa espressione dell'indice univoco ix_clienti_codice_norm
+            codice = func.upper(func.trim(Cliente.codice))
+            return list(session.exec(select(codice)))
+
+    def _reload_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("Ricaricamento dei codici clienti fallito: %s", e)
+            self.invalidate()
+
+    def _on_notify(self, payload: str | None) -> None:
+        if payload is None:
+            # Le modifiche perse mentre il listener non era connesso
+            self.invalidate()
+        else:
+            self._reload_quietly()
+
+
+clienti_index = ClientiCodeIndex(
+    engine, refresh_seconds=settings.CLIENTI_INDEX_REFRESH_SECONDS
+)
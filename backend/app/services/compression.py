@@ -0,0 +1,141 @@
+import gzip
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import IO, Literal
+
+import zstandard
+
+from app.services.csv_filter import ByteSource, CsvFilterError
+
+Compression = Literal["gzip", "zstd"]
+
+# Estensioni accettate per l'upload, con la relativa compressione
+UPLOAD_SUFFIXES: dict[str, Compression | None] = {
+    ".csv": None,
+    ".csv.gz": "gzip",
+    ".csv.zst": "zstd",
+}
+
+# A parità di q si preferisce zstd, più veloce a comprimere
+_ENCODING_PREFERENCE: tuple[Compression, ...] = ("zstd", "gzip")
+
+# Input zstd passato al decompressore per volta: un blocco di pochi byte
+# può valere 128 KiB, così un pezzo non supera qualche decina di MiB
+_ZSTD_INPUT_SIZE = 1024
+
+
+def upload_compression(filename: str) -> Compression | None:
+    """Compressione dell'upload in base all'estensione del file.
+
+    Solleva CsvFilterError se l'estensione non è tra quelle accettate.
+    """
+    name = filename.lower()
+    for suffix, compression in UPLOAD_SUFFIXES.items():
+        if name.endswith(suffix):
+            return compression
+    raise CsvFilterError(
+        "File non valido: richiesto formato CSV (.csv, .csv.gz o .csv.zst)"
+    )
+
+
+class _ZstdReader:
+    """Decompressione zstd che rifiuta un file troncato a metà frame.
+
+    `stream_reader` in quel caso restituisce EOF come se il file fosse
+    finito; qui si verifica che l'ultimo frame sia completo.
+    """
+
+    def __init__(self, raw: IO[bytes]) -> None:
+        self._raw = raw
+        self._dctx = zstandard.ZstdDecompressor()
+        self._obj = self._dctx.decompressobj()
+        self._buffer = bytearray()
+        self._in_frame = False
+        self._eof = False
+
+    def read(self, size: int = -1, /) -> bytes:
+        while (size < 0 or len(self._buffer) < size) and not self._eof:
+            self._feed()
+        if size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+    def _feed(self) -> None:
+        data = self._raw.read(_ZSTD_INPUT_SIZE)
+        if not data:
+            if self._in_frame:
+                raise zstandard.ZstdError("frame zstd incompleto")
+            self._eof = True
+            return
+        while data:
+            self._in_frame = True
+            self._buffer += self._obj.decompress(data)
+            data = b""
+            # Più frame uno dopo l'altro, come da `zstd` su più file
+            if self._obj.eof:
+                data = self._obj.unused_data
+                self._obj = self._dctx.decompressobj()
+                self._in_frame = False
+
+
+class DecompressingReader:
+    """Sorgente binario che decomprime l'upload man mano che viene letto.
+
+    Il file decompresso non viene mai tenuto per intero in memoria; gli
+    errori del flusso compresso diventano CsvFilterError.
+    """
+
+    def __init__(self, raw: IO[bytes], compression: Compression) -> None:
+        self._reader: ByteSource
+        if compression == "gzip":
+            self._reader = gzip.GzipFile(fileobj=raw, mode="rb")
+        else:
+            self._reader = _ZstdReader(raw)
+
+    def read(self, size: int = -1, /) -> bytes:
+        try:
+            return self._reader.read(size)
+        except (OSError, EOFError, zlib.error, zstandard.ZstdError):
+            raise CsvFilterError("File compresso non valido o danneggiato")
+
+
+def negotiate_encoding(accept_encoding: str | None) -> Compression | None:
+    """Sceglie la codifica della risposta dall'header Accept-Encoding."""
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token.strip().lower()] = weight
+    best: Compression | None = None
+    best_weight = 0.0
+    for encoding in _ENCODING_PREFERENCE:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress_chunks(
+    chunks: Iterable[str | bytes], encoding: Compression
+) -> Iterator[bytes]:
+    """Comprime in streaming i blocchi di output (testo in UTF-8)."""
+    compressor: zlib._Compress | zstandard.ZstdCompressionObj
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    else:
+        compressor = zstandard.ZstdCompressor().compressobj()
+    for chunk in chunks:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if compressed := compressor.compress(data):
+            yield compressed
+    yield compressor.flush()
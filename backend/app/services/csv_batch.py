@@ -0,0 +1,185 @@
+import csv
+import io
+import re
+import shutil
+import zipfile
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path, PurePosixPath
+from typing import IO
+
+from app.core.config import settings
+from app.services.compression import Compression, upload_compression
+from app.services.csv_filter import CsvFilterError
+from app.services.csv_tasks import FilteredCsvFile
+from app.services.importi import format_cents
+
+# Il giorno di ogni file si ricava dal nome, es. "export_2024-01-31.csv"
+_GIORNO_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+MAX_BATCH_FILES = 366
+SUMMARY_NAME = "riepilogo.csv"
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class BatchFile:
+    giorno: date
+    filename: str
+    path: Path
+    compression: Compression | None
+
+    @property
+    def csv_name(self) -> str:
+        if self.compression is not None:
+            return self.filename.rsplit(".", 1)[0]
+        return self.filename
+
+    @property
+    def output_name(self) -> str:
+        return f"filtered_{self.csv_name}"
+
+    @property
+    def output_path(self) -> Path:
+        return self.path.with_name(self.output_name)
+
+
+def giorno_from_name(filename: str) -> date:
+    match = _GIORNO_RE.search(filename)
+    if match:
+        try:
+            return date(*(int(part) for part in match.groups()))
+        except ValueError:
+            pass
+    raise CsvFilterError(
+        f"Giorno non riconoscibile dal nome del file {filename} (atteso AAAA-MM-GG)"
+    )
+
+
+def _is_metadata(member: zipfile.ZipInfo) -> bool:
+    # Gli zip creati da macOS aggiungono __MACOSX/ e file "._nome" con gli
+    # attributi estesi; .DS_Store e simili non sono comunque dati
+    path = PurePosixPath(member.filename)
+    return path.parts[0] == "__MACOSX" or path.name.startswith(".")
+
+
+def _copy_capped(source: IO[bytes], target: IO[bytes], limit: int) -> int:
+    """Copia al massimo `limit` byte; oltre solleva CsvFilterError."""
+    copied = 0
+    while chunk := source.read(_COPY_CHUNK_SIZE):
+        copied += len(chunk)
+        if copied > limit:
+            raise CsvFilterError("File troppo grande nell'archivio zip")
+        target.write(chunk)
+    return copied
+
+
+def collect_batch_files(
+    uploads: Sequence[tuple[str, IO[bytes]]], workdir: Path
+) -> list[BatchFile]:
+    """Copia in `workdir` i file del batch, estraendo gli archivi zip.
+
+    Ogni file deve avere il giorno nel nome e ogni giorno può comparire una
+    sola volta. Dagli zip si estraggono al massimo
+    CSV_BATCH_ZIP_MAX_FILE_BYTES per file e CSV_BATCH_ZIP_MAX_TOTAL_BYTES in
+    tutto. Solleva CsvFilterError se il batch non è valido.
+    """
+    inputs = workdir / "input"
+    inputs.mkdir(parents=True, exist_ok=True)
+    batch: list[BatchFile] = []
+    # Byte ancora estraibili dagli zip del batch
+    zip_budget = settings.CSV_BATCH_ZIP_MAX_TOTAL_BYTES
+
+    def add(filename: str, upload: IO[bytes], limit: int | None = None) -> int:
+        if len(batch) >= MAX_BATCH_FILES:
+            raise CsvFilterError(f"Troppi file nel batch (massimo {MAX_BATCH_FILES})")
+        compression = upload_compression(filename)
+        path = inputs / f"{len(batch)}_{filename}"
+        with path.open("wb") as spool:
+            if limit is None:
+                # Upload diretto: non conta nei limiti degli zip
+                shutil.copyfileobj(upload, spool, _COPY_CHUNK_SIZE)
+                copied = 0
+            else:
+                copied = _copy_capped(upload, spool, limit)
+        batch.append(BatchFile(giorno_from_name(filename), filename, path, compression))
+        return copied
+
+    for filename, upload in uploads:
+        if not filename.lower().endswith(".zip"):
+            add(PurePosixPath(filename).name, upload)
+            continue
+        try:
+            with zipfile.ZipFile(upload) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or _is_metadata(member):
+                        continue
+                    # Dimensione dichiarata nell'archivio, controllata prima di
+                    # estrarre; la copia verifica quella reale
+                    limit = min(settings.CSV_BATCH_ZIP_MAX_FILE_BYTES, zip_budget)
+                    if member.file_size > limit:
+                        raise CsvFilterError(
+                            f"File troppo grande nell'archivio zip: {member.filename}"
+                        )
+                    with archive.open(member) as content:
+                        zip_budget -= add(
+                            PurePosixPath(member.filename).name, content, limit
+                        )
+        except zipfile.BadZipFile:
+            raise CsvFilterError(f"Archivio zip non valido: {filename}")
+
+    if not batch:
+        raise CsvFilterError("Nessun file CSV nel batch")
+    giorni: set[date] = set()
+    for item in batch:
+        if item.giorno in giorni:
+            raise CsvFilterError(f"Più file per il giorno {item.giorno.isoformat()}")
+        giorni.add(item.giorno)
+    return sorted(batch, key=lambda item: item.giorno)
+
+
+def write_batch_zip(
+    batch: Sequence[BatchFile],
+    results: Sequence[FilteredCsvFile | str],
+    zip_path: Path,
+) -> None:
+    """Archivio con i CSV filtrati e il riepilogo dei totali per giorno.
+
+    `results` contiene, per ogni file, l'esito oppure il messaggio d'errore;
+    i file con errore compaiono solo nel riepilogo.
+    """
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with (
+            archive.open(SUMMARY_NAME, "w") as raw,
+            io.TextIOWrapper(raw, encoding="utf-8", newline="") as summary,
+        ):
+            csv.writer(summary, delimiter=";").writerows(_summary_rows(batch, results))
+        for item, result in zip(batch, results, strict=True):
+            if isinstance(result, FilteredCsvFile):
+                archive.write(item.output_path, item.output_name)
+
+
+def _summary_rows(
+    batch: Sequence[BatchFile], results: Sequence[FilteredCsvFile | str]
+) -> list[list[str]]:
+    rows = [["Giorno", "File", "Righe", "Totale", "Errore"]]
+    righe = totale = 0
+    for item, result in zip(batch, results, strict=True):
+        if isinstance(result, FilteredCsvFile):
+            righe += result.rows_processed
+            totale += result.totale_cents
+            rows.append(
+                [
+                    item.giorno.isoformat(),
+                    item.filename,
+                    str(result.rows_processed),
+                    format_cents(result.totale_cents),
+                    "",
+                ]
+            )
+        else:
+            rows.append([item.giorno.isoformat(), item.filename, "", "", result])
+    rows.append(["TOTALE", "", str(righe), format_cents(totale), ""])
+    return rows
@@ -0,0 +1,294 @@
+import codecs
+import csv
+import io
+import logging
+import re
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+from app.core.config import settings
+from app.services.csv_filter import (
+    CODICE_COL,
+    IMPORTO_COLS,
+    READ_CHUNK_SIZE,
+    ByteSource,
+    CodiciResolver,
+    CsvFilterError,
+    prime_stream,
+    total_rows,
+)
+from app.services.importi import ImportiTotals, parse_cents
+
+logger = logging.getLogger(__name__)
+
+# Caratteri di testo passati a pandas per volta, tagliati a fine record
+BLOCK_CHARS = 1024 * 1024
+
+# Messaggi del parser C di pandas: riga con troppi campi, virgolette aperte
+_EXTRA_FIELDS_RE = re.compile(r"Expected \d+ fields in line (\d+), saw \d+")
+_UNTERMINATED = "EOF inside string"
+
+
+def should_use_columnar(size: int | None) -> bool:
+    return (
+        settings.CSV_COLUMNAR_MIN_BYTES is not None
+        and size is not None
+        and size >= settings.CSV_COLUMNAR_MIN_BYTES
+    )
+
+
+def _distinct_map(
+    column: pd.Series, func: Callable[[str], Any]
+) -> tuple[np.ndarray, list[Any]]:
+    """Applica `func` una sola volta per valore distinto della colonna.
+
+    Codici e importi si ripetono molto all'interno di un export: la parte in
+    Python costa quanto il numero di valori distinti, il resto è
+    un'indicizzazione numpy. Restituisce, per ogni riga, la posizione del
+    suo risultato nella lista.
+    """
+    positions, distinct = pd.factorize(column, sort=False)
+    return positions, [func(value) for value in distinct.tolist()]
+
+
+def _record_end(text: str) -> int:
+    """Fine dell'ultimo record completo di `text`, 0 se non ce n'è.
+
+    Un a capo chiude un record se prima ci sono virgolette in numero pari,
+    cioè se non cade dentro un campo tra virgolette.
+    """
+    quotes = text.count('"')
+    pos = len(text)
+    while (newline := text.rfind("\n", 0, pos)) >= 0:
+        quotes -= text.count('"', newline, pos)
+        if quotes % 2 == 0:
+            return newline + 1
+        pos = newline
+    return 0
+
+
+class _IncompleteRecord(Exception):
+    """Il blocco finisce dentro un campo tra virgolette."""
+
+
+def _parse_cents_or_none(importo: str) -> int | None:
+    try:
+        return parse_cents(importo)
+    except ValueError:
+        return None
+
+
+class _DecodedReader:
+    """File di testo minimale sopra un sorgente binario, decodificato a blocchi."""
+
+    def __init__(self, source: ByteSource) -> None:
+        self._source = source
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def read(self, size: int = -1) -> str:
+        # Al più `size` caratteri, tutto il resto se negativo. pandas chiede
+        # blocchi di dimensione fissa: in memoria resta un blocco decodificato
+        while (size < 0 or len(self._buffer) - self._pos < size) and not self._eof:
+            self._fill()
+        end = len(self._buffer) if size < 0 else self._pos + size
+        text = self._buffer[self._pos : end]
+        self._pos += len(text)
+        return text
+
+    def _fill(self) -> None:
+        chunk = self._source.read(READ_CHUNK_SIZE)
+        self._eof = not chunk
+        try:
+            text = self._decoder.decode(chunk, final=self._eof)
+        except UnicodeDecodeError:
+            raise CsvFilterError("Encoding non supportato (richiesto UTF-8)")
+        self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+
+    def peek_header(self) -> list[str] | None:
+        # Legge finché c'è almeno una riga completa senza consumarla: anche
+        # pandas deve vedere l'intestazione per rifiutare righe troppo lunghe
+        while "\n" not in self._buffer and not self._eof:
+            self._fill()
+        return next(csv.reader(io.StringIO(self._buffer), delimiter=";"), None)
+
+    def blocks(self, size: int) -> Iterator[str]:
+        """Il testo a blocchi di circa `size` caratteri, tagliati a fine record."""
+        pending = ""
+        while text := self.read(size):
+            pending += text
+            end = _record_end(pending)
+            if end:
+                yield pending[:end]
+                pending = pending[end:]
+        if pending:
+            yield pending
+
+
+class ColumnarCsvFilter:
+    """Variante vettoriale di `CsvFilter`, con output identico byte per byte.
+
+    Il file viene letto da pandas a blocchi di circa `block_chars`
+    caratteri; codici, importi e filtro sono calcolati per colonna e i
+    centesimi vengono sommati per committente con un raggruppamento numpy.
+    """
+
+    def __init__(
+        self,
+        source: ByteSource,
+        resolve_codici: CodiciResolver,
+        *,
+        block_chars: int = BLOCK_CHARS,
+        subtotali: bool = False,
+    ) -> None:
+        self._text = _DecodedReader(source)
+        self._resolve_codici = resolve_codici
+        self._block_chars = block_chars
+        self._subtotali = subtotali
+
+        fieldnames = self._text.peek_header()
+        if not fieldnames or CODICE_COL not in fieldnames:
+            raise CsvFilterError(
+                "Struttura file non valida: colonna 'Codice committente' mancante"
+            )
+        importo_col = next((col for col in IMPORTO_COLS if col in fieldnames), None)
+        if not importo_col:
+            raise CsvFilterError(
+                "Struttura file non valida: colonna 'Importo totale' mancante"
+            )
+        self.fieldnames = fieldnames
+        self.importo_col = importo_col
+        self._codice_idx = fieldnames.index(CODICE_COL)
+        self._importo_idx = fieldnames.index(importo_col)
+
+        self.codici_trovati = 0
+        self.rows_processed = 0
+        self.totali = ImportiTotals()
+
+        self._output = io.StringIO()
+        self._writer = csv.writer(self._output, delimiter=";")
+        self._writer.writerow(fieldnames)
+
+    def __iter__(self) -> Iterator[str]:
+        width = len(self.fieldnames)
+        for chunk in self._frames():
+            self._process_chunk(chunk)
+            # Come nel percorso riga per riga, niente output prima della
+            # prima riga valida
+            if self.rows_processed:
+                yield self._drain()
+
+        if not self.codici_trovati:
+            raise CsvFilterError("Nessun codice committente trovato nel file")
+        if not self.rows_processed:
+            raise CsvFilterError("Nessun codice committente valido trovato")
+
+        self._writer.writerows(
+            total_rows(
+                width,
+                self._codice_idx,
+                self._importo_idx,
+                self.totali,
+                self._subtotali,
+            )
+        )
+        yield self._drain()
+
+    def _frames(self) -> Iterator[pd.DataFrame]:
+        # Ogni blocco è letto da pandas separatamente, preceduto
+        # dall'intestazione: con chunksize pandas non controlla il numero di
+        # campi della prima riga di ogni blocco e la troncherebbe
+        header = ""
+        carry = ""
+        lines = 0
+        for block in self._text.blocks(self._block_chars):
+            text = carry + block
+            if not header:
+                end = text.find("\n") + 1 or len(text)
+                header, text = text[:end], text[end:]
+                lines = 1
+            try:
+                frame = self._read_block(header + text, lines)
+            except _IncompleteRecord:
+                # Taglio dentro un campo tra virgolette (una virgoletta
+                # isolata altera il conteggio): si riprova col blocco dopo
+                carry = text
+                continue
+            carry = ""
+            lines += text.count("\n")
+            yield frame
+        if carry:
+            yield self._read_block(header + carry, lines, final=True)
+
+    def _read_block(
+        self, text: str, lines_before: int, *, final: bool = False
+    ) -> pd.DataFrame:
+        try:
+            frame = pd.read_csv(
+                io.StringIO(text),
+                sep=";",
+                header=None,
+                names=range(len(self.fieldnames)),
+                index_col=False,
+                dtype=str,
+                na_filter=False,
+            )
+        except pd.errors.ParserError as e:
+            if not final and _UNTERMINATED in str(e):
+                raise _IncompleteRecord()
+            match = _EXTRA_FIELDS_RE.search(str(e))
+            if match is None:
+                raise CsvFilterError(f"Struttura file non valida: {e}")
+            # Stesso messaggio di CsvFilter. pandas conta la riga 1 per
+            # l'intestazione ripetuta e un campo che va a capo come una riga
+            riga = lines_before + int(match.group(1)) - 1
+            raise CsvFilterError(f"Riga {riga}: più colonne dell'intestazione")
+        return frame.iloc[1:]
+
+    def _process_chunk(self, chunk: pd.DataFrame) -> None:
+        positions, distinct = _distinct_map(
+            chunk[self._codice_idx], lambda codice: codice.strip().upper()
+        )
+        codici = np.array(distinct, dtype=object)[positions]
+        presenti = codici != ""
+        self.codici_trovati += int(presenti.sum())
+        validi = self._resolve_codici(set(pd.unique(codici[presenti])))
+        mask = presenti & np.isin(codici, list(validi))
+        selected = chunk[mask]
+        if selected.empty:
+            return
+        self._writer.writerows(selected.to_numpy().tolist())
+
+        positions, parsed = _distinct_map(
+            selected[self._importo_idx], _parse_cents_or_none
+        )
+        valid = np.array([v is not None for v in parsed], dtype=bool)[positions]
+        if not valid.all():
+            for row in selected[~valid].itertuples(index=False):
+                logger.warning(f"Importo non valido nella riga: {list(row)}")
+        if valid.any():
+            cents = np.array([v or 0 for v in parsed], dtype=np.int64)[positions]
+            somme = pd.Series(cents[valid]).groupby(codici[mask][valid]).sum()
+            for codice, somma in somme.items():
+                self.totali.add(codice, int(somma))
+            self.rows_processed += int(valid.sum())
+
+    def _drain(self) -> str:
+        chunk = self._output.getvalue()
+        self._output.seek(0)
+        self._output.truncate()
+        return chunk
+
+
+def stream_filtered_csv_columnar(
+    source: ByteSource, resolve_codici: CodiciResolver, *, subtotali: bool = False
+) -> Iterator[str]:
+    return prime_stream(
+        iter(ColumnarCsvFilter(source, resolve_codici, subtotali=subtotali))
+    )
@@ -0,0 +1,241 @@
+import codecs
+import csv
+import io
+import logging
+from collections.abc import Callable, Iterator
+from collections.abc import Set as AbstractSet
+from typing import Protocol
+
+from app.services.importi import ImportiTotals, format_cents, parse_cents
+
+logger = logging.getLogger(__name__)
+
+CODICE_COL = "Codice committente"
+IMPORTO_COLS = ("Importo totale", "Importo Totale", "IMPORTO TOTALE", "Totale")
+TOTALE_LABEL = "TOTALE"
+
+READ_CHUNK_SIZE = 1024 * 1024
+OUTPUT_CHUNK_SIZE = 64 * 1024
+RESOLVE_BATCH_SIZE = 1000
+
+CodiciResolver = Callable[[set[str]], AbstractSet[str]]
+
+
+class ByteSource(Protocol):
+    def read(self, size: int = -1, /) -> bytes: ...
+
+
+class CsvFilterError(Exception):
+    """Errore di validazione del file: il messaggio è pensato per l'utente."""
+
+    def __init__(self, detail: str) -> None:
+        super().__init__(detail)
+        self.detail = detail
+
+
+def total_rows(
+    width: int,
+    codice_idx: int,
+    importo_idx: int,
+    totali: ImportiTotals,
+    subtotali: bool,
+) -> list[list[str]]:
+    """Righe finali: i subtotali per committente (se richiesti) e il TOTALE."""
+    voci = []
+    if subtotali:
+        voci = [
+            (f"{TOTALE_LABEL} {codice}", cents)
+            for codice, cents in sorted(totali.subtotali.items())
+        ]
+    voci.append((TOTALE_LABEL, totali.totale))
+
+    rows = []
+    for label, cents in voci:
+        row = [""] * width
+        row[importo_idx] = format_cents(cents)
+        row[codice_idx] = label
+        rows.append(row)
+    return rows
+
+
+def iter_lines(source: ByteSource, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """Legge il sorgente a blocchi e restituisce le righe decodificate in UTF-8.
+
+    Le righe vengono spezzate solo su "\\n" e mantengono il terminatore, così
+    `csv.reader` gestisce i campi tra virgolette che contengono a capo.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    while True:
+        chunk = source.read(chunk_size)
+        try:
+            text = decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError:
+            raise CsvFilterError("Encoding non supportato (richiesto UTF-8)")
+        lines = (tail + text).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            break
+    if tail:
+        yield tail
+
+
+class CsvFilter:
+    """Filtra un export CSV in un solo passaggio, a memoria limitata.
+
+    Le righe con un codice committente valido vengono scritte in uscita
+    nell'ordine originale, sommando la colonna dell'importo; in coda viene
+    aggiunta la riga TOTALE. I codici non ancora visti vengono risolti a
+    lotti tramite `resolve_codici`, tenendo in sospeso al massimo
+    `batch_size` righe. Con `subtotali` prima del TOTALE viene scritta una
+    riga per ogni committente.
+    """
+
+    def __init__(
+        self,
+        lines: Iterator[str],
+        resolve_codici: CodiciResolver,
+        *,
+        batch_size: int = RESOLVE_BATCH_SIZE,
+        subtotali: bool = False,
+    ) -> None:
+        self._reader = csv.reader(lines, delimiter=";")
+        self._resolve_codici = resolve_codici
+        self._batch_size = batch_size
+        self._subtotali = subtotali
+
+        fieldnames = next(self._reader, None)
+        if not fieldnames or CODICE_COL not in fieldnames:
+            raise CsvFilterError(
+                "Struttura file non valida: colonna 'Codice committente' mancante"
+            )
+        importo_col = next((col for col in IMPORTO_COLS if col in fieldnames), None)
+        if not importo_col:
+            raise CsvFilterError(
+                "Struttura file non valida: colonna 'Importo totale' mancante"
+            )
+        self.fieldnames = fieldnames
+        self.importo_col = importo_col
+        self._codice_idx = fieldnames.index(CODICE_COL)
+        self._importo_idx = fieldnames.index(importo_col)
+
+        self.codici_trovati = 0
+        self.rows_processed = 0
+        self.totali = ImportiTotals()
+
+        self._codici_noti: dict[str, bool] = {}
+        self._da_risolvere: set[str] = set()
+        self._in_sospeso: list[tuple[str, list[str]]] = []
+
+        self._output = io.StringIO()
+        self._writer = csv.writer(self._output, delimiter=";")
+        self._writer.writerow(fieldnames)
+
+    def __iter__(self) -> Iterator[str]:
+        width = len(self.fieldnames)
+        for row in self._reader:
+            if not row:
+                continue
+            if len(row) > width:
+                raise CsvFilterError(
+                    f"Riga {self._reader.line_num}: più colonne dell'intestazione"
+                )
+            if len(row) < width:
+                row += [""] * (width - len(row))
+
+            codice = row[self._codice_idx].strip().upper()
+            if not codice:
+                continue
+            self.codici_trovati += 1
+
+            if not self._in_sospeso and codice in self._codici_noti:
+                self._process(codice, row)
+            else:
+                self._in_sospeso.append((codice, row))
+                if codice not in self._codici_noti:
+                    self._da_risolvere.add(codice)
+                if (
+                    len(self._in_sospeso) >= self._batch_size
+                    or len(self._da_risolvere) >= self._batch_size
+                ):
+                    self._flush_pending()
+
+            # Si inizia a emettere solo dopo la prima riga valida, così gli
+            # errori "nessun codice" arrivano sempre prima del primo byte
+            if self.rows_processed and self._output.tell() >= OUTPUT_CHUNK_SIZE:
+                yield self._drain()
+
+        self._flush_pending()
+        if not self.codici_trovati:
+            raise CsvFilterError("Nessun codice committente trovato nel file")
+        if not self.rows_processed:
+            raise CsvFilterError("Nessun codice committente valido trovato")
+
+        self._writer.writerows(
+            total_rows(
+                width,
+                self._codice_idx,
+                self._importo_idx,
+                self.totali,
+                self._subtotali,
+            )
+        )
+        yield self._drain()
+
+    def _flush_pending(self) -> None:
+        if self._da_risolvere:
+            validi = self._resolve_codici(self._da_risolvere)
+            for codice in self._da_risolvere:
+                self._codici_noti[codice] = codice in validi
+            self._da_risolvere = set()
+        for codice, row in self._in_sospeso:
+            self._process(codice, row)
+        self._in_sospeso = []
+
+    def _process(self, codice: str, row: list[str]) -> None:
+        if not self._codici_noti[codice]:
+            return
+        self._writer.writerow(row)
+        try:
+            cents = parse_cents(row[self._importo_idx])
+        except ValueError as e:
+            logger.warning(f"Importo non valido nella riga: {row} - Errore: {str(e)}")
+            return
+        self.totali.add(codice, cents)
+        self.rows_processed += 1
+
+    def _drain(self) -> str:
+        chunk = self._output.getvalue()
+        self._output.seek(0)
+        self._output.truncate()
+        return chunk
+
+
+def prime_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Calcola subito il primo blocco di output di un filtro.
+
+    Tutti gli errori di validazione (intestazione, encoding iniziale, nessun
+    codice valido) vengono sollevati qui, prima che la risposta sia iniziata;
+    il resto del file viene elaborato mentre il client scarica.
+    """
+    first = next(chunks)
+
+    def _stream() -> Iterator[str]:
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            logger.error("Errore durante lo streaming del CSV: %s", str(e))
+            raise
+
+    return _stream()
+
+
+def stream_filtered_csv(
+    source: ByteSource, resolve_codici: CodiciResolver, *, subtotali: bool = False
+) -> Iterator[str]:
+    return prime_stream(
+        iter(CsvFilter(iter_lines(source), resolve_codici, subtotali=subtotali))
+    )
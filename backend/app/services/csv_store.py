@@ -0,0 +1,275 @@
+import csv
+import hashlib
+import io
+import logging
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timezone
+from typing import IO, Any, cast
+
+import psycopg
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.core.db import engine
+from app.models import CsvRisultato, CsvRisultatoPublic, CsvSubtotale
+from app.services.csv_filter import (
+    CODICE_COL,
+    IMPORTO_COLS,
+    OUTPUT_CHUNK_SIZE,
+    READ_CHUNK_SIZE,
+    TOTALE_LABEL,
+    total_rows,
+)
+from app.services.importi import ImportiTotals, format_cents, parse_cents
+
+logger = logging.getLogger(__name__)
+
+COPY_SQL = "COPY csv_righe (giorno, riga, codice, importo_cents, linea) FROM STDIN"
+
+# Primo argomento di pg_advisory_xact_lock per i lock di questo modulo; il
+# secondo è il giorno (ordinale) oppure 0 per la creazione delle partizioni
+_LOCK_NAMESPACE = 2282
+_PARTITION_LOCK = 0
+
+_partizioni: set[str] = set()
+_partizioni_lock = threading.Lock()
+
+
+def _indici(fieldnames: list[str]) -> tuple[int, int]:
+    importo_col = next(col for col in IMPORTO_COLS if col in fieldnames)
+    return fieldnames.index(CODICE_COL), fieldnames.index(importo_col)
+
+
+def _serialize(row: list[str]) -> str:
+    # Stessa serializzazione del filtro, senza terminatore di riga
+    output = io.StringIO()
+    csv.writer(output, delimiter=";", lineterminator="").writerow(row)
+    return output.getvalue()
+
+
+def _is_total_row(row: list[str], codice_idx: int, importo_idx: int) -> bool:
+    label = row[codice_idx] if codice_idx < len(row) else ""
+    if label != TOTALE_LABEL and not label.startswith(f"{TOTALE_LABEL} "):
+        return False
+    return not any(
+        value for i, value in enumerate(row) if i not in (codice_idx, importo_idx)
+    )
+
+
+def _data_rows(
+    rows: Iterable[list[str]], codice_idx: int, importo_idx: int
+) -> Iterator[list[str]]:
+    # Le righe di totale in coda non vengono salvate: si ricalcolano in lettura
+    pending: list[list[str]] = []
+    for row in rows:
+        if _is_total_row(row, codice_idx, importo_idx):
+            pending.append(row)
+            continue
+        yield from pending
+        pending.clear()
+        yield row
+
+
+def ensure_partition(giorno: date) -> None:
+    """Crea, se manca, la partizione mensile di `csv_righe` per `giorno`."""
+    inizio = giorno.replace(day=1)
+    fine = date(inizio.year + inizio.month // 12, inizio.month % 12 + 1, 1)
+    nome = f"csv_righe_{inizio:%Y_%m}"
+    if nome in _partizioni:
+        return
+    with _partizioni_lock, engine.begin() as conn:
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(:ns, :key)"),
+            {"ns": _LOCK_NAMESPACE, "key": _PARTITION_LOCK},
+        )
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {nome} PARTITION OF csv_righe "
+                f"FOR VALUES FROM ('{inizio.isoformat()}') TO ('{fine.isoformat()}')"
+            )
+        )
+        _partizioni.add(nome)
+
+
+def store_filtered_csv(giorno: date, filename: str, source: IO[bytes]) -> CsvRisultato:
+    """Salva il CSV filtrato di un giorno, sostituendo quello precedente.
+
+    `source` è l'output del filtro (UTF-8, con le righe di totale in coda).
+    Le righe vengono caricate con COPY in `csv_righe`, il riepilogo con
+    totale, numero di righe e hash del contenuto in `csv_risultati`. Se
+    l'hash coincide con quello già salvato non viene riscritto nulla.
+    """
+    digest = hashlib.sha256()
+    while chunk := source.read(READ_CHUNK_SIZE):
+        digest.update(chunk)
+    content_hash = digest.hexdigest()
+    source.seek(0)
+
+    with Session(engine) as session:
+        # Un solo salvataggio alla volta per lo stesso giorno
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(:ns, :key)"),
+            {"ns": _LOCK_NAMESPACE, "key": giorno.toordinal()},
+        )
+        risultato = session.get(CsvRisultato, giorno)
+        if risultato is not None and risultato.content_hash == content_hash:
+            return risultato
+
+        ensure_partition(giorno)
+        session.execute(
+            text("DELETE FROM csv_righe WHERE giorno = :giorno"), {"giorno": giorno}
+        )
+
+        reader_source = io.TextIOWrapper(source, encoding="utf-8", newline="")
+        try:
+            reader = csv.reader(reader_source, delimiter=";")
+            fieldnames = next(reader)
+            codice_idx, importo_idx = _indici(fieldnames)
+            # `righe` conta, come rows_processed del filtro, solo le righe con
+            # un importo valido; le altre si salvano comunque, per
+            # ricostruire il file, con importo NULL
+            riga = righe = totale = 0
+            conn = cast(
+                psycopg.Connection[Any],
+                session.connection().connection.driver_connection,
+            )
+            with conn.cursor() as cursor, cursor.copy(COPY_SQL) as copy:
+                for row in _data_rows(reader, codice_idx, importo_idx):
+                    try:
+                        cents: int | None = parse_cents(row[importo_idx])
+                    except (ValueError, IndexError):
+                        cents = None
+                    riga += 1
+                    if cents is not None:
+                        righe += 1
+                        totale += cents
+                    codice = row[codice_idx].strip().upper()
+                    copy.write_row((giorno, riga, codice, cents, _serialize(row)))
+        finally:
+            reader_source.detach()
+
+        if risultato is None:
+            risultato = CsvRisultato(giorno=giorno)
+        risultato.filename = filename
+        risultato.intestazione = _serialize(fieldnames)
+        risultato.righe = righe
+        risultato.totale_cents = totale
+        risultato.content_hash = content_hash
+        risultato.updated_at = datetime.now(timezone.utc)
+        session.add(risultato)
+        session.commit()
+        session.refresh(risultato)
+        logger.info("Salvate %d righe filtrate per il giorno %s", righe, giorno)
+        return risultato
+
+
+def try_store_filtered_csv(giorno: date, filename: str, source: IO[bytes]) -> None:
+    """Come `store_filtered_csv`, ma un errore viene solo registrato nel log.
+
+    Pensata per i salvataggi a risposta già inviata; chiude `source`.
+    """
+    try:
+        with source:
+            store_filtered_csv(giorno, filename, source)
+    except Exception as e:
+        logger.error("Salvataggio del risultato del %s fallito: %s", giorno, str(e))
+
+
+class ResultSpool:
+    """Copia su disco di un CSV filtrato in streaming, da salvare dopo l'invio.
+
+    `tee` restituisce i blocchi invariati scrivendoli nello spool; `store`
+    va eseguita come BackgroundTask, così il salvataggio non trattiene la
+    fine della risposta. Un output interrotto non viene salvato.
+    """
+
+    def __init__(self, giorno: date, filename: str) -> None:
+        self._giorno = giorno
+        self._filename = filename
+        self._spool = tempfile.TemporaryFile()
+        self._complete = False
+
+    def tee(self, chunks: Iterable[str]) -> Iterator[str]:
+        for chunk in chunks:
+            self._spool.write(chunk.encode("utf-8"))
+            yield chunk
+        self._complete = True
+
+    def store(self) -> None:
+        if not self._complete:
+            self._spool.close()
+            return
+        self._spool.seek(0)
+        try_store_filtered_csv(self._giorno, self._filename, self._spool)
+
+
+def _read_totali(session: Session, giorno: date) -> list[tuple[str, int, int | None]]:
+    rows = session.execute(
+        text(
+            "SELECT codice, count(importo_cents), sum(importo_cents)::bigint "
+            "FROM csv_righe WHERE giorno = :giorno GROUP BY codice ORDER BY codice"
+        ),
+        {"giorno": giorno},
+    )
+    return list(rows.tuples())
+
+
+def read_stored_totali(session: Session, giorno: date) -> CsvRisultatoPublic | None:
+    risultato = session.get(CsvRisultato, giorno)
+    if risultato is None:
+        return None
+    return CsvRisultatoPublic(
+        giorno=risultato.giorno,
+        filename=risultato.filename,
+        righe=risultato.righe,
+        totale=format_cents(risultato.totale_cents),
+        content_hash=risultato.content_hash,
+        updated_at=risultato.updated_at,
+        # Come nel filtro, solo i committenti con almeno un importo valido
+        subtotali=[
+            CsvSubtotale(codice=codice, righe=righe, totale=format_cents(totale))
+            for codice, righe, totale in _read_totali(session, giorno)
+            if totale is not None
+        ],
+    )
+
+
+def iter_stored_csv(
+    risultato: CsvRisultato, *, subtotali: bool = False
+) -> Iterator[str]:
+    """Ricostruisce il CSV filtrato salvato, identico all'output del filtro.
+
+    Le righe vengono lette a blocchi con una propria sessione, così il
+    generatore può essere consumato da una StreamingResponse.
+    """
+    fieldnames = next(csv.reader([risultato.intestazione], delimiter=";"))
+    codice_idx, importo_idx = _indici(fieldnames)
+    buffer = [risultato.intestazione + "\r\n"]
+    size = len(buffer[0])
+    with Session(engine) as session:
+        rows = session.execute(
+            text("SELECT linea FROM csv_righe WHERE giorno = :giorno ORDER BY riga"),
+            {"giorno": risultato.giorno},
+            execution_options={"yield_per": 10_000},
+        )
+        for (linea,) in rows:
+            buffer.append(linea + "\r\n")
+            size += len(linea) + 2
+            if size >= OUTPUT_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+        totali = ImportiTotals()
+        for codice, _, totale in _read_totali(session, risultato.giorno):
+            # Come nel filtro, solo i committenti con almeno un importo valido
+            if totale is not None:
+                totali.add(codice, totale)
+
+    output = io.StringIO()
+    csv.writer(output, delimiter=";").writerows(
+        total_rows(len(fieldnames), codice_idx, importo_idx, totali, subtotali)
+    )
+    buffer.append(output.getvalue())
+    yield "".join(buffer)
@@ -0,0 +1,158 @@
+import io
+import logging
+from collections.abc import Callable
+from collections.abc import Set as AbstractSet
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, TypeVar
+
+from app.core.executors import run_in_process
+from app.services.clienti_index import clienti_index
+from app.services.compression import Compression, DecompressingReader
+from app.services.csv_columnar import ColumnarCsvFilter, should_use_columnar
+from app.services.csv_filter import ByteSource, CodiciResolver, CsvFilter, iter_lines
+from app.services.importi import format_cents
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Codici clienti del processo del pool, per impronta: caricati all'avvio da
+# init_worker oppure ricevuti una volta dal processo dell'API. Si tiene solo
+# l'ultima versione
+_worker_codici: dict[str, frozenset[str]] = {}
+
+
+class CodiciMancanti(Exception):
+    """Il processo del pool non ha i codici clienti con questa impronta."""
+
+
+@dataclass
+class FilteredCsv:
+    content: bytes
+    rows_processed: int
+    totale: str
+
+
+@dataclass
+class FilteredCsvFile:
+    rows_processed: int
+    totale_cents: int
+
+
+def make_filter(
+    source: ByteSource,
+    resolve_codici: CodiciResolver,
+    *,
+    size: int | None,
+    subtotali: bool = False,
+) -> CsvFilter | ColumnarCsvFilter:
+    if should_use_columnar(size):
+        return ColumnarCsvFilter(source, resolve_codici, subtotali=subtotali)
+    return CsvFilter(iter_lines(source), resolve_codici, subtotali=subtotali)
+
+
+def filter_csv_bytes(
+    data: bytes, codici: AbstractSet[str], *, subtotali: bool = False
+) -> FilteredCsv:
+    """Filtra un CSV interamente in memoria.
+
+    Non tocca database né stato globale: è pensata per girare nel pool di
+    processi. Solleva CsvFilterError come il filtro in streaming.
+    """
+    csv_filter = make_filter(
+        io.BytesIO(data), codici.__and__, size=len(data), subtotali=subtotali
+    )
+    content = "".join(csv_filter).encode("utf-8")
+    return FilteredCsv(
+        content=content,
+        rows_processed=csv_filter.rows_processed,
+        totale=format_cents(csv_filter.totali.totale),
+    )
+
+
+def filter_csv_file(
+    input_path: Path,
+    output_path: Path,
+    codici: AbstractSet[str],
+    *,
+    compression: Compression | None = None,
+    subtotali: bool = False,
+) -> FilteredCsvFile:
+    """Filtra un CSV su disco scrivendo il risultato in `output_path`.
+
+    Come `filter_csv_bytes` è pensata per il pool di processi, ma legge e
+    scrive a blocchi: la memoria usata non dipende dalla dimensione del file.
+    """
+    with (
+        input_path.open("rb") as raw,
+        output_path.open("w", encoding="utf-8", newline="") as output,
+    ):
+        source: ByteSource = raw
+        if compression is not None:
+            source = DecompressingReader(raw, compression)
+        csv_filter = make_filter(
+            source,
+            codici.__and__,
+            size=input_path.stat().st_size,
+            subtotali=subtotali,
+        )
+        for chunk in csv_filter:
+            output.write(chunk)
+    return FilteredCsvFile(
+        rows_processed=csv_filter.rows_processed,
+        totale_cents=csv_filter.totali.totale,
+    )
+
+
+def init_worker() -> None:
+    """Inizializzatore del pool di processi: carica i codici clienti correnti.
+
+    Se il database non risponde si parte senza: la prima chiamata li riceve
+    dal processo dell'API.
+    """
+    try:
+        codici, fingerprint = clienti_index.snapshot()
+    except Exception as e:
+        logger.warning("Codici clienti non caricati nel worker: %s", e)
+        return
+    _worker_codici.clear()
+    _worker_codici[fingerprint] = codici
+
+
+def _call_with_codici(
+    func: Callable[..., T],
+    fingerprint: str,
+    codici: frozenset[str] | None,
+    *args: Any,
+    **kwargs: Any,
+) -> T:
+    if codici is not None:
+        _worker_codici.clear()
+        _worker_codici[fingerprint] = codici
+    elif fingerprint not in _worker_codici:
+        raise CodiciMancanti(fingerprint)
+    return func(*args, codici=_worker_codici[fingerprint], **kwargs)
+
+
+async def run_with_codici(
+    func: Callable[..., T],
+    *args: Any,
+    codici: frozenset[str],
+    fingerprint: str,
+    **kwargs: Any,
+) -> T:
+    """Esegue `func(*args, codici=..., **kwargs)` nel pool di processi.
+
+    L'insieme dei codici, che può essere molto grande, non viene serializzato
+    a ogni chiamata: viaggia solo l'impronta. Se il processo che la riceve
+    non ha ancora quei codici, la chiamata si ripete allegandoli.
+    """
+    try:
+        return await run_in_process(
+            _call_with_codici, func, fingerprint, None, *args, **kwargs
+        )
+    except CodiciMancanti:
+        return await run_in_process(
+            _call_with_codici, func, fingerprint, codici, *args, **kwargs
+        )
@@ -0,0 +1,328 @@
+import logging
+import smtplib
+import threading
+import time
+from collections.abc import Iterable
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Any
+
+from sqlalchemy import Engine, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.services.pg_listener import pg_listener
+
+logger = logging.getLogger(__name__)
+
+# Canale su cui enqueue sveglia i worker, anche degli altri processi
+EMAIL_OUTBOX_CHANNEL = "email_outbox"
+
+# Oltre questa attesa tra un tentativo e l'altro non si va
+MAX_BACKOFF_SECONDS = 3600
+
+_INSERT_SQL = text(
+    """
+    INSERT INTO email_outbox
+        (email_to, subject, html_content, status, attempts,
+         next_attempt_at, created_at)
+    VALUES (:email_to, :subject, :html_content, 'pending', 0, now(), now())
+    """
+)
+
+# SKIP LOCKED: più worker prendono blocchi diversi senza attendersi. Il
+# messaggio resta "pending" con next_attempt_at spostato in avanti: se il
+# worker muore prima di consegnarlo, torna disponibile alla scadenza.
+# RETURNING non garantisce un ordine: i messaggi si consegnano nell'ordine
+# della scadenza originale, a parità in quello di inserimento
+_CLAIM_SQL = text(
+    """
+    WITH due AS (
+        SELECT id, next_attempt_at FROM email_outbox
+        WHERE status = 'pending' AND next_attempt_at <= now()
+        ORDER BY next_attempt_at, id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ), claimed AS (
+        UPDATE email_outbox
+        SET attempts = email_outbox.attempts + 1,
+            next_attempt_at = now() + make_interval(secs => :lease_seconds)
+        FROM due
+        WHERE email_outbox.id = due.id
+        RETURNING email_outbox.id, email_outbox.email_to, email_outbox.subject,
+            email_outbox.html_content, email_outbox.attempts,
+            due.next_attempt_at AS due_at
+    )
+    SELECT id, email_to, subject, html_content, attempts FROM claimed
+    ORDER BY due_at, id
+    """
+)
+
+# Prima dell'invio il lease del singolo messaggio riparte: un blocco lento
+# non lo fa scadere. Se nel frattempo era scaduto e un altro worker l'ha
+# ripreso, attempts è cambiato e il messaggio si lascia a lui
+_RENEW_SQL = text(
+    """
+    UPDATE email_outbox
+    SET next_attempt_at = now() + make_interval(secs => :lease_seconds)
+    WHERE id = :id AND status = 'pending' AND attempts = :attempts
+    """
+)
+
+# Il testo non serve più una volta chiuso il messaggio, e quello delle email
+# di nuovo account contiene la password
+_SENT_SQL = text(
+    "UPDATE email_outbox SET status = 'sent', sent_at = now(), last_error = NULL, "
+    "html_content = '' WHERE id = :id"
+)
+
+_RETRY_SQL = text(
+    """
+    UPDATE email_outbox
+    SET last_error = :error,
+        next_attempt_at = now() + make_interval(secs => :delay_seconds)
+    WHERE id = :id
+    """
+)
+
+_FAILED_SQL = text(
+    "UPDATE email_outbox SET status = 'failed', last_error = :error, "
+    "html_content = '' WHERE id = :id"
+)
+
+
+def build_message(*, email_to: str, subject: str, html_content: str) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr(
+        (settings.EMAILS_FROM_NAME or "", str(settings.EMAILS_FROM_EMAIL))
+    )
+    message["To"] = email_to
+    message.set_content(html_content, subtype="html")
+    return message
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Attesa prima del tentativo successivo al numero `attempts`."""
+    delay = settings.EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return float(min(delay, MAX_BACKOFF_SECONDS))
+
+
+def is_permanent(error: Exception) -> bool:
+    # Le risposte 5xx (destinatario inesistente, messaggio rifiutato) non
+    # cambiano ripetendo l'invio
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return (
+        isinstance(error, smtplib.SMTPResponseException)
+        and 500 <= error.smtp_code < 600
+    )
+
+
+class SmtpConnection:
+    """Connessione SMTP tenuta aperta tra un messaggio e l'altro.
+
+    Ogni worker ha la sua: smtplib non è thread-safe. Se il server l'ha
+    chiusa nel frattempo, si riconnette e riprova una volta.
+    """
+
+    def __init__(self, *, idle_seconds: float) -> None:
+        self._idle_seconds = idle_seconds
+        self._smtp: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def send(self, message: EmailMessage) -> None:
+        for retry in (False, True):
+            smtp = self._connect()
+            try:
+                smtp.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if retry:
+                    raise
+            else:
+                self._last_used = time.monotonic()
+                return
+
+    def _connect(self) -> smtplib.SMTP:
+        if (
+            self._smtp is not None
+            and time.monotonic() - self._last_used > self._idle_seconds
+        ):
+            self.close()
+        if self._smtp is None:
+            host = settings.SMTP_HOST or ""
+            timeout = settings.SMTP_TIMEOUT_SECONDS
+            smtp: smtplib.SMTP
+            if settings.SMTP_SSL:
+                smtp = smtplib.SMTP_SSL(host, settings.SMTP_PORT, timeout=timeout)
+            else:
+                smtp = smtplib.SMTP(host, settings.SMTP_PORT, timeout=timeout)
+                if settings.SMTP_TLS:
+                    smtp.starttls()
+            if settings.SMTP_USER:
+                smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+            self._smtp = smtp
+        return self._smtp
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+
+class EmailOutbox:
+    """Coda delle email in uscita, sulla tabella email_outbox.
+
+    `enqueue` costa un INSERT, così le route rispondono subito anche con un
+    server di posta lento. I worker (thread) consegnano i messaggi a blocchi
+    e ripetono i tentativi falliti con attesa esponenziale.
+    """
+
+    def __init__(
+        self,
+        db_engine: Engine,
+        *,
+        workers: int,
+        batch_size: int,
+        poll_seconds: float,
+        max_attempts: int,
+        lease_seconds: float,
+    ) -> None:
+        self._engine = db_engine
+        self._workers = workers
+        self._batch_size = batch_size
+        self._poll_seconds = poll_seconds
+        self._max_attempts = max_attempts
+        self._lease_seconds = lease_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def enqueue(self, *, email_to: str, subject: str, html_content: str) -> None:
+        self.enqueue_many([(email_to, subject, html_content)])
+
+    def enqueue_many(self, messages: Iterable[tuple[str, str, str]]) -> None:
+        """Accoda (email_to, subject, html_content) in una sola transazione."""
+        params = [
+            {"email_to": email_to, "subject": subject, "html_content": html_content}
+            for email_to, subject, html_content in messages
+        ]
+        if not params:
+            return
+        with self._engine.begin() as conn:
+            conn.execute(_INSERT_SQL, params)
+            conn.execute(text(f"NOTIFY {EMAIL_OUTBOX_CHANNEL}"))
+
+    def deliver_pending(self, smtp: SmtpConnection) -> int:
+        """Consegna un blocco di messaggi scaduti; restituisce quanti erano."""
+        with self._engine.begin() as conn:
+            claimed = conn.execute(
+                _CLAIM_SQL,
+                {"lease_seconds": self._lease_seconds, "limit": self._batch_size},
+            ).all()
+        for row in claimed:
+            self._deliver(smtp, row)
+        return len(claimed)
+
+    def _deliver(self, smtp: SmtpConnection, row: Any) -> None:
+        with self._engine.begin() as conn:
+            renewed = conn.execute(
+                _RENEW_SQL,
+                {
+                    "id": row.id,
+                    "attempts": row.attempts,
+                    "lease_seconds": self._lease_seconds,
+                },
+            ).rowcount
+        if not renewed:
+            logger.warning("Email %d ripresa da un altro worker, salto", row.id)
+            return
+        message = build_message(
+            email_to=row.email_to, subject=row.subject, html_content=row.html_content
+        )
+        try:
+            smtp.send(message)
+        except Exception as e:
+            # Dopo un rifiuto del server la connessione è ancora buona
+            if not isinstance(
+                e, smtplib.SMTPResponseException | smtplib.SMTPRecipientsRefused
+            ):
+                smtp.close()
+            error = str(e)[:1000]
+            with self._engine.begin() as conn:
+                if is_permanent(e) or row.attempts >= self._max_attempts:
+                    logger.error(
+                        "Email %d a %s non consegnata: %s", row.id, row.email_to, e
+                    )
+                    conn.execute(_FAILED_SQL, {"id": row.id, "error": error})
+                else:
+                    delay = backoff_seconds(row.attempts)
+                    logger.warning(
+                        "Email %d a %s: tentativo %d fallito (%s), nuovo tentativo tra %.0f s",
+                        row.id,
+                        row.email_to,
+                        row.attempts,
+                        e,
+                        delay,
+                    )
+                    conn.execute(
+                        _RETRY_SQL,
+                        {"id": row.id, "error": error, "delay_seconds": delay},
+                    )
+            return
+        with self._engine.begin() as conn:
+            conn.execute(_SENT_SQL, {"id": row.id})
+
+    def start(self) -> None:
+        # Senza SMTP configurato non c'è niente da consegnare
+        if self._threads or not settings.emails_enabled:
+            return
+        self._stop.clear()
+        pg_listener.subscribe(EMAIL_OUTBOX_CHANNEL, self._on_notify)
+        for i in range(self._workers):
+            thread = threading.Thread(
+                target=self._run, name=f"email-outbox-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        pg_listener.unsubscribe(EMAIL_OUTBOX_CHANNEL, self._on_notify)
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _on_notify(self, _payload: str | None) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        smtp = SmtpConnection(idle_seconds=settings.SMTP_IDLE_SECONDS)
+        try:
+            while not self._stop.is_set():
+                try:
+                    delivered = self.deliver_pending(smtp)
+                except Exception as e:
+                    logger.warning("Lettura della coda email fallita: %s", e)
+                    delivered = 0
+                if delivered == 0:
+                    self._wake.wait(self._poll_seconds)
+                    self._wake.clear()
+        finally:
+            smtp.close()
+
+
+email_outbox = EmailOutbox(
+    engine,
+    workers=settings.EMAIL_OUTBOX_WORKERS,
+    batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+    poll_seconds=settings.EMAIL_OUTBOX_POLL_SECONDS,
+    max_attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+    lease_seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS,
+)
@@ -0,0 +1,71 @@
+import threading
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+from typing import Any
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+from app.core.config import settings
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "email-templates" / "build"
+
+
+class EmailTemplateRegistry:
+    """Template delle email compilati una volta sola.
+
+    Dopo `preload` il rendering non legge più il disco. La cache del bytecode
+    su file evita di ricompilare i template a ogni avvio dei worker; con
+    `auto_reload` (in locale) i file modificati vengono ricaricati.
+    """
+
+    def __init__(
+        self, templates_dir: Path, *, cache_dir: str | None, auto_reload: bool
+    ) -> None:
+        self.templates_dir = templates_dir
+        self._cache_dir = cache_dir
+        self._auto_reload = auto_reload
+        self._env: Environment | None = None
+        self._lock = threading.Lock()
+
+    def _environment(self) -> Environment:
+        with self._lock:
+            if self._env is None:
+                bytecode_cache = None
+                if self._cache_dir is not None:
+                    Path(self._cache_dir).mkdir(parents=True, exist_ok=True)
+                    bytecode_cache = FileSystemBytecodeCache(self._cache_dir)
+                # Come il vecchio jinja2.Template: nessun autoescape, l'HTML
+                # generato da MJML resta identico
+                self._env = Environment(
+                    loader=FileSystemLoader(self.templates_dir),
+                    bytecode_cache=bytecode_cache,
+                    auto_reload=self._auto_reload,
+                    cache_size=-1,
+                )
+            return self._env
+
+    def preload(self) -> None:
+        """Compila tutti i template di `templates_dir`."""
+        env = self._environment()
+        for name in env.list_templates(extensions=["html"]):
+            env.get_template(name)
+
+    def get(self, template_name: str) -> Template:
+        return self._environment().get_template(template_name)
+
+    def render(self, template_name: str, context: Mapping[str, Any]) -> str:
+        return self.get(template_name).render(context)
+
+    def render_batch(
+        self, template_name: str, contexts: Iterable[Mapping[str, Any]]
+    ) -> list[str]:
+        """Un template, molti destinatari: il template si cerca una volta sola."""
+        template = self.get(template_name)
+        return [template.render(context) for context in contexts]
+
+
+email_templates = EmailTemplateRegistry(
+    TEMPLATES_DIR,
+    cache_dir=settings.EMAIL_TEMPLATES_CACHE_DIR,
+    auto_reload=settings.ENVIRONMENT == "local",
+)
@@ -0,0 +1,58 @@
+import re
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# Forma tipica degli export: "1.234,56", "-12,5", "€ 30", "7"; il punto è
+# accettato solo come separatore delle migliaia, quindi seguito dalla virgola
+_IMPORTO_RE = re.compile(
+    r"\s*(?:€\s*)?(-?)(\d+|\d{1,3}(?:\.\d{3})+(?=,))(?:,(\d{0,2}))?\s*(?:€\s*)?"
+)
+_CENT = Decimal(1)
+
+
+def parse_cents(value: str) -> int:
+    """Converte un importo in formato italiano in centesimi interi.
+
+    I valori fuori dalla forma tipica seguono le regole storiche del filtro
+    ("12.5" senza virgola usa il punto come decimale); le frazioni di
+    centesimo vengono arrotondate half-up. Solleva ValueError se il valore
+    non è un importo.
+    """
+    match = _IMPORTO_RE.fullmatch(value)
+    if match:
+        segno, intero, decimali = match.groups()
+        cents = int(intero.replace(".", "")) * 100 + int((decimali or "").ljust(2, "0"))
+        return -cents if segno else cents
+    return _parse_cents_slow(value)
+
+
+def _parse_cents_slow(value: str) -> int:
+    importo_str = value.strip().replace("€", "").replace(" ", "")
+    if "," in importo_str:
+        importo_str = importo_str.replace(".", "").replace(",", ".")
+    try:
+        importo = Decimal(importo_str)
+    except InvalidOperation:
+        raise ValueError(f"could not convert string to amount: {value!r}")
+    if not importo.is_finite():
+        raise ValueError(f"could not convert string to amount: {value!r}")
+    return int((importo * 100).quantize(_CENT, rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents: int) -> str:
+    # Due decimali, punto per le migliaia e virgola come separatore decimale
+    segno = "-" if cents < 0 else ""
+    intero, decimali = divmod(abs(cents), 100)
+    return f"{segno}{intero:,}".replace(",", ".") + f",{decimali:02d}"
+
+
+class ImportiTotals:
+    """Totale esatto in centesimi, con i subtotali per codice committente."""
+
+    def __init__(self) -> None:
+        self.totale = 0
+        self.subtotali: defaultdict[str, int] = defaultdict(int)
+
+    def add(self, codice: str, cents: int) -> None:
+        self.totale += cents
+        self.subtotali[codice] += cents
@@ -0,0 +1,307 @@
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import IO
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.executors import run_in_process
+from app.models import CsvJobPublic
+from app.services.compression import Compression, DecompressingReader
+from app.services.csv_filter import ByteSource, CsvFilterError
+from app.services.csv_store import try_store_filtered_csv
+from app.services.csv_tasks import make_filter
+from app.services.importi import format_cents
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+INTERRUPTED_ERROR = "Elaborazione interrotta: caricare di nuovo il file"
+
+
+class CsvJobNotFound(Exception):
+    pass
+
+
+def _job_path(jobs_dir: Path, job_id: uuid.UUID, suffix: str) -> Path:
+    return jobs_dir / f"{job_id.hex}.{suffix}"
+
+
+def _write_job(jobs_dir: Path, job: CsvJobPublic) -> None:
+    # Scrittura atomica: chi legge lo stato non vede mai un file a metà
+    path = _job_path(jobs_dir, job.id, "json")
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(job.model_dump_json())
+    os.replace(tmp, path)
+
+
+def _read_job(jobs_dir: Path, job_id: uuid.UUID) -> CsvJobPublic:
+    try:
+        text = _job_path(jobs_dir, job_id, "json").read_text()
+    except FileNotFoundError:
+        raise CsvJobNotFound(str(job_id))
+    return CsvJobPublic.model_validate_json(text)
+
+
+class _ProgressReader:
+    """Sorgente binario che aggiorna periodicamente l'avanzamento del job.
+
+    L'avanzamento è la posizione nel file caricato `raw`: con un upload
+    compresso `source` ne legge la versione decompressa.
+    """
+
+    def __init__(
+        self, source: ByteSource, raw: IO[bytes], jobs_dir: Path, job: CsvJobPublic
+    ) -> None:
+        self._source = source
+        self._raw = raw
+        self._jobs_dir = jobs_dir
+        self._job = job
+        self._last_write = time.monotonic()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._source.read(size)
+        self._job.bytes_processed = self._raw.tell()
+        now = time.monotonic()
+        if now - self._last_write >= PROGRESS_INTERVAL_SECONDS:
+            _write_job(self._jobs_dir, self._job)
+            self._last_write = now
+        return chunk
+
+
+def _owner_alive(lock_path: Path) -> bool:
+    """Vero se il processo che tiene `lock_path` è ancora in esecuzione.
+
+    Il lock (flock) viene rilasciato dal sistema quando il processo termina,
+    anche se viene ucciso.
+    """
+    try:
+        lock = lock_path.open("a")
+    except FileNotFoundError:
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        lock_path.unlink(missing_ok=True)
+        return False
+
+
+def run_csv_job(
+    jobs_dir: Path,
+    job_id: uuid.UUID,
+    codici: frozenset[str],
+    compression: Compression | None,
+    subtotali: bool,
+) -> None:
+    """Elabora un upload in spool; gira in un processo del pool.
+
+    Lo stato (avanzamento, esito, errore) viene scritto direttamente nel file
+    JSON del job, così è leggibile da qualunque worker dell'API. L'avanzamento
+    conta i byte del file caricato, compresso o no.
+    """
+    job = _read_job(jobs_dir, job_id)
+    job.status = "running"
+    _write_job(jobs_dir, job)
+
+    input_path = _job_path(jobs_dir, job_id, "input")
+    output_path = _job_path(jobs_dir, job_id, "csv")
+    tmp_path = _job_path(jobs_dir, job_id, "csv.tmp")
+    try:
+        with (
+            input_path.open("rb") as raw,
+            tmp_path.open("w", encoding="utf-8", newline="") as output,
+        ):
+            source: ByteSource = raw
+            if compression is not None:
+                source = DecompressingReader(raw, compression)
+            csv_filter = make_filter(
+                _ProgressReader(source, raw, jobs_dir, job),
+                codici.__and__,
+                size=job.bytes_total,
+                subtotali=subtotali,
+            )
+            for chunk in csv_filter:
+                output.write(chunk)
+        os.replace(tmp_path, output_path)
+        job.status = "done"
+        job.rows_processed = csv_filter.rows_processed
+        job.totale = format_cents(csv_filter.totali.totale)
+        csv_name = job.filename
+        if compression is not None:
+            csv_name = csv_name.rsplit(".", 1)[0]
+        try_store_filtered_csv(job.giorno, csv_name, output_path.open("rb"))
+    except CsvFilterError as e:
+        job.status = "failed"
+        job.error = e.detail
+    except Exception as e:
+        logger.error("Errore durante l'elaborazione del job %s: %s", job_id, str(e))
+        job.status = "failed"
+        job.error = "Errore interno durante l'elaborazione"
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        input_path.unlink(missing_ok=True)
+    job.bytes_processed = job.bytes_total
+    job.finished_at = datetime.now(timezone.utc)
+    _write_job(jobs_dir, job)
+
+
+class CsvJobQueue:
+    """Coda degli upload CSV elaborati in background da un pool di processi.
+
+    Upload, stato e risultato stanno in `jobs_dir`: lo stato di un job si può
+    interrogare da qualunque worker dell'API sulla stessa macchina. I job
+    usano il pool di processi di `app.core.executors` e, come le altre
+    elaborazioni, ne occupano al massimo CPU_TASKS_MAX_CONCURRENCY slot:
+    finché aspettano restano "queued".
+    """
+
+    def __init__(self, jobs_dir: Path, *, retention_seconds: int):
+        self.jobs_dir = jobs_dir
+        self._retention_seconds = retention_seconds
+        # Riferimenti ai task in corso, altrimenti il garbage collector può
+        # eliminarli prima della fine
+        self._tasks: set[asyncio.Task[None]] = set()
+        # Ogni job riporta il processo che lo completerà; il processo tiene
+        # un lock su owners/<instance>.lock finché è vivo
+        self._instance = uuid.uuid4().hex
+        self._owner_lock: IO[str] | None = None
+
+    async def submit(
+        self,
+        *,
+        giorno: date,
+        filename: str,
+        upload: IO[bytes],
+        codici: frozenset[str],
+        compression: Compression | None = None,
+        subtotali: bool = False,
+    ) -> CsvJobPublic:
+        # Spool su disco fuori dall'event loop
+        job = await run_in_threadpool(self._create, giorno, filename, upload)
+        task = asyncio.create_task(self._run(job.id, codici, compression, subtotali))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: uuid.UUID) -> CsvJobPublic:
+        return _read_job(self.jobs_dir, job_id)
+
+    def result_path(self, job_id: uuid.UUID) -> Path:
+        return _job_path(self.jobs_dir, job_id, "csv")
+
+    def recover(self) -> None:
+        """Chiude i job rimasti a metà da un processo dell'API terminato.
+
+        Da chiamare all'avvio: un job "queued" o "running" il cui processo
+        proprietario non esiste più non verrà mai completato.
+        """
+        if not self.jobs_dir.is_dir():
+            return
+        alive: dict[str, bool] = {self._instance: True}
+        for path in self.jobs_dir.glob("*.owner"):
+            try:
+                instance = path.read_text()
+            except FileNotFoundError:
+                continue
+            if instance not in alive:
+                alive[instance] = _owner_alive(self._owners_dir / f"{instance}.lock")
+            if not alive[instance]:
+                self._interrupt(uuid.UUID(path.stem), "processo dell'API terminato")
+
+    @property
+    def _owners_dir(self) -> Path:
+        return self.jobs_dir / "owners"
+
+    def _hold_owner_lock(self) -> None:
+        if self._owner_lock is not None:
+            return
+        self._owners_dir.mkdir(parents=True, exist_ok=True)
+        lock = (self._owners_dir / f"{self._instance}.lock").open("a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        self._owner_lock = lock
+
+    def _create(self, giorno: date, filename: str, upload: IO[bytes]) -> CsvJobPublic:
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._hold_owner_lock()
+        self._prune()
+
+        job_id = uuid.uuid4()
+        input_path = _job_path(self.jobs_dir, job_id, "input")
+        with input_path.open("wb") as spool:
+            shutil.copyfileobj(upload, spool, 1024 * 1024)
+
+        job = CsvJobPublic(
+            id=job_id,
+            giorno=giorno,
+            filename=filename,
+            status="queued",
+            bytes_total=input_path.stat().st_size,
+            created_at=datetime.now(timezone.utc),
+        )
+        # Processo che completerà il job, per riconoscere quelli orfani
+        _job_path(self.jobs_dir, job_id, "owner").write_text(self._instance)
+        _write_job(self.jobs_dir, job)
+        return job
+
+    async def _run(
+        self,
+        job_id: uuid.UUID,
+        codici: frozenset[str],
+        compression: Compression | None,
+        subtotali: bool,
+    ) -> None:
+        # Il job segna da solo il proprio esito; qui si gestiscono solo i
+        # casi in cui il processo non è arrivato in fondo
+        try:
+            await run_in_process(
+                run_csv_job, self.jobs_dir, job_id, codici, compression, subtotali
+            )
+        except asyncio.CancelledError:
+            self._interrupt(job_id, "annullato all'arresto")
+            raise
+        except Exception as e:
+            self._interrupt(job_id, e)
+        finally:
+            _job_path(self.jobs_dir, job_id, "owner").unlink(missing_ok=True)
+
+    def _interrupt(self, job_id: uuid.UUID, reason: object) -> None:
+        try:
+            job = self.get(job_id)
+        except CsvJobNotFound:
+            return
+        _job_path(self.jobs_dir, job_id, "owner").unlink(missing_ok=True)
+        if job.status in ("done", "failed"):
+            return
+        logger.error("Job %s interrotto: %s", job_id, reason)
+        _job_path(self.jobs_dir, job_id, "input").unlink(missing_ok=True)
+        job.status = "failed"
+        job.error = INTERRUPTED_ERROR
+        job.finished_at = datetime.now(timezone.utc)
+        _write_job(self.jobs_dir, job)
+
+    def _prune(self) -> None:
+        limit = time.time() - self._retention_seconds
+        for path in self.jobs_dir.iterdir():
+            if path == self._owners_dir:
+                continue
+            try:
+                if path.stat().st_mtime < limit:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+csv_jobs = CsvJobQueue(
+    Path(settings.CSV_JOBS_DIR),
+    retention_seconds=settings.CSV_JOB_RETENTION_SECONDS,
+)
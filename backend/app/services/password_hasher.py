@@ -0,0 +1,122 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, TypeVar
+
+from app.core.config import settings
+from app.core.security import (
+    get_password_hash,
+    get_password_hashes,
+    verify_password,
+)
+from app.models import PasswordHasherStats
+
+T = TypeVar("T")
+
+# Password per chiamata in hash_many: blocchi piccoli lasciano passare i
+# login tra un blocco e l'altro
+HASH_MANY_CHUNK_SIZE = 8
+
+
+class PasswordHasher:
+    """Hash e verifica bcrypt in un pool di processi dedicato.
+
+    Ogni chiamata costa circa 250 ms di CPU: nei thread delle richieste
+    terrebbe il GIL e bloccherebbe gli altri endpoint durante i picchi di
+    login. Al massimo `max_concurrency` chiamate occupano il pool; le altre
+    attendono sull'event loop e sono contate in `waiting`.
+    """
+
+    def __init__(self, *, workers: int, max_concurrency: int) -> None:
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self.running = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: come in executors, fork non è sicuro con thread attivi
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        slots = self._slots
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_pool(), functools.partial(func, *args)
+            )
+        finally:
+            self.running -= 1
+            self.completed += 1
+            slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def hash_many(self, passwords: Sequence[str]) -> list[str]:
+        """Hash di molte password in parallelo sui processi del pool.
+
+        I blocchi occupano al più metà degli slot, così un import massivo non
+        ferma i login in corso.
+        """
+        batch_slots = asyncio.Semaphore(max(1, self.max_concurrency // 2))
+
+        async def hash_chunk(chunk: list[str]) -> list[str]:
+            async with batch_slots:
+                return await self._run(get_password_hashes, chunk)
+
+        chunks = [
+            list(passwords[i : i + HASH_MANY_CHUNK_SIZE])
+            for i in range(0, len(passwords), HASH_MANY_CHUNK_SIZE)
+        ]
+        hashed = await asyncio.gather(*(hash_chunk(chunk) for chunk in chunks))
+        return [hashed_password for chunk in hashed for hashed_password in chunk]
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    def stats(self) -> PasswordHasherStats:
+        return PasswordHasherStats(
+            workers=self.workers,
+            max_concurrency=self.max_concurrency,
+            running=self.running,
+            waiting=self.waiting,
+            peak_waiting=self.peak_waiting,
+            completed=self.completed,
+        )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            # Il semaforo è legato all'event loop che lo ha usato
+            self._slots = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_concurrency=settings.PASSWORD_HASH_MAX_CONCURRENCY,
+)
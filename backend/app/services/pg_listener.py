@@ -0,0 +1,100 @@
+import logging
+import threading
+from collections.abc import Callable
+
+import psycopg
+from sqlalchemy import Engine
+
+from app.core.db import engine
+
+logger = logging.getLogger(__name__)
+
+# Riceve il payload della NOTIFY, oppure None dopo una riconnessione: le
+# notifiche arrivate nel frattempo sono perse e va invalidato tutto
+NotifyCallback = Callable[[str | None], None]
+
+
+class PgListener:
+    """Un'unica connessione LISTEN per processo, condivisa tra i canali.
+
+    Le notifiche arrivate nello stesso secondo vengono raggruppate: ogni
+    coppia (canale, payload) produce una sola chiamata.
+    """
+
+    def __init__(self, db_engine: Engine, *, retry_seconds: float) -> None:
+        self._engine = db_engine
+        self._retry_seconds = retry_seconds
+        self._callbacks: dict[str, list[NotifyCallback]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self, channel: str, callback: NotifyCallback) -> None:
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+    def unsubscribe(self, channel: str, callback: NotifyCallback) -> None:
+        with self._lock:
+            callbacks = self._callbacks.get(channel, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._callbacks.pop(channel, None)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pg-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _dispatch(self, channel: str, payload: str | None) -> None:
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.warning("Gestione della notifica %s fallita: %s", channel, e)
+
+    def _run(self) -> None:
+        dsn = self._engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        reconnect = False
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(dsn, autocommit=True) as conn:
+                    listening: set[str] = set()
+                    while not self._stop.is_set():
+                        # L'elenco dei canali può cambiare mentre si ascolta
+                        with self._lock:
+                            channels = set(self._callbacks)
+                        for channel in channels - listening:
+                            conn.execute(f"LISTEN {channel}")
+                            if reconnect:
+                                self._dispatch(channel, None)
+                        for channel in listening - channels:
+                            conn.execute(f"UNLISTEN {channel}")
+                        listening = channels
+
+                        received: dict[tuple[str, str], None] = {}
+                        for notify in conn.notifies(timeout=1.0):
+                            received[(notify.channel, notify.payload)] = None
+                        for channel, payload in received:
+                            self._dispatch(channel, payload)
+            except Exception as e:
+                logger.warning("Listener PostgreSQL interrotto: %s", e)
+                self._stop.wait(self._retry_seconds)
+            reconnect = True
+
+
+pg_listener = PgListener(engine, retry_seconds=30)
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+from sqlalchemy import Engine, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import RateLimitStats
+
+
+class RateLimitBackend(Protocol):
+    def take(self, key: str, *, capacity: float, rate: float) -> float:
+        """Consuma un gettone del bucket `key`.
+
+        Restituisce 0 se la richiesta passa, altrimenti i secondi da
+        attendere. Il bucket si riempie di `rate` gettoni al secondo, fino a
+        `capacity`.
+        """
+        ...
+
+    def reset(self) -> None: ...
+
+
+class MemoryBackend:
+    """Bucket in memoria, per processo: ogni worker ha i suoi limiti.
+
+    Le chiavi sono al più `max_keys`; oltre si scartano quelle usate meno di
+    recente, così nomi utente inventati non fanno crescere la memoria.
+    """
+
+    def __init__(self, *, max_keys: int) -> None:
+        self._max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, *, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class PostgresBackend:
+    """Bucket condivisi tra worker e repliche dell'API.
+
+    Una sola chiamata alla funzione `rate_limit_take` (tabella UNLOGGED,
+    vedi la migrazione): costa una query, ma niente hash né lettura utenti.
+    """
+
+    def __init__(self, db_engine: Engine, *, cleanup_seconds: float = 600) -> None:
+        self._engine = db_engine
+        self._cleanup_seconds = cleanup_seconds
+        self._next_cleanup = time.monotonic() + cleanup_seconds
+        # Oltre questo tempo senza tentativi un bucket è di nuovo pieno
+        self._max_refill_seconds = 0.0
+
+    def take(self, key: str, *, capacity: float, rate: float) -> float:
+        self._max_refill_seconds = max(self._max_refill_seconds, capacity / rate)
+        with self._engine.begin() as conn:
+            retry_after = conn.execute(
+                text("SELECT rate_limit_take(:key, :capacity, :rate)"),
+                {"key": key, "capacity": capacity, "rate": rate},
+            ).scalar_one()
+            if time.monotonic() >= self._next_cleanup:
+                self._next_cleanup = time.monotonic() + self._cleanup_seconds
+                # Un bucket pieno equivale a uno assente
+                conn.execute(
+                    text(
+                        "DELETE FROM rate_limit_bucket WHERE updated_at < "
+                        "clock_timestamp() - make_interval(secs => :seconds)"
+                    ),
+                    {"seconds": self._max_refill_seconds},
+                )
+        return float(retry_after)
+
+    def reset(self) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(text("DELETE FROM rate_limit_bucket"))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Troppe richieste, riprovare tra {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class LoginThrottle:
+    """Limiti per IP e per nome utente su login e recupero password.
+
+    Il limite per IP ferma chi prova molte credenziali da un solo indirizzo;
+    quello per nome utente chi prova molte password sullo stesso account da
+    indirizzi diversi.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        *,
+        ip_burst: int,
+        ip_per_minute: float,
+        username_burst: int,
+        username_per_minute: float,
+    ) -> None:
+        self.backend = backend
+        self._ip_limit = (float(ip_burst), ip_per_minute / 60)
+        self._username_limit = (float(username_burst), username_per_minute / 60)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected_ip = 0
+        self.rejected_username = 0
+
+    def check(self, *, ip: str | None, username: str) -> None:
+        """Consuma un tentativo; solleva RateLimited se un limite è superato."""
+        # Se l'IP è già bloccato non si consuma il bucket dell'utente
+        if ip is not None:
+            capacity, rate = self._ip_limit
+            retry_after = self.backend.take(f"ip:{ip}", capacity=capacity, rate=rate)
+            if retry_after > 0:
+                self._count("rejected_ip")
+                raise RateLimited(retry_after)
+        capacity, rate = self._username_limit
+        key = f"user:{username.strip().lower()}"
+        retry_after = self.backend.take(key, capacity=capacity, rate=rate)
+        if retry_after > 0:
+            self._count("rejected_username")
+            raise RateLimited(retry_after)
+        self._count("allowed")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> RateLimitStats:
+        return RateLimitStats(
+            allowed=self.allowed,
+            rejected_ip=self.rejected_ip,
+            rejected_username=self.rejected_username,
+        )
+
+    def reset(self) -> None:
+        self.backend.reset()
+        with self._lock:
+            self.allowed = self.rejected_ip = self.rejected_username = 0
+
+
+def _backend() -> RateLimitBackend:
+    if settings.LOGIN_RATE_LIMIT_BACKEND == "postgres":
+        return PostgresBackend(engine)
+    return MemoryBackend(max_keys=settings.LOGIN_RATE_LIMIT_MAX_KEYS)
+
+
+login_throttle = LoginThrottle(
+    _backend(),
+    ip_burst=settings.LOGIN_RATE_LIMIT_IP_BURST,
+    ip_per_minute=settings.LOGIN_RATE_LIMIT_IP_PER_MINUTE,
+    username_burst=settings.LOGIN_RATE_LIMIT_USERNAME_BURST,
+    username_per_minute=settings.LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE,
+)
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO
+
+from app.core.config import settings
+from app.models import CsvCacheStats
+from app.services.csv_filter import OUTPUT_CHUNK_SIZE, READ_CHUNK_SIZE, ByteSource
+
+logger = logging.getLogger(__name__)
+
+# Da incrementare quando cambia il formato dell'output filtrato
+CACHE_VERSION = "1"
+
+
+def iter_file(handle: IO[bytes]) -> Iterator[bytes]:
+    """Legge un file a blocchi e lo chiude al termine."""
+    with handle:
+        while chunk := handle.read(OUTPUT_CHUNK_SIZE):
+            yield chunk
+
+
+def key_hasher(fingerprint: str, *, subtotali: bool) -> "hashlib._Hash":
+    """SHA-256 della chiave, da aggiornare con i byte caricati.
+
+    Così la chiave si calcola mentre l'upload viene letto per elaborarlo,
+    senza una lettura in più.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{CACHE_VERSION}:{fingerprint}:{int(subtotali)}:".encode())
+    return digest
+
+
+def cache_key(source: ByteSource, fingerprint: str, *, subtotali: bool) -> str:
+    """Chiave del risultato: SHA-256 dei byte caricati e dei codici validi."""
+    digest = key_hasher(fingerprint, subtotali=subtotali)
+    while chunk := source.read(READ_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CsvResultCache:
+    """Cache su disco dei CSV filtrati, indirizzata per contenuto.
+
+    Ogni risultato è un file `<chiave>.csv`; l'mtime segna l'ultimo utilizzo
+    e, superato `max_bytes`, vengono rimossi i file usati meno di recente.
+    I contatori di hit e miss sono per processo.
+    """
+
+    def __init__(self, cache_dir: Path, *, max_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Path | None:
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def open(self, key: str) -> tuple[IO[bytes], IO[bytes]] | None:
+        """Il risultato aperto due volte: per la risposta e per il salvataggio.
+
+        I file restano leggibili anche se nel frattempo escono dalla cache; se
+        il risultato viene rimosso prima che siano aperti entrambi è un miss.
+        """
+        path = self._path(key)
+        handles: list[IO[bytes]] = []
+        try:
+            os.utime(path)
+            for _ in range(2):
+                handles.append(path.open("rb"))
+        except FileNotFoundError:
+            for handle in handles:
+                handle.close()
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return handles[0], handles[1]
+
+    def put(self, key: str, content: bytes) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._tmp_path(key)
+        tmp.write_bytes(content)
+        self._commit(tmp, key)
+
+    def tee(self, key: str, chunks: Iterator[str]) -> Iterator[str]:
+        """Restituisce i blocchi invariati salvandoli in cache.
+
+        Il risultato viene memorizzato solo se l'elaborazione arriva in fondo.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._tmp_path(key)
+        try:
+            with tmp.open("w", encoding="utf-8", newline="") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                    yield chunk
+            self._commit(tmp, key)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def stats(self) -> CsvCacheStats:
+        files = self._entries()
+        return CsvCacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            entries=len(files),
+            size_bytes=sum(size for _, size, _ in files),
+            max_bytes=self.max_bytes,
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.csv"
+
+    def _tmp_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _commit(self, tmp: Path, key: str) -> None:
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def _entries(self) -> list[tuple[Path, int, float]]:
+        if not self.cache_dir.is_dir():
+            return []
+        entries = []
+        for path in self.cache_dir.glob("*.csv"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.info("Rimosso dalla cache il risultato %s", path.name)
+
+
+csv_cache = CsvResultCache(
+    Path(settings.CSV_CACHE_DIR), max_bytes=settings.CSV_CACHE_MAX_BYTES
+)
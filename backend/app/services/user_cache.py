@@ -0,0 +1,90 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.models import User
+from app.services.pg_listener import pg_listener
+
+# Canale su cui il trigger di "user" segnala l'id dell'utente modificato
+USERS_CHANNEL = "users_changed"
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Quanto serve per autorizzare una richiesta, senza l'oggetto ORM."""
+
+    id: uuid.UUID
+    is_active: bool
+    is_superuser: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(id=user.id, is_active=user.is_active, is_superuser=user.is_superuser)
+
+
+class UserCache:
+    """Cache LRU con scadenza breve degli utenti autenticati, per id.
+
+    Evita la lettura di "user" a ogni richiesta. Le route che modificano un
+    utente la invalidano subito; gli altri worker lo sanno dalla NOTIFY su
+    `USERS_CHANNEL` e, se questa va persa, alla scadenza della voce.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, UserPrincipal]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Come in VersionsCache: un utente letto prima di un'invalidazione
+        # non deve finire in cache
+        self.generation = 0
+
+    def get(self, user_id: str) -> UserPrincipal | None:
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached is None:
+                return None
+            expires_at, principal = cached
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, user_id: str, principal: UserPrincipal, *, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = (time.monotonic() + self._ttl_seconds, principal)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: uuid.UUID | str | None = None) -> None:
+        """Scarta un utente, o tutti se `user_id` è None."""
+        with self._lock:
+            self.generation += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(user_id), None)
+
+    def start(self) -> None:
+        if settings.USER_CACHE_LISTEN:
+            pg_listener.subscribe(USERS_CHANNEL, self._on_notify)
+
+    def stop(self) -> None:
+        pg_listener.unsubscribe(USERS_CHANNEL, self._on_notify)
+
+    def _on_notify(self, payload: str | None) -> None:
+        # Payload vuoto (TRUNCATE) o riconnessione: si scarta tutto
+        self.invalidate(payload or None)
+
+
+user_cache = UserCache(
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+)
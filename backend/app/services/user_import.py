@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import uuid
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import User, UserCreate, UserImportResult, UsersImportReport
+from app.services.password_hasher import password_hasher
+
+ImportFormat = Literal["csv", "jsonl"]
+
+# Una riga del file: il numero di riga e i campi, oppure il motivo per cui
+# non si è potuta leggere
+ParsedRow = tuple[int, dict[str, Any] | str]
+
+
+class UserImportError(Exception):
+    pass
+
+
+@dataclass
+class CreatedUser:
+    """Utente creato dall'import, con la password in chiaro per la email."""
+
+    id: uuid.UUID
+    email: str
+    password: str
+
+
+def detect_format(filename: str | None, content_type: str | None) -> ImportFormat:
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or content_type in (
+        "application/jsonl",
+        "application/x-ndjson",
+    ):
+        return "jsonl"
+    if name.endswith(".csv") or content_type == "text/csv":
+        return "csv"
+    raise UserImportError("Unsupported file: upload a .csv or .jsonl file")
+
+
+def parse_rows(data: bytes, fmt: ImportFormat) -> Iterator[ParsedRow]:
+    """Righe del file; nei CSV la prima riga è l'intestazione (email, password, ...)."""
+    try:
+        content = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise UserImportError("The file must be UTF-8 encoded")
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(content))
+        try:
+            for record in reader:
+                # Celle vuote come campi assenti: full_name resta None
+                yield reader.line_num, {k: v for k, v in record.items() if k and v}
+        except csv.Error as e:
+            # Es. un campo oltre csv.field_size_limit(): il resto del file
+            # non si può leggere
+            raise UserImportError(f"Invalid CSV at line {reader.line_num}: {e}")
+        return
+    for line, text in enumerate(content.splitlines(), start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except json.JSONDecodeError as e:
+            yield line, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield line, "Each line must be a JSON object"
+            continue
+        yield line, record
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}"
+        for e in error.errors()
+    )
+
+
+async def import_users(
+    session: AsyncSession, rows: Sequence[ParsedRow], *, batch_size: int
+) -> tuple[UsersImportReport, list[CreatedUser]]:
+    """Crea gli utenti di `rows` che non esistono ancora.
+
+    Per ogni blocco: una query sull'indice ix_user_email per scartare quelli
+    già presenti, gli hash in parallelo nel pool di processi e un unico
+    INSERT multi-riga. Ogni blocco è una transazione a sé.
+    """
+    results: dict[int, UserImportResult] = {}
+    valid: list[tuple[int, UserCreate]] = []
+    seen: set[str] = set()
+    for line, record in rows:
+        if isinstance(record, str):
+            results[line] = UserImportResult(line=line, status="invalid", detail=record)
+            continue
+        try:
+            user_in = UserCreate.model_validate(record)
+        except ValidationError as e:
+            email = record.get("email")
+            results[line] = UserImportResult(
+                line=line,
+                email=email if isinstance(email, str) else None,
+                status="invalid",
+                detail=_validation_detail(e),
+            )
+            continue
+        if user_in.email in seen:
+            results[line] = UserImportResult(
+                line=line, email=user_in.email, status="duplicate"
+            )
+            continue
+        seen.add(user_in.email)
+        valid.append((line, user_in))
+
+    created: list[CreatedUser] = []
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start : start + batch_size]
+        emails = [user_in.email for _, user_in in batch]
+        existing = set(
+            await session.exec(select(User.email).where(col(User.email).in_(emails)))
+        )
+        to_create = [
+            (line, user_in) for line, user_in in batch if user_in.email not in existing
+        ]
+        inserted: dict[str, uuid.UUID] = {}
+        if to_create:
+            hashes = await password_hasher.hash_many(
+                [user_in.password for _, user_in in to_create]
+            )
+            values = [
+                {
+                    "id": uuid.uuid4(),
+                    "email": user_in.email,
+                    "hashed_password": hashed_password,
+                    "full_name": user_in.full_name,
+                    "is_active": user_in.is_active,
+                    "is_superuser": user_in.is_superuser,
+                }
+                for (_, user_in), hashed_password in zip(to_create, hashes, strict=True)
+            ]
+            # Un utente creato nel frattempo da un'altra richiesta non fa
+            # fallire il blocco: risulta "exists"
+            statement = (
+                insert(User)
+                .values(values)
+                .on_conflict_do_nothing(index_elements=["email"])
+                .returning(col(User.email), col(User.id))
+            )
+            result = await session.execute(statement)
+            inserted = dict(result.tuples().all())
+            await session.commit()
+        for line, user_in in batch:
+            user_id = inserted.get(user_in.email)
+            if user_id is None:
+                results[line] = UserImportResult(
+                    line=line, email=user_in.email, status="exists"
+                )
+                continue
+            results[line] = UserImportResult(
+                line=line, email=user_in.email, status="created", id=user_id
+            )
+            created.append(
+                CreatedUser(id=user_id, email=user_in.email, password=user_in.password)
+            )
+
+    ordered = [results[line] for line in sorted(results)]
+    invalid = sum(result.status == "invalid" for result in ordered)
+    report = UsersImportReport(
+        created=len(created),
+        skipped=len(ordered) - len(created) - invalid,
+        invalid=invalid,
+        results=ordered,
+    )
+    return report, created
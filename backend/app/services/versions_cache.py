@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+
+from app.core.config import settings
+from app.models import BaseVersion
+from app.services.pg_listener import pg_listener
+
+# Canale su cui il trigger di `versions` segnala il giorno modificato
+VERSIONS_CHANNEL = "versions_changed"
+
+
+@dataclass(frozen=True)
+class CachedVersion:
+    version: BaseVersion
+    etag: str
+    expires_at: float
+
+
+def version_etag(version: BaseVersion) -> str:
+    # ETag forte: cambia solo se cambia il corpo della risposta
+    body = version.model_dump_json().encode()
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+class VersionsCache:
+    """Cache LRU con scadenza delle versioni per giorno.
+
+    Le voci vengono invalidate dalle NOTIFY su `VERSIONS_CHANNEL` inviate
+    dal trigger sulla tabella; la scadenza dopo `ttl_seconds` copre il caso
+    in cui il listener non sia connesso.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: OrderedDict[date, CachedVersion] = OrderedDict()
+        self._lock = threading.Lock()
+        # Incrementato a ogni invalidazione: un valore letto dal database
+        # prima di un'invalidazione non deve finire in cache
+        self.generation = 0
+
+    def get(self, giorno: date) -> CachedVersion | None:
+        with self._lock:
+            cached = self._entries.get(giorno)
+            if cached is None:
+                return None
+            if cached.expires_at <= time.monotonic():
+                del self._entries[giorno]
+                return None
+            self._entries.move_to_end(giorno)
+            return cached
+
+    def put(self, version: BaseVersion, *, generation: int) -> CachedVersion:
+        """Memorizza la versione letta quando `generation` era quella corrente."""
+        # Solo i campi della risposta, anche se arriva una riga di `Versions`
+        base = BaseVersion(giorno=version.giorno, versione=version.versione)
+        cached = CachedVersion(
+            version=base,
+            etag=version_etag(base),
+            expires_at=time.monotonic() + self._ttl_seconds,
+        )
+        with self._lock:
+            if generation != self.generation:
+                return cached
+            self._entries[version.giorno] = cached
+            self._entries.move_to_end(version.giorno)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, giorno: date | None = None) -> None:
+        with self._lock:
+            self.generation += 1
+            if giorno is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(giorno, None)
+
+    def start(self) -> None:
+        if settings.VERSIONS_CACHE_LISTEN:
+            pg_listener.subscribe(VERSIONS_CHANNEL, self._on_notify)
+
+    def stop(self) -> None:
+        pg_listener.unsubscribe(VERSIONS_CHANNEL, self._on_notify)
+
+    def _on_notify(self, payload: str | None) -> None:
+        # Payload vuoto (TRUNCATE) o riconnessione: si svuota tutto
+        try:
+            self.invalidate(date.fromisoformat(payload) if payload else None)
+        except ValueError:
+            self.invalidate()
+
+
+versions_cache = VersionsCache(
+    ttl_seconds=settings.VERSIONS_CACHE_TTL_SECONDS,
+    max_entries=settings.VERSIONS_CACHE_MAX_ENTRIES,
+)
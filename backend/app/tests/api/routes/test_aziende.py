@@ -0,0 +1,177 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.services.aziende_cache import aziende_search_cache
+from app.tests.utils.azienda import create_random_azienda
+from app.tests.utils.utils import random_lower_string
+
+AZIENDA = {
+    "codice": "AZTEST1",
+    "ragione_sociale": "Trasporti Bianchi SRL",
+    "nazione": "Italia",
+    "provincia": "TO",
+    "citta": "Torino",
+    "via": "Via Po 1",
+    "cap": "10100",
+    "partita_iva": "01234567890",
+}
+
+
+def _search(
+    client: TestClient, headers: dict[str, str], q: str, limit: int = 10
+) -> list[str]:
+    response = client.get(
+        f"{settings.API_V1_STR}/aziende/search",
+        headers=headers,
+        params={"q": q, "limit": limit},
+    )
+    assert response.status_code == 200
+    return [azienda["codice"] for azienda in response.json()]
+
+
+def test_create_azienda(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/aziende/",
+        headers=superuser_token_headers,
+        json=AZIENDA,
+    )
+    assert response.status_code == 200
+    assert response.json()["codice"] == AZIENDA["codice"]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/aziende/",
+        headers=superuser_token_headers,
+        json=AZIENDA,
+    )
+    assert response.status_code == 400
+
+
+def test_create_azienda_requires_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/aziende/",
+        headers=normal_user_token_headers,
+        json={**AZIENDA, "codice": "AZTEST2"},
+    )
+    assert response.status_code == 403
+
+
+def test_read_azienda(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    azienda = create_random_azienda(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/aziende/{azienda.codice}",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["ragione_sociale"] == azienda.ragione_sociale
+
+    response = client.get(
+        f"{settings.API_V1_STR}/aziende/NOPE",
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 404
+
+
+def test_read_aziende_paginated(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_azienda(db)
+    create_random_azienda(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/aziende/",
+        headers=normal_user_token_headers,
+        params={"limit": 1},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] >= 2
+    assert len(content["data"]) == 1
+
+    response = client.get(
+        f"{settings.API_V1_STR}/aziende/",
+        headers=normal_user_token_headers,
+        params={"skip": 1, "limit": 1},
+    )
+    assert response.json()["data"][0]["codice"] > content["data"][0]["codice"]
+
+
+def test_search_aziende(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    nome = "Zqx" + random_lower_string()[:8]
+    prima = create_random_azienda(db, ragione_sociale=f"{nome} Logistica")
+    seconda = create_random_azienda(db, ragione_sociale=f"Gruppo {nome}")
+    aziende_search_cache.invalidate()
+
+    # Sotto AZIENDE_SEARCH_MIN_SUBSTRING caratteri solo per prefisso
+    assert _search(client, normal_user_token_headers, nome[:2]) == [prima.codice]
+    # Poi anche per sottostringa, dopo i risultati per prefisso e senza
+    # distinguere maiuscole e minuscole
+    assert _search(client, normal_user_token_headers, nome.upper()) == [
+        prima.codice,
+        seconda.codice,
+    ]
+    assert _search(client, normal_user_token_headers, nome, limit=1) == [prima.codice]
+    assert _search(client, normal_user_token_headers, prima.codice.lower()) == [
+        prima.codice
+    ]
+    # I caratteri jolly di LIKE sono cercati come testo
+    assert _search(client, normal_user_token_headers, "%") == []
+
+
+def test_search_aziende_by_partita_iva(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    azienda = create_random_azienda(db, partita_iva="98765432109")
+    aziende_search_cache.invalidate()
+    assert azienda.codice in _search(client, normal_user_token_headers, "9876543")
+
+
+def test_search_is_cached_until_updated(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    azienda = create_random_azienda(db, ragione_sociale="Wqy Cache SRL")
+    aziende_search_cache.invalidate()
+    assert _search(client, superuser_token_headers, "wqy") == [azienda.codice]
+
+    # Modifica senza passare dall'API: la cache restituisce ancora il
+    # risultato precedente finché non arriva l'invalidazione
+    azienda.ragione_sociale = "Altro nome SRL"
+    db.add(azienda)
+    db.commit()
+    aziende_search_cache._on_notify("")
+    assert _search(client, superuser_token_headers, "wqy") == []
+
+    response = client.put(
+        f"{settings.API_V1_STR}/aziende/{azienda.codice}",
+        headers=superuser_token_headers,
+        json={"ragione_sociale": "Wqy Di Nuovo SRL"},
+    )
+    assert response.status_code == 200
+    assert _search(client, superuser_token_headers, "wqy") == [azienda.codice]
+
+    response = client.delete(
+        f"{settings.API_V1_STR}/aziende/{azienda.codice}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    assert _search(client, superuser_token_headers, "wqy") == []
+
+
+def test_search_requires_query(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/aziende/search",
+        headers=normal_user_token_headers,
+        params={"q": ""},
+    )
+    assert response.status_code == 422
@@ -1,5 +1,7 @@
+from collections.abc import Generator
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
@@ -7,6 +9,7 @@ from app.core.config import settings
 from app.core.security import verify_password
 from app.crud import create_user
 from app.models import UserCreate
+from app.services.rate_limit import login_throttle
 from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 from app.utils import generate_password_reset_token
@@ -33,6 +36,68 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_throttled_by_username(client: TestClient) -> None:
+    login_data = {"username": random_email(), "password": "incorrect"}
+    with patch("app.api.routes.login.crud.authenticate_async") as authenticate:
+        authenticate.return_value = None
+        for _ in range(settings.LOGIN_RATE_LIMIT_USERNAME_BURST):
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token", data=login_data
+            )
+            assert r.status_code == 400
+        rejected = login_throttle.rejected_username
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) > 0
+    # Respinta prima di cercare l'utente
+    assert authenticate.call_count == settings.LOGIN_RATE_LIMIT_USERNAME_BURST
+    assert login_throttle.rejected_username == rejected + 1
+
+
+@pytest.fixture
+def ip_buckets() -> Generator[None, None, None]:
+    # Questi test esauriscono il bucket dell'IP condiviso dagli altri test
+    login_throttle.reset()
+    yield
+    login_throttle.reset()
+
+
+def _login_from(client: TestClient, forwarded_for: str) -> int:
+    # Un nome utente nuovo ogni volta: conta solo il limite per IP
+    login_data = {"username": random_email(), "password": "incorrect"}
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data=login_data,
+        headers={"X-Forwarded-For": forwarded_for},
+    )
+    return r.status_code
+
+
+@pytest.mark.usefixtures("ip_buckets")
+def test_get_access_token_throttled_per_forwarded_client(client: TestClient) -> None:
+    with (
+        patch("app.api.routes.login.crud.authenticate_async") as authenticate,
+        patch.object(settings, "FORWARDED_ALLOW_IPS", ["testclient", "10.0.0.0/8"]),
+    ):
+        authenticate.return_value = None
+        for _ in range(settings.LOGIN_RATE_LIMIT_IP_BURST):
+            assert _login_from(client, "203.0.113.1, 10.0.0.7") == 400
+        assert _login_from(client, "203.0.113.1") == 429
+        # Un altro client dietro lo stesso proxy ha il suo bucket
+        assert _login_from(client, "203.0.113.2, 10.0.0.7") == 400
+        # Il primo indirizzo non fidato da destra è il client
+        assert _login_from(client, "203.0.113.2, 203.0.113.1") == 429
+
+
+@pytest.mark.usefixtures("ip_buckets")
+def test_get_access_token_ignores_untrusted_forwarded_for(client: TestClient) -> None:
+    with patch("app.api.routes.login.crud.authenticate_async") as authenticate:
+        authenticate.return_value = None
+        for i in range(settings.LOGIN_RATE_LIMIT_IP_BURST):
+            assert _login_from(client, f"203.0.113.{i}") == 400
+        assert _login_from(client, "198.51.100.1") == 429
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
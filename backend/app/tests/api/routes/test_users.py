@@ -2,12 +2,14 @@ import uuid
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlalchemy import text
+from sqlmodel import Session, col, select
 
 from app import crud
 from app.core.config import settings
 from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.models import EmailOutbox, User, UserCreate
+from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -168,6 +170,165 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_with_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(2):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+    db.execute(text('ANALYZE "user"'))
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 1, "count": "estimated"},
+    )
+    first_page = r.json()
+    assert r.status_code == 200
+    assert first_page["count"] >= 2
+    assert first_page["next_cursor"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 1, "cursor": first_page["next_cursor"]},
+    )
+    second_page = r.json()
+    assert second_page["data"][0]["id"] > first_page["data"][0]["id"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"skip": 1, "limit": 1},
+    )
+    assert r.json()["data"] == second_page["data"]
+
+
+def test_import_users_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    existing = random_email()
+    crud.create_user(
+        session=db, user_create=UserCreate(email=existing, password="password123")
+    )
+    new1, new2 = random_email(), random_email()
+    content = "\n".join(
+        [
+            "email,password,full_name",
+            f"{new1},password123,Mario Rossi",
+            f"{existing},password123,",
+            f"{new2},password123,",
+            f"{new1},password456,",
+            "not-an-email,password123,",
+            f"{random_email()},short,",
+        ]
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=superuser_token_headers,
+        files={"file": ("users.csv", content, "text/csv")},
+    )
+    assert r.status_code == 200
+    report = r.json()
+    assert (report["created"], report["skipped"], report["invalid"]) == (2, 2, 2)
+    statuses = [(row["line"], row["status"]) for row in report["results"]]
+    assert statuses == [
+        (2, "created"),
+        (3, "exists"),
+        (4, "created"),
+        (5, "duplicate"),
+        (6, "invalid"),
+        (7, "invalid"),
+    ]
+
+    user = crud.get_user_by_email(session=db, email=new1)
+    assert user
+    assert str(user.id) == report["results"][0]["id"]
+    assert user.full_name == "Mario Rossi"
+    assert verify_password("password123", user.hashed_password)
+
+
+def test_import_users_jsonl(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    content = "\n".join(
+        [
+            f'{{"email": "{email}", "password": "password123", "is_superuser": true}}',
+            "{not json",
+        ]
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=superuser_token_headers,
+        files={"file": ("users.jsonl", content, "application/octet-stream")},
+    )
+    assert r.status_code == 200
+    report = r.json()
+    assert [row["status"] for row in report["results"]] == ["created", "invalid"]
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    assert user.is_superuser
+
+
+def test_import_users_notify_queues_emails(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    emails = [random_email(), random_email()]
+    content = "email,password\n" + "".join(f"{e},password123\n" for e in emails)
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "admin@example.com"),
+    ):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import?notify=true",
+            headers=superuser_token_headers,
+            files={"file": ("users.csv", content, "text/csv")},
+        )
+    assert r.status_code == 200
+    queued = db.exec(
+        select(EmailOutbox.email_to).where(col(EmailOutbox.email_to).in_(emails))
+    ).all()
+    assert sorted(queued) == sorted(emails)
+
+
+def test_import_users_unsupported_file(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=superuser_token_headers,
+        files={"file": ("users.xlsx", b"x", "application/octet-stream")},
+    )
+    assert r.status_code == 400
+
+
+def test_import_users_csv_field_too_large(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    content = (
+        f"email,password,full_name\n{random_email()},password123,{'x' * 200_000}\n"
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=superuser_token_headers,
+        files={"file": ("users.csv", content, "text/csv")},
+    )
+    assert r.status_code == 400
+    assert "line" in r.json()["detail"]
+
+
+def test_import_users_by_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=normal_user_token_headers,
+        files={"file": ("users.csv", "email,password\n", "text/csv")},
+    )
+    assert r.status_code == 403
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -346,6 +507,32 @@ def test_update_user(
     assert user_db.full_name == "Updated_full_name"
 
 
+def test_update_user_deactivation_takes_effect(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=username, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    # Il primo accesso mette l'utente nella cache
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
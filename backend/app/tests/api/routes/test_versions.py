@@ -0,0 +1,561 @@
+import gzip
+import io
+import json
+import time
+import uuid
+import zipfile
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from httpx import Response
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.services.result_cache import CsvResultCache
+from app.services.versions_cache import versions_cache
+
+CSV = (
+    "Data;Codice committente;Importo totale\r\n"
+    "01/01;2282;1.000,50\r\n"
+    "01/01;9999;5,00\r\n"
+    "02/01;2282;10,25\r\n"
+)
+
+
+def test_read_version_etag(client: TestClient, db: Session) -> None:
+    url = f"{settings.API_V1_STR}/versions/2024-02-01"
+    versions_cache.invalidate()
+    r = client.get(url)
+    assert r.status_code == 200
+    assert r.json() == {"giorno": "2024-02-01", "versione": "0"}
+    assert r.headers["cache-control"] == "no-cache"
+    etag = r.headers["etag"]
+
+    # Dalla cache, senza query
+    with patch("app.api.routes.versions.select", side_effect=AssertionError):
+        r = client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["etag"] == etag
+    assert r.content == b""
+
+    # Il trigger sulla tabella invalida la cache via NOTIFY
+    db.execute(
+        text("INSERT INTO versions (giorno, versione) VALUES ('2024-02-01', '7')")
+    )
+    db.commit()
+    try:
+        for _ in range(50):
+            r = client.get(url, headers={"If-None-Match": etag})
+            if r.status_code == 200:
+                break
+            time.sleep(0.1)
+        assert r.status_code == 200
+        assert r.json()["versione"] == "7"
+        assert r.headers["etag"] != etag
+    finally:
+        db.execute(text("DELETE FROM versions WHERE giorno = '2024-02-01'"))
+        db.commit()
+
+
+@pytest.fixture
+def versions(db: Session) -> Iterator[None]:
+    db.execute(
+        text(
+            "INSERT INTO versions (giorno, versione) "
+            "VALUES ('2024-03-02', '3'), ('2024-03-04', '5')"
+        )
+    )
+    db.commit()
+    yield
+    db.execute(
+        text("DELETE FROM versions WHERE giorno IN ('2024-03-02', '2024-03-04')")
+    )
+    db.commit()
+
+
+@pytest.mark.usefixtures("versions")
+def test_read_versions_range(client: TestClient) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/",
+        params={"from": "2024-03-01", "to": "2024-03-05"},
+    )
+    assert r.status_code == 200
+    assert r.json()["count"] == 5
+    assert [(v["giorno"], v["versione"]) for v in r.json()["data"]] == [
+        ("2024-03-01", "0"),
+        ("2024-03-02", "3"),
+        ("2024-03-03", "0"),
+        ("2024-03-04", "5"),
+        ("2024-03-05", "0"),
+    ]
+
+
+@pytest.mark.usefixtures("versions")
+def test_read_versions_range_ndjson(client: TestClient) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/",
+        params={"from": "2024-03-02", "to": "2024-03-03"},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in r.text.splitlines()] == [
+        {"giorno": "2024-03-02", "versione": "3"},
+        {"giorno": "2024-03-03", "versione": "0"},
+    ]
+
+    # Oltre la soglia si passa comunque allo streaming
+    with patch.object(settings, "VERSIONS_RANGE_JSON_MAX_DAYS", 3):
+        r = client.get(
+            f"{settings.API_V1_STR}/versions/",
+            params={"from": "2024-03-01", "to": "2024-03-04"},
+        )
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert len(r.text.splitlines()) == 4
+
+
+def test_read_versions_range_up_to_date_max(client: TestClient) -> None:
+    for headers in ({}, {"Accept": "application/x-ndjson"}):
+        r = client.get(
+            f"{settings.API_V1_STR}/versions/",
+            params={"from": "9999-12-30", "to": "9999-12-31"},
+            headers=headers,
+        )
+        assert r.status_code == 200
+        assert "9999-12-31" in r.text
+
+
+def test_read_versions_invalid_range(client: TestClient) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/",
+        params={"from": "2024-03-05", "to": "2024-03-01"},
+    )
+    assert r.status_code == 400
+
+
+def test_read_versions_range_too_long(client: TestClient) -> None:
+    for headers in ({}, {"Accept": "application/x-ndjson"}):
+        r = client.get(
+            f"{settings.API_V1_STR}/versions/",
+            params={"from": "0001-01-01", "to": "9999-12-31"},
+            headers=headers,
+        )
+        assert r.status_code == 400
+    with patch.object(settings, "VERSIONS_RANGE_MAX_DAYS", 3):
+        r = client.get(
+            f"{settings.API_V1_STR}/versions/",
+            params={"from": "2024-03-01", "to": "2024-03-03"},
+            headers={"Accept": "application/x-ndjson"},
+        )
+        assert r.status_code == 200
+        r = client.get(
+            f"{settings.API_V1_STR}/versions/",
+            params={"from": "2024-03-01", "to": "2024-03-04"},
+            headers={"Accept": "application/x-ndjson"},
+        )
+        assert r.status_code == 400
+
+
+@pytest.mark.usefixtures("versions")
+def test_read_versions_bulk(client: TestClient) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/versions/bulk",
+        json={"giorni": ["2024-03-04", "2024-01-01", "2024-03-04", "2024-03-02"]},
+    )
+    assert r.status_code == 200
+    assert r.json() == {
+        "data": [
+            {"giorno": "2024-03-04", "versione": "5"},
+            {"giorno": "2024-01-01", "versione": "0"},
+            {"giorno": "2024-03-02", "versione": "3"},
+        ],
+        "count": 3,
+    }
+
+    with patch.object(settings, "VERSIONS_BULK_MAX_DAYS", 1):
+        r = client.post(
+            f"{settings.API_V1_STR}/versions/bulk",
+            json={"giorni": ["2024-03-04", "2024-01-01"]},
+        )
+    assert r.status_code == 400
+
+
+def _wait_for_job(client: TestClient, job_id: str) -> dict[str, Any]:
+    for _ in range(100):
+        r = client.get(f"{settings.API_V1_STR}/versions/jobs/{job_id}")
+        assert r.status_code == 200
+        job: dict[str, Any] = r.json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError("job not completed")
+
+
+def test_csv_job(client: TestClient) -> None:
+    with patch("app.api.routes.versions.clienti_index") as index:
+        index.codici = frozenset({"2282"})
+        r = client.post(
+            f"{settings.API_V1_STR}/versions/jobs/2024-01-01",
+            files={"file": ("export.csv", CSV.encode(), "text/csv")},
+        )
+    assert r.status_code == 202
+    job = r.json()
+    assert job["status"] == "queued"
+    assert job["bytes_total"] == len(CSV.encode())
+
+    job = _wait_for_job(client, job["id"])
+    assert job["status"] == "done"
+    assert job["rows_processed"] == 2
+    assert job["totale"] == "1.010,75"
+
+    r = client.get(f"{settings.API_V1_STR}/versions/jobs/{job['id']}/result")
+    assert r.status_code == 200
+    assert r.text == (
+        "Data;Codice committente;Importo totale\r\n"
+        "01/01;2282;1.000,50\r\n"
+        "02/01;2282;10,25\r\n"
+        ";TOTALE;1.010,75\r\n"
+    )
+
+
+def test_csv_job_compressed(client: TestClient) -> None:
+    content = gzip.compress(CSV.encode())
+    with patch("app.api.routes.versions.clienti_index") as index:
+        index.codici = frozenset({"2282"})
+        r = client.post(
+            f"{settings.API_V1_STR}/versions/jobs/2024-01-01",
+            files={"file": ("export.csv.gz", content, "application/gzip")},
+        )
+    assert r.status_code == 202
+    job = _wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+    assert job["bytes_processed"] == job["bytes_total"] == len(content)
+    assert job["totale"] == "1.010,75"
+
+
+def test_csv_job_unsupported_file(client: TestClient) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/versions/jobs/2024-01-01",
+        files={"file": ("export.xlsx", b"x", "application/octet-stream")},
+    )
+    assert r.status_code == 400
+
+
+def test_csv_job_invalid_file(client: TestClient) -> None:
+    with patch("app.api.routes.versions.clienti_index") as index:
+        index.codici = frozenset({"0000"})
+        r = client.post(
+            f"{settings.API_V1_STR}/versions/jobs/2024-01-01",
+            files={"file": ("export.csv", CSV.encode(), "text/csv")},
+        )
+    job = _wait_for_job(client, r.json()["id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "Nessun codice committente valido trovato"
+
+    r = client.get(f"{settings.API_V1_STR}/versions/jobs/{job['id']}/result")
+    assert r.status_code == 400
+
+
+def test_csv_job_not_found(client: TestClient) -> None:
+    r = client.get(f"{settings.API_V1_STR}/versions/jobs/{uuid.uuid4()}")
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Job non trovato"
+
+
+def _upload(
+    client: TestClient,
+    codici: set[str],
+    cache: CsvResultCache,
+    content: bytes = CSV.encode(),
+    filename: str = "export.csv",
+    accept_encoding: str = "identity",
+) -> Response:
+    with (
+        patch("app.api.routes.versions.clienti_index") as index,
+        patch("app.api.routes.versions.csv_cache", cache),
+    ):
+        index.snapshot.return_value = (frozenset(codici), ",".join(sorted(codici)))
+        return client.post(
+            f"{settings.API_V1_STR}/versions/create/2024-01-01",
+            files={"file": (filename, content, "text/csv")},
+            headers={"Accept-Encoding": accept_encoding},
+        )
+
+
+def test_upload_csv(client: TestClient, tmp_path: Path) -> None:
+    r = _upload(client, {"2282"}, CsvResultCache(tmp_path, max_bytes=0))
+    assert r.status_code == 200
+    assert r.headers["content-disposition"] == (
+        "attachment; filename=filtered_export.csv"
+    )
+    assert r.text.endswith("02/01;2282;10,25\r\n;TOTALE;1.010,75\r\n")
+
+
+def test_upload_csv_invalid_file(client: TestClient, tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024 * 1024)
+    r = _upload(client, {"0000"}, cache)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Nessun codice committente valido trovato"
+    assert cache.stats().entries == 0
+
+
+def test_upload_csv_cached(client: TestClient, tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024 * 1024)
+    first = _upload(client, {"2282"}, cache)
+    second = _upload(client, {"2282"}, cache)
+    assert second.status_code == 200
+    assert second.text == first.text
+    assert second.headers["content-disposition"] == (
+        "attachment; filename=filtered_export.csv"
+    )
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Cambiano i codici clienti: il risultato va ricalcolato
+    third = _upload(client, {"2282", "9999"}, cache)
+    assert "9999" in third.text
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_upload_csv_cached_streaming(client: TestClient, tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024 * 1024)
+    with patch.object(settings, "CSV_PROCESS_POOL_MAX_BYTES", 0):
+        first = _upload(client, {"2282"}, cache)
+        second = _upload(client, {"2282"}, cache)
+    assert second.text == first.text
+    assert cache.hits == 1
+
+
+# Oltre un blocco di lettura in ingresso e molti blocchi di output
+LARGE_ROWS = 80_000
+LARGE_CSV = "Data;Codice committente;Importo totale\r\n" + "01/01;2282;1,00\r\n" * (
+    LARGE_ROWS
+)
+
+
+def test_upload_csv_streaming_large(client: TestClient, tmp_path: Path) -> None:
+    content = LARGE_CSV.encode()
+    assert len(content) > 1024 * 1024
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    with patch.object(settings, "CSV_PROCESS_POOL_MAX_BYTES", 0):
+        r = _upload(client, {"2282"}, cache, content)
+    assert r.status_code == 200
+    assert len(r.content) > 64 * 1024
+    assert r.text == LARGE_CSV + ";TOTALE;80.000,00\r\n"
+
+
+def test_upload_csv_columnar_large(client: TestClient, tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    with (
+        patch.object(settings, "CSV_PROCESS_POOL_MAX_BYTES", 0),
+        patch.object(settings, "CSV_COLUMNAR_MIN_BYTES", 1),
+    ):
+        r = _upload(client, {"2282"}, cache, LARGE_CSV.encode())
+        bad = _upload(client, {"2282"}, cache, CSV.replace("5,00", "5,00;x").encode())
+    assert r.text == LARGE_CSV + ";TOTALE;80.000,00\r\n"
+    assert bad.status_code == 400
+    assert bad.json()["detail"] == "Riga 3: più colonne dell'intestazione"
+
+
+@pytest.mark.parametrize(
+    "filename, compress",
+    [
+        ("export.csv.gz", gzip.compress),
+        ("export.csv.zst", zstandard.ZstdCompressor().compress),
+    ],
+)
+def test_upload_csv_compressed(
+    client: TestClient,
+    tmp_path: Path,
+    filename: str,
+    compress: Callable[[bytes], bytes],
+) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    r = _upload(client, {"2282"}, cache, compress(CSV.encode()), filename)
+    assert r.status_code == 200
+    assert r.headers["content-disposition"] == (
+        "attachment; filename=filtered_export.csv"
+    )
+    assert r.text == _upload(client, {"2282"}, cache).text
+
+
+@pytest.mark.parametrize(
+    "filename, compress",
+    [
+        ("export.csv.gz", gzip.compress),
+        ("export.csv.zst", zstandard.ZstdCompressor().compress),
+    ],
+)
+def test_upload_csv_compressed_streaming_large(
+    client: TestClient,
+    tmp_path: Path,
+    filename: str,
+    compress: Callable[[bytes], bytes],
+) -> None:
+    # Decompresso supera più blocchi di lettura e di output
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    with patch.object(settings, "CSV_PROCESS_POOL_MAX_BYTES", 0):
+        r = _upload(client, {"2282"}, cache, compress(LARGE_CSV.encode()), filename)
+    assert r.status_code == 200
+    assert r.text == LARGE_CSV + ";TOTALE;80.000,00\r\n"
+
+
+def test_upload_csv_corrupt_compressed(client: TestClient, tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    r = _upload(client, {"2282"}, cache, b"not gzip", "export.csv.gz")
+    assert r.status_code == 400
+    assert r.json()["detail"] == "File compresso non valido o danneggiato"
+
+
+def test_upload_csv_wrong_extension(client: TestClient, tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    r = _upload(client, {"2282"}, cache, filename="export.xlsx")
+    assert r.status_code == 400
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_upload_csv_compressed_response(
+    client: TestClient, tmp_path: Path, encoding: str
+) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024 * 1024)
+    plain = _upload(client, {"2282"}, cache)
+    # Dalla cache, dal pool di processi e in streaming
+    cached = _upload(client, {"2282"}, cache, accept_encoding=encoding)
+    cache.max_bytes = 0
+    inline = _upload(client, {"2282"}, cache, accept_encoding=encoding)
+    with patch.object(settings, "CSV_PROCESS_POOL_MAX_BYTES", 0):
+        streamed = _upload(client, {"2282"}, cache, accept_encoding=encoding)
+    for r in (cached, inline, streamed):
+        assert r.headers["content-encoding"] == encoding
+        assert r.headers["vary"] == "Accept-Encoding"
+        assert r.text == plain.text
+
+
+def test_upload_csv_batch(client: TestClient) -> None:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("2024-01-02.csv", CSV)
+        zf.writestr("2024-01-03.csv", "Data;Importo totale\r\n")
+    with patch("app.api.routes.versions.clienti_index") as index:
+        index.snapshot.return_value = (frozenset({"2282"}), "2282")
+        r = client.post(
+            f"{settings.API_V1_STR}/versions/batch",
+            files=[
+                ("files", ("2024-01-01.csv.gz", gzip.compress(CSV.encode()))),
+                ("files", ("giorni.zip", archive.getvalue())),
+            ],
+        )
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+        assert sorted(zf.namelist()) == [
+            "filtered_2024-01-01.csv",
+            "filtered_2024-01-02.csv",
+            "riepilogo.csv",
+        ]
+        assert (
+            zf.read("filtered_2024-01-01.csv").decode().endswith(";TOTALE;1.010,75\r\n")
+        )
+        summary = zf.read("riepilogo.csv").decode().splitlines()
+    assert summary[1:] == [
+        "2024-01-01;2024-01-01.csv.gz;2;1.010,75;",
+        "2024-01-02;2024-01-02.csv;2;1.010,75;",
+        "2024-01-03;2024-01-03.csv;;;"
+        "Struttura file non valida: colonna 'Codice committente' mancante",
+        "TOTALE;;4;2.021,50;",
+    ]
+
+
+def test_upload_csv_batch_without_giorno(client: TestClient) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/versions/batch",
+        files=[("files", ("export.csv", CSV.encode()))],
+    )
+    assert r.status_code == 400
+
+
+def test_stored_result(
+    client: TestClient, tmp_path: Path, normal_user_token_headers: dict[str, str]
+) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    uploaded = _upload(client, {"2282"}, cache)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/2024-01-01/totali",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 200
+    totali = r.json()
+    assert (totali["filename"], totali["righe"], totali["totale"]) == (
+        "export.csv",
+        2,
+        "1.010,75",
+    )
+    assert totali["subtotali"] == [{"codice": "2282", "righe": 2, "totale": "1.010,75"}]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/2024-01-01/file",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.headers["content-disposition"] == (
+        "attachment; filename=filtered_export.csv"
+    )
+    assert r.text == uploaded.text
+
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/2024-01-01/file",
+        params={"subtotali": True},
+        headers={**normal_user_token_headers, "Accept-Encoding": "gzip"},
+    )
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.text.endswith(";TOTALE 2282;1.010,75\r\n;TOTALE;1.010,75\r\n")
+
+
+def test_stored_result_streaming_upload(
+    client: TestClient, tmp_path: Path, normal_user_token_headers: dict[str, str]
+) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=0)
+    with patch.object(settings, "CSV_PROCESS_POOL_MAX_BYTES", 0):
+        uploaded = _upload(client, {"2282", "9999"}, cache)
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/2024-01-01/file",
+        headers=normal_user_token_headers,
+    )
+    assert r.text == uploaded.text
+
+
+def test_stored_result_not_found(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/1999-01-01/totali",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 404
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/1999-01-01/file",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 404
+
+
+def test_stored_result_requires_login(client: TestClient) -> None:
+    for path in ("totali", "file"):
+        r = client.get(f"{settings.API_V1_STR}/versions/2024-01-01/{path}")
+        assert r.status_code == 401
+
+
+def test_csv_cache_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/versions/cache/stats",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert set(r.json()) == {"hits", "misses", "entries", "size_bytes", "max_bytes"}
@@ -2,12 +2,14 @@ from collections.abc import Generator
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
 from sqlmodel import Session, delete
 
 from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
-from app.models import Item, User
+from app.models import Azienda, CsvRisultato, EmailOutbox, Item, User
+from app.services.rate_limit import login_throttle
 from app.tests.utils.user import authentication_token_from_email
 from app.tests.utils.utils import get_superuser_token_headers
 
@@ -21,11 +23,20 @@ def db() -> Generator[Session, None, None]:
         session.execute(statement)
         statement = delete(User)
         session.execute(statement)
+        statement = delete(CsvRisultato)
+        session.execute(statement)
+        session.execute(text("DELETE FROM csv_righe"))
+        statement = delete(Azienda)
+        session.execute(statement)
+        statement = delete(EmailOutbox)
+        session.execute(statement)
         session.commit()
 
 
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
+    # Tutti i test arrivano dallo stesso IP: si riparte con i bucket pieni
+    login_throttle.reset()
     with TestClient(app) as c:
         yield c
 
@@ -0,0 +1,126 @@
+from pathlib import Path
+from typing import Any, cast
+
+import psycopg
+from openpyxl import Workbook  # type: ignore[import-untyped]
+from sqlalchemy import text
+
+from app.core.db import engine
+from app.loaders.clienti import (
+    COLUMNS,
+    ClienteRow,
+    SyncResult,
+    copy_clienti,
+    insert_clienti,
+    iter_csv_rows,
+    iter_rows,
+    iter_xlsx_rows,
+    sync_clienti,
+)
+
+# Tabella temporanea con gli stessi indici: nasconde `clienti` solo per la
+# connessione del test
+_TEMP_TABLE_SQL = "CREATE TEMP TABLE clienti (LIKE public.clienti INCLUDING ALL)"
+
+
+def _row(codice: str, ragione_sociale: str) -> ClienteRow:
+    return (codice, ragione_sociale) + (None,) * (len(COLUMNS) - 2)
+
+
+def test_iter_csv_rows(tmp_path: Path) -> None:
+    path = tmp_path / "clienti.csv"
+    path.write_text(
+        "\ufeffCodice;Ragione sociale;Alias\n 2282 ;ACME SRL;\n;;\nabc;Rossi;R\n",
+        encoding="utf-8",
+    )
+    rows = list(iter_csv_rows(path))
+    assert len(rows) == 2
+    assert rows[0][:3] == ("2282", "ACME SRL", None)
+    assert rows[1][:3] == ("ABC", "Rossi", "R")
+    assert all(len(row) == len(COLUMNS) for row in rows)
+
+
+def test_iter_xlsx_rows(tmp_path: Path) -> None:
+    path = tmp_path / "clienti.xlsx"
+    workbook = Workbook()
+    sheet = workbook.active
+    assert sheet is not None
+    sheet.title = "Clienti"
+    sheet.append(list(COLUMNS))
+    sheet.append([2282.0, "ACME SRL", None, 20100])
+    sheet.append([None, None])
+    sheet.append(["ABC", "Rossi"])
+    workbook.save(path)
+
+    rows = list(iter_xlsx_rows(path, "Clienti"))
+    assert [row[0] for row in rows] == ["2282", "ABC"]
+    assert rows[0][3] == "20100"
+    assert list(iter_rows(path)) == rows
+
+
+def test_copy_clienti_in_batches() -> None:
+    rows = [_row(f"LOAD{i}", f"Cliente {i}") for i in range(5)]
+    with engine.connect() as connection:
+        conn = cast(psycopg.Connection[Any], connection.connection.driver_connection)
+        connection.execute(text(_TEMP_TABLE_SQL))
+        try:
+            assert copy_clienti(conn, iter(rows), batch_size=2) == 5
+            loaded = connection.execute(
+                text(
+                    "SELECT codice, ragione_sociale FROM clienti "
+                    "WHERE codice LIKE 'LOAD%' ORDER BY codice"
+                )
+            ).all()
+            assert [tuple(row) for row in loaded] == [row[:2] for row in rows]
+        finally:
+            connection.rollback()
+
+
+def test_insert_clienti_keeps_last_duplicate() -> None:
+    with engine.connect() as connection:
+        conn = cast(psycopg.Connection[Any], connection.connection.driver_connection)
+        connection.execute(text(_TEMP_TABLE_SQL))
+        try:
+            copy_clienti(conn, [_row("A", "Uno")])
+            rows = [_row("B", "Due"), _row("A", "Uno bis"), _row("B", "Due bis")]
+            assert insert_clienti(conn, rows, batch_size=2) == 2
+            loaded = connection.execute(
+                text("SELECT codice, ragione_sociale FROM clienti ORDER BY codice")
+            ).all()
+            assert [tuple(row) for row in loaded] == [
+                ("A", "Uno bis"),
+                ("B", "Due bis"),
+            ]
+        finally:
+            connection.rollback()
+
+
+def test_sync_clienti_writes_only_changes() -> None:
+    with engine.connect() as connection:
+        conn = cast(psycopg.Connection[Any], connection.connection.driver_connection)
+        connection.execute(text(_TEMP_TABLE_SQL))
+        try:
+            copy_clienti(conn, [_row("A", "Uno"), _row("B", "Due"), _row("C", "Tre")])
+            result = sync_clienti(
+                conn,
+                [_row("A", "Uno"), _row("B", "Vecchio"), _row("B", "Due bis")]
+                + [_row("D", "Quattro")],
+                batch_size=2,
+            )
+            assert result == SyncResult(inserted=1, updated=1, deleted=1, unchanged=1)
+            loaded = connection.execute(
+                text("SELECT codice, ragione_sociale FROM clienti ORDER BY codice")
+            ).all()
+            assert [tuple(row) for row in loaded] == [
+                ("A", "Uno"),
+                ("B", "Due bis"),
+                ("D", "Quattro"),
+            ]
+
+            again = sync_clienti(conn, [_row("A", "Uno"), _row("B", "Due bis")])
+            assert again == SyncResult(inserted=0, updated=0, deleted=1, unchanged=2)
+            assert not sync_clienti(
+                conn, [_row("A", "Uno"), _row("B", "Due bis")]
+            ).changed
+        finally:
+            connection.rollback()
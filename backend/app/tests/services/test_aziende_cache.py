@@ -0,0 +1,63 @@
+from unittest.mock import patch
+
+from app.models import AziendaPublic
+from app.services.aziende_cache import AziendeSearchCache, search_key
+
+
+def _azienda(codice: str = "A1") -> AziendaPublic:
+    return AziendaPublic(
+        codice=codice,
+        ragione_sociale="Rossi SRL",
+        nazione="Italia",
+        provincia="MI",
+        citta="Milano",
+        via="Via Roma 1",
+        cap="20100",
+    )
+
+
+def test_key_ignores_case_and_spaces() -> None:
+    assert search_key(" Ros ", 10) == search_key("ros", 10)
+    assert search_key("ros", 10) != search_key("ros", 20)
+
+
+def test_put_and_get() -> None:
+    cache = AziendeSearchCache(ttl_seconds=60, max_entries=10)
+    key = search_key("ros", 10)
+    assert cache.get(key) is None
+    cache.put(key, [_azienda()], generation=cache.generation)
+    assert cache.get(key) == [_azienda()]
+
+
+def test_entries_expire() -> None:
+    cache = AziendeSearchCache(ttl_seconds=60, max_entries=10)
+    key = search_key("ros", 10)
+    with patch("app.services.aziende_cache.time.monotonic", return_value=0):
+        cache.put(key, [_azienda()], generation=cache.generation)
+    with patch("app.services.aziende_cache.time.monotonic", return_value=61):
+        assert cache.get(key) is None
+
+
+def test_least_recently_used_is_evicted() -> None:
+    cache = AziendeSearchCache(ttl_seconds=60, max_entries=2)
+    for q in ("a", "b"):
+        cache.put(search_key(q, 10), [], generation=cache.generation)
+    cache.get(search_key("a", 10))
+    cache.put(search_key("c", 10), [], generation=cache.generation)
+    assert cache.get(search_key("a", 10)) is not None
+    assert cache.get(search_key("b", 10)) is None
+
+
+def test_stale_generation_is_not_stored() -> None:
+    cache = AziendeSearchCache(ttl_seconds=60, max_entries=10)
+    generation = cache.generation
+    cache._on_notify("")
+    cache.put(search_key("ros", 10), [_azienda()], generation=generation)
+    assert cache.get(search_key("ros", 10)) is None
+
+
+def test_notify_clears_everything() -> None:
+    cache = AziendeSearchCache(ttl_seconds=60, max_entries=10)
+    cache.put(search_key("ros", 10), [_azienda()], generation=cache.generation)
+    cache._on_notify(None)
+    assert cache.get(search_key("ros", 10)) is None
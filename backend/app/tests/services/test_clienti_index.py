@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+from app.core.db import engine
+from app.services.clienti_index import ClientiCodeIndex
+
+
+def test_lookups_load_once() -> None:
+    index = ClientiCodeIndex(engine, refresh_seconds=300)
+    with patch.object(index, "_fetch_codici", return_value=["2282", "ABC"]) as fetch:
+        assert "2282" in index
+        assert "9999" not in index
+        assert index.filter({"2282", "ABC", "XYZ"}) == {"2282", "ABC"}
+        assert len(index) == 2
+    assert fetch.call_count == 1
+
+
+def test_invalidate_triggers_reload() -> None:
+    index = ClientiCodeIndex(engine, refresh_seconds=300)
+    with patch.object(index, "_fetch_codici", return_value=["2282"]):
+        assert "ABC" not in index
+    index.invalidate()
+    with patch.object(index, "_fetch_codici", return_value=["2282", "ABC"]):
+        assert "ABC" in index
+
+
+def test_stale_index_is_reloaded() -> None:
+    index = ClientiCodeIndex(engine, refresh_seconds=0)
+    with patch.object(index, "_fetch_codici", return_value=["2282"]) as fetch:
+        index.filter({"2282"})
+        index.filter({"2282"})
+    assert fetch.call_count == 2
+
+
+def test_failed_start_loads_on_first_use() -> None:
+    index = ClientiCodeIndex(engine, refresh_seconds=300)
+    with (
+        patch("app.services.clienti_index.settings.CLIENTI_INDEX_LISTEN", False),
+        patch.object(index, "_fetch_codici", side_effect=RuntimeError("down")),
+    ):
+        index.start()
+    with patch.object(index, "_fetch_codici", return_value=["2282"]):
+        assert "2282" in index
+
+
+def test_fingerprint_follows_codici() -> None:
+    index = ClientiCodeIndex(engine, refresh_seconds=300)
+    with patch.object(index, "_fetch_codici", return_value=["ABC", "2282"]):
+        codici, fingerprint = index.snapshot()
+    assert codici == {"2282", "ABC"}
+    index.invalidate()
+    with patch.object(index, "_fetch_codici", return_value=["2282", "ABC"]):
+        assert index.fingerprint == fingerprint
+    index.invalidate()
+    with patch.object(index, "_fetch_codici", return_value=["2282"]):
+        assert index.fingerprint != fingerprint
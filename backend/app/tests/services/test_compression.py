@@ -0,0 +1,91 @@
+import gzip
+import io
+import zlib
+from collections.abc import Callable
+
+import pytest
+import zstandard
+
+from app.services.compression import (
+    Compression,
+    DecompressingReader,
+    compress_chunks,
+    negotiate_encoding,
+    upload_compression,
+)
+from app.services.csv_filter import CsvFilterError
+
+
+def test_upload_compression() -> None:
+    assert upload_compression("export.CSV") is None
+    assert upload_compression("export.csv.gz") == "gzip"
+    assert upload_compression("export.csv.zst") == "zstd"
+    with pytest.raises(CsvFilterError):
+        upload_compression("export.xlsx")
+
+
+@pytest.mark.parametrize(
+    "compress", [gzip.compress, zstandard.ZstdCompressor().compress]
+)
+def test_decompressing_reader(compress: Callable[[bytes], bytes]) -> None:
+    data = b"a;b\r\n" * 10_000
+    compression: Compression = "gzip" if compress is gzip.compress else "zstd"
+    reader = DecompressingReader(io.BytesIO(compress(data)), compression)
+    out = b""
+    while chunk := reader.read(1000):
+        assert len(chunk) <= 1000
+        out += chunk
+    assert out == data
+
+
+def test_decompressing_reader_rejects_corrupt_input() -> None:
+    reader = DecompressingReader(io.BytesIO(b"not gzip"), "gzip")
+    with pytest.raises(CsvFilterError):
+        reader.read(1000)
+
+
+@pytest.mark.parametrize(
+    "compress", [gzip.compress, zstandard.ZstdCompressor().compress]
+)
+def test_decompressing_reader_rejects_truncated_input(
+    compress: Callable[[bytes], bytes],
+) -> None:
+    data = compress(b"".join(b"%d;2282;1,00\r\n" % i for i in range(50_000)))
+    compression: Compression = "gzip" if compress is gzip.compress else "zstd"
+    reader = DecompressingReader(io.BytesIO(data[: len(data) // 2]), compression)
+    with pytest.raises(CsvFilterError):
+        while reader.read(64 * 1024):
+            pass
+
+
+def test_decompressing_reader_zstd_frames() -> None:
+    compressor = zstandard.ZstdCompressor()
+    data = compressor.compress(b"a;b\r\n" * 1000) + compressor.compress(b"c;d\r\n")
+    reader = DecompressingReader(io.BytesIO(data), "zstd")
+    assert reader.read() == b"a;b\r\n" * 1000 + b"c;d\r\n"
+    assert reader.read(10) == b""
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("identity", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip, zstd", "zstd"),
+        ("zstd;q=0.5, gzip", "gzip"),
+        ("zstd;q=0, *", "gzip"),
+        ("gzip;q=0", None),
+    ],
+)
+def test_negotiate_encoding(header: str | None, expected: str | None) -> None:
+    assert negotiate_encoding(header) == expected
+
+
+def test_compress_chunks() -> None:
+    chunks: list[str | bytes] = ["a;b\r\n", b"c;d\r\n"]
+    gz = b"".join(compress_chunks(chunks, "gzip"))
+    assert zlib.decompress(gz, zlib.MAX_WBITS | 16) == b"a;b\r\nc;d\r\n"
+    zst = b"".join(compress_chunks(chunks, "zstd"))
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(zst))
+    assert reader.read() == b"a;b\r\nc;d\r\n"
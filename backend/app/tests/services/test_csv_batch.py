@@ -0,0 +1,115 @@
+import csv
+import io
+import zipfile
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from app.core.config import settings
+from app.services.csv_batch import (
+    SUMMARY_NAME,
+    _copy_capped,
+    collect_batch_files,
+    giorno_from_name,
+    write_batch_zip,
+)
+from app.services.csv_filter import CsvFilterError
+from app.services.csv_tasks import FilteredCsvFile, filter_csv_file
+
+CSV = b"Data;Codice committente;Importo totale\r\n01/01;2282;1,50\r\n"
+
+
+def _zip(members: dict[str, bytes]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+def test_giorno_from_name() -> None:
+    assert giorno_from_name("export_2024-01-31.csv.gz") == date(2024, 1, 31)
+    with pytest.raises(CsvFilterError):
+        giorno_from_name("export.csv")
+    with pytest.raises(CsvFilterError):
+        giorno_from_name("export_2024-02-30.csv")
+
+
+def test_collect_batch_files_extracts_zip(tmp_path: Path) -> None:
+    archive = _zip({"dir/": b"", "dir/2024-01-02.csv": CSV})
+    batch = collect_batch_files(
+        [("2024-01-03.csv", io.BytesIO(CSV)), ("giorni.zip", archive)], tmp_path
+    )
+    assert [item.giorno for item in batch] == [date(2024, 1, 2), date(2024, 1, 3)]
+    assert [item.filename for item in batch] == ["2024-01-02.csv", "2024-01-03.csv"]
+    assert all(item.path.read_bytes() == CSV for item in batch)
+
+
+def test_collect_batch_files_rejects_duplicate_giorno(tmp_path: Path) -> None:
+    uploads = [
+        ("a_2024-01-01.csv", io.BytesIO(CSV)),
+        ("b_2024-01-01.csv", io.BytesIO(CSV)),
+    ]
+    with pytest.raises(CsvFilterError, match="2024-01-01"):
+        collect_batch_files(uploads, tmp_path)
+
+
+def test_collect_batch_files_skips_macos_metadata(tmp_path: Path) -> None:
+    archive = _zip(
+        {
+            "giorni/2024-01-02.csv": CSV,
+            "__MACOSX/giorni/._2024-01-02.csv": b"\x00\x05\x16\x07",
+            "giorni/._2024-01-02.csv": b"\x00\x05\x16\x07",
+            "giorni/.DS_Store": b"\x00",
+        }
+    )
+    batch = collect_batch_files([("giorni.zip", archive)], tmp_path)
+    assert [item.filename for item in batch] == ["2024-01-02.csv"]
+
+
+def test_collect_batch_files_caps_zip_members(tmp_path: Path) -> None:
+    archive = _zip({"2024-01-01.csv": CSV, "2024-01-02.csv": CSV})
+    with patch.object(settings, "CSV_BATCH_ZIP_MAX_FILE_BYTES", len(CSV) - 1):
+        with pytest.raises(CsvFilterError, match="troppo grande"):
+            collect_batch_files([("giorni.zip", archive)], tmp_path)
+    # Ognuno entra nel limite per file, insieme superano quello totale
+    archive.seek(0)
+    with patch.object(settings, "CSV_BATCH_ZIP_MAX_TOTAL_BYTES", len(CSV) + 1):
+        with pytest.raises(CsvFilterError, match="troppo grande"):
+            collect_batch_files([("giorni.zip", archive)], tmp_path / "b")
+
+
+def test_copy_capped_checks_actual_size() -> None:
+    target = io.BytesIO()
+    assert _copy_capped(io.BytesIO(CSV), target, len(CSV)) == len(CSV)
+    with pytest.raises(CsvFilterError):
+        _copy_capped(io.BytesIO(CSV), io.BytesIO(), len(CSV) - 1)
+
+
+def test_write_batch_zip(tmp_path: Path) -> None:
+    uploads = [
+        ("2024-01-01.csv", io.BytesIO(CSV)),
+        ("2024-01-02.csv", io.BytesIO(CSV)),
+    ]
+    batch = collect_batch_files(uploads, tmp_path)
+    results: list[FilteredCsvFile | str] = [
+        filter_csv_file(batch[0].path, batch[0].output_path, {"2282"}),
+        "Nessun codice committente valido trovato",
+    ]
+    write_batch_zip(batch, results, tmp_path / "out.zip")
+
+    with zipfile.ZipFile(tmp_path / "out.zip") as archive:
+        assert sorted(archive.namelist()) == [
+            "filtered_2024-01-01.csv",
+            SUMMARY_NAME,
+        ]
+        summary = archive.read(SUMMARY_NAME).decode()
+    assert list(csv.reader(io.StringIO(summary), delimiter=";")) == [
+        ["Giorno", "File", "Righe", "Totale", "Errore"],
+        ["2024-01-01", "2024-01-01.csv", "1", "1,50", ""],
+        ["2024-01-02", "2024-01-02.csv", "", "", results[1]],
+        ["TOTALE", "", "1", "1,50", ""],
+    ]
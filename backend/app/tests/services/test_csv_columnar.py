@@ -0,0 +1,131 @@
+import io
+import random
+
+import pytest
+
+from app.services.csv_columnar import ColumnarCsvFilter
+from app.services.csv_filter import CsvFilter, CsvFilterError, iter_lines
+
+HEADER = "Data;Codice committente;Importo totale;Note\r\n"
+VALIDI = {"2282", "ABC", "X1"}
+
+
+def _resolve(codici: set[str]) -> set[str]:
+    return codici & VALIDI
+
+
+def _row_by_row(content: str) -> str:
+    lines = iter_lines(io.BytesIO(content.encode()))
+    return "".join(CsvFilter(lines, _resolve))
+
+
+def _row_by_row_subtotali(content: str) -> str:
+    lines = iter_lines(io.BytesIO(content.encode()))
+    return "".join(CsvFilter(lines, _resolve, subtotali=True))
+
+
+def _columnar(content: str, block_chars: int = 40, subtotali: bool = False) -> str:
+    source = io.BytesIO(content.encode())
+    return "".join(
+        ColumnarCsvFilter(
+            source, _resolve, block_chars=block_chars, subtotali=subtotali
+        )
+    )
+
+
+def test_same_output_as_row_by_row() -> None:
+    rng = random.Random(42)
+    codici = ["2282", " abc ", "x1", "9999", "", "zz"]
+    importi = ["1.234,56", "€ 10,5", "0,01", "12.5", "n/d", "3", "1.000.000,99"]
+    note = ["", "semplice", 'con "virgolette"', "con;punto e virgola", "a\ncapo"]
+    rows = []
+    for i in range(200):
+        fields = [
+            f"{i:03d}",
+            rng.choice(codici),
+            rng.choice(importi),
+            rng.choice(note),
+        ]
+        rows.append(
+            ";".join(
+                f'"{f.replace(chr(34), chr(34) * 2)}"'
+                if ";" in f or "\n" in f or '"' in f
+                else f
+                for f in fields
+            )
+            + "\r\n"
+        )
+    content = HEADER + "".join(rows)
+    expected = _row_by_row(content)
+    expected_subtotali = _row_by_row_subtotali(content)
+    for block_chars in (1, 150, 100_000):
+        assert _columnar(content, block_chars) == expected
+        assert _columnar(content, block_chars, subtotali=True) == expected_subtotali
+
+
+def test_short_rows_and_total_row() -> None:
+    content = HEADER + "1;2282;0,10\r\n2;2282;0,20\r\n3;ABC\r\n"
+    result = _columnar(content)
+    assert result == _row_by_row(content)
+    assert result.endswith(";TOTALE;0,30;\r\n")
+
+
+@pytest.mark.parametrize(
+    "content, detail",
+    [
+        ("", "colonna 'Codice committente' mancante"),
+        (HEADER + "1;;1,00;\r\n", "Nessun codice committente trovato nel file"),
+        (HEADER + "1;9999;1,00;\r\n", "Nessun codice committente valido trovato"),
+        (
+            HEADER + "1;2282;1,00;\r\n" * 5 + "6;2282;1,00;;extra\r\n",
+            "Riga 7: più colonne dell'intestazione",
+        ),
+    ],
+)
+def test_validation_errors(content: str, detail: str) -> None:
+    with pytest.raises(CsvFilterError) as exc_info:
+        _columnar(content)
+    assert detail in exc_info.value.detail
+
+
+@pytest.mark.parametrize("extra", [";extra", ";extra;altro", ";", ";x;"])
+@pytest.mark.parametrize("before", range(6))
+def test_extra_columns_same_error_as_row_by_row(extra: str, before: int) -> None:
+    # In mezzo a un blocco di pandas e come prima riga di un blocco
+    content = HEADER + "1;2282;1,00;\r\n" * before + f"6;2282;1,00;{extra}\r\n"
+    with pytest.raises(CsvFilterError) as expected:
+        _row_by_row(content)
+    with pytest.raises(CsvFilterError) as columnar:
+        _columnar(content)
+    assert columnar.value.detail == expected.value.detail
+
+
+def test_reads_in_bounded_blocks() -> None:
+    # Più blocchi di lettura, con caratteri multibyte a cavallo dei blocchi
+    rows = [f"{i};2282;1,00;città {'è' * (i % 7)}\r\n" for i in range(80_000)]
+    content = HEADER + "".join(rows)
+    assert len(content.encode()) > 2 * 1024 * 1024
+    assert _columnar(content, block_chars=256 * 1024) == _row_by_row(content)
+
+
+def test_blocks_cut_only_between_records() -> None:
+    # Una virgoletta isolata altera il conteggio usato per tagliare i blocchi
+    content = (
+        HEADER
+        + '1;2282;1,00;alto 3"\r\n'
+        + '2;2282;2,00;"su due\r\nrighe"\r\n' * 3
+        + "3;ABC;3,00;\r\n"
+    )
+    expected = _row_by_row(content)
+    for block_chars in (1, 20, 60):
+        assert _columnar(content, block_chars) == expected
+
+
+def test_extra_columns_after_multiline_field() -> None:
+    content = HEADER + '1;2282;1,00;"a\r\ncapo"\r\n' + "2;2282;1,00;\r\n" * 4
+    content += "3;2282;1,00;;\r\n"
+    with pytest.raises(CsvFilterError) as expected:
+        _row_by_row(content)
+    with pytest.raises(CsvFilterError) as columnar:
+        _columnar(content, block_chars=30)
+    assert columnar.value.detail == expected.value.detail
@@ -0,0 +1,117 @@
+import io
+from collections.abc import Callable
+
+import pytest
+
+from app.services.csv_filter import (
+    CsvFilter,
+    CsvFilterError,
+    iter_lines,
+    stream_filtered_csv,
+)
+
+HEADER = "Data;Codice committente;Importo totale\r\n"
+
+
+def _resolver(
+    validi: set[str],
+) -> tuple[Callable[[set[str]], set[str]], list[set[str]]]:
+    calls: list[set[str]] = []
+
+    def resolve(codici: set[str]) -> set[str]:
+        calls.append(set(codici))
+        return codici & validi
+
+    return resolve, calls
+
+
+def _run(content: str, validi: set[str], subtotali: bool = False) -> str:
+    resolve, _ = _resolver(validi)
+    source = io.BytesIO(content.encode())
+    return "".join(stream_filtered_csv(source, resolve, subtotali=subtotali))
+
+
+def test_filter_keeps_order_and_appends_totale() -> None:
+    content = (
+        HEADER
+        + "01/01;2282;1.000,50\r\n"
+        + "01/01;9999;5,00\r\n"
+        + "02/01; 2282 ;€ 10,25\r\n"
+        + "03/01;abc;1,00\r\n"
+    )
+    result = _run(content, {"2282", "ABC"})
+    assert result == (
+        HEADER
+        + "01/01;2282;1.000,50\r\n"
+        + "02/01; 2282 ;€ 10,25\r\n"
+        + "03/01;abc;1,00\r\n"
+        + ";TOTALE;1.011,75\r\n"
+    )
+
+
+def test_invalid_importo_row_is_written_but_not_summed() -> None:
+    content = HEADER + "01/01;2282;n/d\r\n" + "02/01;2282;2,00\r\n"
+    result = _run(content, {"2282"})
+    assert result.endswith("01/01;2282;n/d\r\n02/01;2282;2,00\r\n;TOTALE;2,00\r\n")
+
+
+def test_totale_is_exact_to_the_cent() -> None:
+    content = HEADER + "01/01;2282;0,10\r\n" * 3 + "01/01;2282;0,005\r\n"
+    result = _run(content, {"2282"})
+    assert result.endswith(";TOTALE;0,31\r\n")
+
+
+def test_subtotali_per_committente() -> None:
+    content = (
+        HEADER
+        + "01/01;B2;1,50\r\n"
+        + "01/01;a1;2,00\r\n"
+        + "01/01;A1;1.000,25\r\n"
+        + "01/01;ZZ;9,00\r\n"
+    )
+    result = _run(content, {"A1", "B2"}, subtotali=True)
+    assert result.endswith(
+        ";TOTALE A1;1.002,25\r\n;TOTALE B2;1,50\r\n;TOTALE;1.003,75\r\n"
+    )
+
+
+def test_codes_are_resolved_in_batches() -> None:
+    rows = "".join(f"01/01;{i % 7};1,00\r\n" for i in range(50))
+    resolve, calls = _resolver({"1", "3"})
+    lines = iter_lines(io.BytesIO((HEADER + rows).encode()), chunk_size=16)
+    result = "".join(CsvFilter(lines, resolve, batch_size=4))
+    assert set().union(*calls) == {str(i) for i in range(7)}
+    assert all(len(call) <= 4 for call in calls)
+    assert result.count("\r\n") == 1 + 14 + 1
+    assert result.endswith(";TOTALE;14,00\r\n")
+
+
+def test_quoted_newline_and_multibyte_split_across_chunks() -> None:
+    content = HEADER + '"riga\nsu due";2282;1,00\r\n' + "àèì;2282;2,00\r\n"
+    resolve, _ = _resolver({"2282"})
+    lines = iter_lines(io.BytesIO(content.encode()), chunk_size=3)
+    result = "".join(CsvFilter(lines, resolve))
+    assert '"riga\nsu due";2282;1,00' in result
+    assert "àèì;2282;2,00" in result
+
+
+@pytest.mark.parametrize(
+    "content, detail",
+    [
+        ("", "colonna 'Codice committente' mancante"),
+        ("Codice committente;Altro\r\n2282;1\r\n", "colonna 'Importo totale' mancante"),
+        (HEADER + "01/01; ;1,00\r\n", "Nessun codice committente trovato nel file"),
+        (HEADER + "01/01;9999;1,00\r\n", "Nessun codice committente valido trovato"),
+    ],
+)
+def test_validation_errors(content: str, detail: str) -> None:
+    with pytest.raises(CsvFilterError) as exc_info:
+        _run(content, {"2282"})
+    assert detail in exc_info.value.detail
+
+
+def test_invalid_encoding() -> None:
+    resolve, _ = _resolver({"2282"})
+    with pytest.raises(CsvFilterError) as exc_info:
+        stream_filtered_csv(io.BytesIO(HEADER.encode() + b"\xff;2282;1\r\n"), resolve)
+    assert exc_info.value.detail == "Encoding non supportato (richiesto UTF-8)"
@@ -0,0 +1,96 @@
+import io
+from datetime import date
+
+from sqlmodel import Session
+
+from app.core.db import engine
+from app.services.csv_store import (
+    ResultSpool,
+    iter_stored_csv,
+    read_stored_totali,
+    store_filtered_csv,
+)
+from app.services.csv_tasks import filter_csv_bytes
+
+CSV = (
+    b"Data;Codice committente;Importo totale;Note\r\n"
+    b"01/01;2282;1.000,50;\r\n"
+    b'01/01;abc;2,00;"a;b"\r\n'
+    b"02/01; 2282 ;n/d;\r\n"
+    b"02/01;9999;5,00;\r\n"
+)
+GIORNO = date(2023, 12, 31)
+
+
+def test_store_and_read_back() -> None:
+    plain = filter_csv_bytes(CSV, {"2282", "ABC"}).content
+    with_subtotali = filter_csv_bytes(CSV, {"2282", "ABC"}, subtotali=True).content
+
+    risultato = store_filtered_csv(GIORNO, "export.csv", io.BytesIO(with_subtotali))
+    # La riga con importo "n/d" si salva ma non si conta, come nel filtro
+    assert risultato.righe == 2
+    assert risultato.righe == filter_csv_bytes(CSV, {"2282", "ABC"}).rows_processed
+    assert risultato.totale_cents == 100250
+
+    # Il file ricostruito è identico all'output del filtro, con o senza
+    # subtotali, qualunque variante sia stata salvata
+    stored = store_filtered_csv(GIORNO, "export.csv", io.BytesIO(with_subtotali))
+    assert stored.updated_at == risultato.updated_at
+    assert "".join(iter_stored_csv(stored)).encode() == plain
+    assert "".join(iter_stored_csv(stored, subtotali=True)).encode() == with_subtotali
+
+    with Session(engine) as session:
+        totali = read_stored_totali(session, GIORNO)
+    assert totali is not None
+    assert totali.totale == "1.002,50"
+    assert [(s.codice, s.righe, s.totale) for s in totali.subtotali] == [
+        ("2282", 1, "1.000,50"),
+        ("ABC", 1, "2,00"),
+    ]
+
+
+def test_subtotali_skip_codici_without_valid_importi() -> None:
+    content = filter_csv_bytes(CSV, {"2282", "ABC"}, subtotali=True).content
+    # Di ABC resta solo una riga senza importo valido
+    content = content.replace(b"2,00", b"n/d")
+    risultato = store_filtered_csv(GIORNO, "export.csv", io.BytesIO(content))
+    assert risultato.righe == 1
+    with Session(engine) as session:
+        totali = read_stored_totali(session, GIORNO)
+    assert totali is not None
+    assert [(s.codice, s.righe) for s in totali.subtotali] == [("2282", 1)]
+
+
+def test_store_replaces_previous_result() -> None:
+    store_filtered_csv(
+        GIORNO, "a.csv", io.BytesIO(filter_csv_bytes(CSV, {"2282"}).content)
+    )
+    content = filter_csv_bytes(CSV, {"ABC"}).content
+    risultato = store_filtered_csv(GIORNO, "b.csv", io.BytesIO(content))
+    assert (risultato.filename, risultato.righe) == ("b.csv", 1)
+    assert "".join(iter_stored_csv(risultato)).encode() == content
+
+
+def test_result_spool_stores_only_complete_output() -> None:
+    content = filter_csv_bytes(CSV, {"2282"}).content.decode()
+    giorno = date(2023, 12, 30)
+
+    # Risposta interrotta: il client smette di leggere dopo il primo blocco
+    interrupted = ResultSpool(giorno, "export.csv")
+    next(interrupted.tee([content[:20], content[20:]]))
+    interrupted.store()
+    with Session(engine) as session:
+        assert read_stored_totali(session, giorno) is None
+
+    complete = ResultSpool(giorno, "export.csv")
+    assert "".join(complete.tee([content[:20], content[20:]])) == content
+    complete.store()
+    with Session(engine) as session:
+        totali = read_stored_totali(session, giorno)
+    assert totali is not None
+    assert totali.totale == "1.000,50"
+
+
+def test_read_missing_day() -> None:
+    with Session(engine) as session:
+        assert read_stored_totali(session, date(1999, 1, 1)) is None
@@ -0,0 +1,47 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.services.csv_filter import CsvFilterError
+from app.services.csv_tasks import (
+    CodiciMancanti,
+    _call_with_codici,
+    filter_csv_bytes,
+)
+
+CSV = (
+    b"Data;Codice committente;Importo totale\r\n"
+    b"01/01;2282;1.000,50\r\n"
+    b"01/01;9999;5,00\r\n"
+)
+
+
+def test_filter_csv_bytes() -> None:
+    result = filter_csv_bytes(CSV, frozenset({"2282"}))
+    assert result.content == (
+        b"Data;Codice committente;Importo totale\r\n"
+        b"01/01;2282;1.000,50\r\n"
+        b";TOTALE;1.000,50\r\n"
+    )
+    assert result.rows_processed == 1
+    assert result.totale == "1.000,50"
+
+
+def test_filter_csv_bytes_invalid_file() -> None:
+    with pytest.raises(CsvFilterError):
+        filter_csv_bytes(b"Data;Importo totale\r\n", frozenset({"2282"}))
+
+
+def test_worker_keeps_last_codici() -> None:
+    with patch("app.services.csv_tasks._worker_codici", {}):
+        # Primo invio con quell'impronta: i codici vanno allegati
+        with pytest.raises(CodiciMancanti):
+            _call_with_codici(filter_csv_bytes, "a", None, CSV)
+        result = _call_with_codici(filter_csv_bytes, "a", frozenset({"2282"}), CSV)
+        assert result.rows_processed == 1
+        # Poi basta l'impronta
+        result = _call_with_codici(filter_csv_bytes, "a", None, CSV)
+        assert result.rows_processed == 1
+        _call_with_codici(filter_csv_bytes, "b", frozenset({"9999"}), CSV)
+        with pytest.raises(CodiciMancanti):
+            _call_with_codici(filter_csv_bytes, "a", None, CSV)
@@ -0,0 +1,217 @@
+import socket
+from collections.abc import Generator
+from email.message import EmailMessage
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import Envelope
+from sqlalchemy import text
+from sqlmodel import Session, col, delete, select
+
+from app.core.db import engine
+from app.models import EmailOutbox as EmailOutboxRow
+from app.services.email_outbox import EmailOutbox, SmtpConnection, backoff_seconds
+
+
+class _Handler:
+    def __init__(self) -> None:
+        self.recipients: list[list[str]] = []
+        self.sessions: set[int] = set()
+        self.reject: set[str] = set()
+
+    async def handle_RCPT(
+        self,
+        _server: Any,
+        session: Any,
+        envelope: Envelope,
+        address: str,
+        _options: Any,
+    ) -> str:
+        if address in self.reject:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, _server: Any, session: Any, envelope: Envelope) -> str:
+        self.sessions.add(id(session))
+        # L'envelope è riusato per i messaggi successivi della sessione
+        self.recipients.append(list(envelope.rcpt_tos))
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+@pytest.fixture
+def smtp_server() -> Generator[_Handler, None, None]:
+    handler = _Handler()
+    port = _free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        with (
+            patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+            patch("app.core.config.settings.SMTP_PORT", port),
+            patch("app.core.config.settings.SMTP_TLS", False),
+            patch("app.core.config.settings.SMTP_USER", None),
+            patch("app.core.config.settings.EMAILS_FROM_EMAIL", "noreply@example.com"),
+        ):
+            yield handler
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def outbox(db: Session) -> Generator[EmailOutbox, None, None]:
+    db.execute(delete(EmailOutboxRow))
+    db.commit()
+    yield EmailOutbox(
+        engine,
+        workers=1,
+        batch_size=10,
+        poll_seconds=1,
+        max_attempts=2,
+        lease_seconds=60,
+    )
+    db.execute(delete(EmailOutboxRow))
+    db.commit()
+
+
+def _rows(db: Session) -> list[EmailOutboxRow]:
+    db.expire_all()
+    return list(db.exec(select(EmailOutboxRow).order_by(col(EmailOutboxRow.id))))
+
+
+def test_messages_share_one_connection(
+    smtp_server: _Handler, outbox: EmailOutbox, db: Session
+) -> None:
+    for i in range(3):
+        outbox.enqueue(
+            email_to=f"u{i}@example.com", subject="Ciao", html_content="<p>x</p>"
+        )
+    smtp = SmtpConnection(idle_seconds=60)
+    try:
+        assert outbox.deliver_pending(smtp) == 3
+    finally:
+        smtp.close()
+    assert smtp_server.recipients == [
+        ["u0@example.com"],
+        ["u1@example.com"],
+        ["u2@example.com"],
+    ]
+    assert len(smtp_server.sessions) == 1
+    assert [row.status for row in _rows(db)] == ["sent"] * 3
+    # Il testo (magari con una password) non resta nella tabella
+    assert [row.html_content for row in _rows(db)] == [""] * 3
+    # Niente da consegnare al giro successivo
+    assert outbox.deliver_pending(smtp) == 0
+
+
+def test_same_transaction_delivered_in_insert_order(
+    smtp_server: _Handler, outbox: EmailOutbox
+) -> None:
+    # Stesso now() per tutti: a parità di scadenza conta l'id
+    outbox.enqueue_many((f"u{i}@example.com", "Ciao", "<p>x</p>") for i in range(10))
+    smtp = SmtpConnection(idle_seconds=60)
+    try:
+        assert outbox.deliver_pending(smtp) == 10
+    finally:
+        smtp.close()
+    assert smtp_server.recipients == [[f"u{i}@example.com"] for i in range(10)]
+
+
+def test_rejected_recipient_fails_without_retry(
+    smtp_server: _Handler, outbox: EmailOutbox, db: Session
+) -> None:
+    smtp_server.reject.add("nobody@example.com")
+    outbox.enqueue(email_to="nobody@example.com", subject="Ciao", html_content="x")
+    outbox.enqueue(email_to="ok@example.com", subject="Ciao", html_content="x")
+    smtp = SmtpConnection(idle_seconds=60)
+    try:
+        outbox.deliver_pending(smtp)
+    finally:
+        smtp.close()
+    failed, sent = _rows(db)
+    assert failed.status == "failed"
+    assert failed.last_error
+    assert failed.html_content == ""
+    assert sent.status == "sent"
+
+
+class _ExpiringConnection(SmtpConnection):
+    """Al primo invio fa scadere il lease di u1 e lo lascia prendere a `other`."""
+
+    def __init__(self, other: EmailOutbox, db: Session) -> None:
+        super().__init__(idle_seconds=60)
+        self._other: EmailOutbox | None = other
+        self._db = db
+
+    def send(self, message: EmailMessage) -> None:
+        if self._other is not None:
+            other, self._other = self._other, None
+            self._db.execute(
+                text(
+                    "UPDATE email_outbox SET next_attempt_at = now() "
+                    "WHERE email_to = 'u1@example.com'"
+                )
+            )
+            self._db.commit()
+            smtp = SmtpConnection(idle_seconds=60)
+            try:
+                assert other.deliver_pending(smtp) == 1
+            finally:
+                smtp.close()
+        super().send(message)
+
+
+def test_expired_lease_is_not_sent_twice(
+    smtp_server: _Handler, outbox: EmailOutbox, db: Session
+) -> None:
+    outbox.enqueue_many((f"u{i}@example.com", "Ciao", "x") for i in range(2))
+    smtp = _ExpiringConnection(outbox, db)
+    try:
+        assert outbox.deliver_pending(smtp) == 2
+    finally:
+        smtp.close()
+    # u1 è partito una volta sola, dal worker che l'ha ripreso
+    assert sorted(smtp_server.recipients) == [["u0@example.com"], ["u1@example.com"]]
+    assert [(row.status, row.attempts) for row in _rows(db)] == [
+        ("sent", 1),
+        ("sent", 2),
+    ]
+
+
+def test_unreachable_server_is_retried_with_backoff(
+    outbox: EmailOutbox, db: Session
+) -> None:
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+        # Porta chiusa: connessione rifiutata
+        patch("app.core.config.settings.SMTP_PORT", 1),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "noreply@example.com"),
+    ):
+        outbox.enqueue(email_to="u@example.com", subject="Ciao", html_content="x")
+        smtp = SmtpConnection(idle_seconds=60)
+        assert outbox.deliver_pending(smtp) == 1
+        (row,) = _rows(db)
+        assert (row.status, row.attempts) == ("pending", 1)
+        assert row.last_error
+
+        # Alla scadenza dell'attesa, l'ultimo tentativo lo segna come fallito
+        db.execute(text("UPDATE email_outbox SET next_attempt_at = now()"))
+        db.commit()
+        assert outbox.deliver_pending(smtp) == 1
+        (row,) = _rows(db)
+        assert (row.status, row.attempts) == ("failed", 2)
+
+
+def test_backoff_doubles_up_to_a_cap() -> None:
+    with patch("app.core.config.settings.EMAIL_OUTBOX_BACKOFF_SECONDS", 30):
+        assert [backoff_seconds(n) for n in (1, 2, 3)] == [30, 60, 120]
+        assert backoff_seconds(20) == 3600
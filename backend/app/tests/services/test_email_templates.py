@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from jinja2 import FileSystemLoader, Template
+
+from app.services.email_templates import TEMPLATES_DIR, EmailTemplateRegistry
+from app.utils import generate_new_account_email, generate_new_account_emails
+
+CONTEXT = {
+    "project_name": "OneExpress",
+    "username": "mario@example.com",
+    "password": "segreta",
+    "email": "mario@example.com",
+    "link": "http://localhost",
+}
+
+
+def test_render_matches_plain_template(tmp_path: Path) -> None:
+    registry = EmailTemplateRegistry(
+        TEMPLATES_DIR, cache_dir=str(tmp_path), auto_reload=False
+    )
+    expected = Template((TEMPLATES_DIR / "new_account.html").read_text()).render(
+        CONTEXT
+    )
+    assert registry.render("new_account.html", CONTEXT) == expected
+    # Il bytecode compilato finisce nella cache su disco
+    assert any(tmp_path.iterdir())
+
+
+def test_preload_avoids_disk_reads() -> None:
+    registry = EmailTemplateRegistry(TEMPLATES_DIR, cache_dir=None, auto_reload=False)
+    registry.preload()
+    with patch.object(FileSystemLoader, "get_source", side_effect=AssertionError):
+        for name in ("new_account.html", "reset_password.html", "test_email.html"):
+            assert registry.render(name, CONTEXT)
+
+
+def test_auto_reload_picks_up_changes(tmp_path: Path) -> None:
+    template = tmp_path / "hello.html"
+    template.write_text("Ciao {{ username }}")
+    registry = EmailTemplateRegistry(tmp_path, cache_dir=None, auto_reload=True)
+    assert registry.render("hello.html", CONTEXT) == "Ciao mario@example.com"
+    template.write_text("Salve {{ username }}")
+    # Jinja confronta la data di modifica del file
+    stat = template.stat()
+    os.utime(template, (stat.st_atime, stat.st_mtime + 10))
+    assert registry.render("hello.html", CONTEXT) == "Salve mario@example.com"
+
+
+def test_batch_matches_single_rendering() -> None:
+    accounts = [(f"u{i}@example.com", f"u{i}@example.com", f"pw{i}") for i in range(3)]
+    batch = generate_new_account_emails(accounts)
+    assert batch == [generate_new_account_email(*account) for account in accounts]
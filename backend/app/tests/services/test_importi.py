@@ -0,0 +1,43 @@
+import pytest
+
+from app.services.importi import ImportiTotals, format_cents, parse_cents
+
+
+@pytest.mark.parametrize(
+    "value, cents",
+    [
+        ("1.234,56", 123456),
+        (" € 1.234,5 ", 123450),
+        ("-12,05", -1205),
+        ("7", 700),
+        ("12,", 1200),
+        ("12.5", 1250),
+        ("1.234", 123),
+        ("1 234,56", 123456),
+        ("0,005", 1),
+        ("+3,10", 310),
+    ],
+)
+def test_parse_cents(value: str, cents: int) -> None:
+    assert parse_cents(value) == cents
+
+
+@pytest.mark.parametrize("value", ["", "n/d", "nan", "1,2,3", "Infinity"])
+def test_parse_cents_invalid(value: str) -> None:
+    with pytest.raises(ValueError):
+        parse_cents(value)
+
+
+def test_format_cents() -> None:
+    assert format_cents(123456789) == "1.234.567,89"
+    assert format_cents(0) == "0,00"
+    assert format_cents(-105) == "-1,05"
+
+
+def test_totals_are_exact() -> None:
+    totals = ImportiTotals()
+    for _ in range(10):
+        totals.add("A", parse_cents("0,10"))
+    totals.add("B", parse_cents("0,20"))
+    assert totals.totale == 120
+    assert totals.subtotali == {"A": 100, "B": 20}
@@ -0,0 +1,38 @@
+import io
+from datetime import date
+from pathlib import Path
+
+from app.services.jobs import INTERRUPTED_ERROR, CsvJobQueue
+
+CSV = b"Data;Codice committente;Importo totale\r\n01/01;2282;1,50\r\n"
+
+
+def _queue(jobs_dir: Path) -> CsvJobQueue:
+    return CsvJobQueue(jobs_dir, retention_seconds=3600)
+
+
+def test_recover_fails_jobs_of_dead_process(tmp_path: Path) -> None:
+    dead = _queue(tmp_path)
+    job = dead._create(date(2024, 1, 1), "export.csv", io.BytesIO(CSV))
+    # Il processo termina: il sistema rilascia il lock
+    assert dead._owner_lock is not None
+    dead._owner_lock.close()
+
+    queue = _queue(tmp_path)
+    queue.recover()
+    recovered = queue.get(job.id)
+    assert recovered.status == "failed"
+    assert recovered.error == INTERRUPTED_ERROR
+    assert recovered.finished_at is not None
+    assert not queue.result_path(job.id).with_suffix(".input").exists()
+
+
+def test_recover_keeps_jobs_of_live_process(tmp_path: Path) -> None:
+    live = _queue(tmp_path)
+    job = live._create(date(2024, 1, 1), "export.csv", io.BytesIO(CSV))
+
+    _queue(tmp_path).recover()
+    assert live.get(job.id).status == "queued"
+    # Anche i propri job restano in coda
+    live.recover()
+    assert live.get(job.id).status == "queued"
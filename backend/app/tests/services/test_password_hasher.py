@@ -0,0 +1,54 @@
+import asyncio
+
+from app.core.security import verify_password
+from app.services.password_hasher import PasswordHasher
+
+
+def test_hash_and_verify() -> None:
+    hasher = PasswordHasher(workers=1, max_concurrency=1)
+
+    async def run() -> tuple[str, bool, bool]:
+        hashed = await hasher.hash("segreta")
+        return (
+            hashed,
+            await hasher.verify("segreta", hashed),
+            await hasher.verify("sbagliata", hashed),
+        )
+
+    try:
+        hashed, ok, wrong = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert verify_password("segreta", hashed)
+    assert ok
+    assert not wrong
+    assert hasher.stats().completed == 3
+
+
+def test_concurrency_limit_queues_requests() -> None:
+    hasher = PasswordHasher(workers=1, max_concurrency=1)
+
+    async def run() -> None:
+        await asyncio.gather(*(hasher.hash(f"pw{i}") for i in range(3)))
+
+    try:
+        asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    # Una chiamata alla volta nel pool: le altre due hanno atteso in coda
+    assert stats.peak_waiting == 2
+    assert stats.running == 0
+    assert stats.waiting == 0
+    assert stats.completed == 3
+
+
+def test_hash_many_keeps_order() -> None:
+    hasher = PasswordHasher(workers=2, max_concurrency=2)
+    passwords = [f"password{i}" for i in range(10)]
+    try:
+        hashed = asyncio.run(hasher.hash_many(passwords))
+    finally:
+        hasher.shutdown()
+    assert len(hashed) == len(passwords)
+    assert all(verify_password(p, h) for p, h in zip(passwords, hashed, strict=True))
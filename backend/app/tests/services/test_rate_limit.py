@@ -0,0 +1,76 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from app.core.db import engine
+from app.services.rate_limit import (
+    LoginThrottle,
+    MemoryBackend,
+    PostgresBackend,
+    RateLimited,
+)
+
+
+def _throttle(backend: MemoryBackend | PostgresBackend) -> LoginThrottle:
+    return LoginThrottle(
+        backend,
+        ip_burst=3,
+        ip_per_minute=60,
+        username_burst=2,
+        username_per_minute=60,
+    )
+
+
+def test_memory_bucket_refills() -> None:
+    backend = MemoryBackend(max_keys=10)
+    with patch("app.services.rate_limit.time.monotonic", return_value=0):
+        assert backend.take("k", capacity=2, rate=1) == 0
+        assert backend.take("k", capacity=2, rate=1) == 0
+        assert backend.take("k", capacity=2, rate=1) == pytest.approx(1)
+    with patch("app.services.rate_limit.time.monotonic", return_value=1):
+        assert backend.take("k", capacity=2, rate=1) == 0
+
+
+def test_memory_backend_bounds_keys() -> None:
+    backend = MemoryBackend(max_keys=2)
+    with patch("app.services.rate_limit.time.monotonic", return_value=0):
+        backend.take("a", capacity=1, rate=1)
+        backend.take("b", capacity=1, rate=1)
+        backend.take("c", capacity=1, rate=1)
+        # "a" è stato scartato e riparte con il bucket pieno
+        assert backend.take("a", capacity=1, rate=1) == 0
+        assert backend.take("c", capacity=1, rate=1) > 0
+
+
+def test_username_limit_ignores_case() -> None:
+    throttle = _throttle(MemoryBackend(max_keys=10))
+    throttle.check(ip="10.0.0.1", username="Mario@example.com")
+    throttle.check(ip="10.0.0.2", username="mario@example.com ")
+    with pytest.raises(RateLimited):
+        throttle.check(ip="10.0.0.3", username="MARIO@example.com")
+    assert throttle.stats().rejected_username == 1
+
+
+def test_ip_limit_spares_username_bucket() -> None:
+    throttle = _throttle(MemoryBackend(max_keys=10))
+    for i in range(3):
+        throttle.check(ip="10.0.0.1", username=f"user{i}")
+    with pytest.raises(RateLimited):
+        throttle.check(ip="10.0.0.1", username="victim")
+    # Il tentativo bloccato per IP non ha consumato il bucket di "victim"
+    throttle.check(ip="10.0.0.2", username="victim")
+    throttle.check(ip="10.0.0.3", username="victim")
+    stats = throttle.stats()
+    assert (stats.allowed, stats.rejected_ip, stats.rejected_username) == (5, 1, 0)
+
+
+def test_postgres_backend() -> None:
+    backend = PostgresBackend(engine)
+    key = f"test:{uuid.uuid4()}"
+    assert backend.take(key, capacity=2, rate=0.01) == 0
+    assert backend.take(key, capacity=2, rate=0.01) == 0
+    assert backend.take(key, capacity=2, rate=0.01) > 0
+    backend.reset()
+    assert backend.take(key, capacity=2, rate=0.01) == 0
+    backend.reset()
@@ -0,0 +1,96 @@
+import io
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO, Any
+from unittest.mock import patch
+
+import pytest
+
+from app.services.result_cache import CsvResultCache, cache_key, key_hasher
+
+
+def test_cache_key_depends_on_content_codici_and_subtotali() -> None:
+    def key(content: bytes, fingerprint: str = "f", subtotali: bool = False) -> str:
+        return cache_key(io.BytesIO(content), fingerprint, subtotali=subtotali)
+
+    assert key(b"a;b\n") == key(b"a;b\n")
+    assert key(b"a;b\n") != key(b"a;c\n")
+    assert key(b"a;b\n") != key(b"a;b\n", fingerprint="g")
+    assert key(b"a;b\n") != key(b"a;b\n", subtotali=True)
+
+
+def test_key_hasher_matches_cache_key() -> None:
+    digest = key_hasher("f", subtotali=True)
+    digest.update(b"a;b\n")
+    digest.update(b"1;2\n")
+    assert digest.hexdigest() == cache_key(
+        io.BytesIO(b"a;b\n1;2\n"), "f", subtotali=True
+    )
+
+
+def test_open_returns_two_readers(tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024)
+    assert cache.open("k") is None
+    cache.put("k", b"data")
+    opened = cache.open("k")
+    assert opened is not None
+    for handle in opened:
+        with handle:
+            assert handle.read() == b"data"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_open_evicted_meanwhile_is_a_miss(tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024)
+    cache.put("k", b"data")
+    path_open = Path.open
+
+    def evicting_open(path: Path, *args: Any, **kwargs: Any) -> IO[Any]:
+        # Un altro processo rimuove il risultato dopo la prima apertura
+        handle: IO[Any] = path_open(path, *args, **kwargs)
+        path.unlink()
+        return handle
+
+    with patch.object(Path, "open", evicting_open):
+        assert cache.open("k") is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_get_and_put(tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024)
+    assert cache.get("k") is None
+    cache.put("k", b"data")
+    path = cache.get("k")
+    assert path is not None and path.read_bytes() == b"data"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_evicted(tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    os.utime(tmp_path / "a.csv", (0, 0))
+    os.utime(tmp_path / "b.csv", (1, 1))
+    # "a" viene letto per ultimo, quindi tocca a "b" uscire
+    assert cache.get("a") is not None
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert (stats.entries, stats.size_bytes) == (2, 8)
+
+
+def test_tee_stores_only_complete_results(tmp_path: Path) -> None:
+    cache = CsvResultCache(tmp_path, max_bytes=1024)
+    assert "".join(cache.tee("ok", iter(["a;", "b\r\n"]))) == "a;b\r\n"
+    assert cache.get("ok") is not None
+
+    def failing() -> Iterator[str]:
+        yield "a;"
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        list(cache.tee("ko", failing()))
+    assert cache.get("ko") is None
+    assert list(tmp_path.iterdir()) == [tmp_path / "ok.csv"]
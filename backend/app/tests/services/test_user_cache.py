@@ -0,0 +1,66 @@
+import uuid
+from unittest.mock import patch
+
+from app.services.user_cache import UserCache, UserPrincipal
+
+
+def _principal(*, is_superuser: bool = False) -> UserPrincipal:
+    return UserPrincipal(id=uuid.uuid4(), is_active=True, is_superuser=is_superuser)
+
+
+def test_put_and_get() -> None:
+    cache = UserCache(ttl_seconds=30, max_entries=10)
+    principal = _principal()
+    user_id = str(principal.id)
+    assert cache.get(user_id) is None
+    cache.put(user_id, principal, generation=cache.generation)
+    assert cache.get(user_id) == principal
+
+
+def test_entries_expire() -> None:
+    cache = UserCache(ttl_seconds=30, max_entries=10)
+    principal = _principal()
+    with patch("app.services.user_cache.time.monotonic", return_value=0):
+        cache.put(str(principal.id), principal, generation=cache.generation)
+    with patch("app.services.user_cache.time.monotonic", return_value=31):
+        assert cache.get(str(principal.id)) is None
+
+
+def test_least_recently_used_is_evicted() -> None:
+    cache = UserCache(ttl_seconds=30, max_entries=2)
+    a, b, c = _principal(), _principal(), _principal()
+    for principal in (a, b):
+        cache.put(str(principal.id), principal, generation=cache.generation)
+    cache.get(str(a.id))
+    cache.put(str(c.id), c, generation=cache.generation)
+    assert cache.get(str(a.id)) == a
+    assert cache.get(str(b.id)) is None
+
+
+def test_invalidate_one_user() -> None:
+    cache = UserCache(ttl_seconds=30, max_entries=10)
+    a, b = _principal(), _principal()
+    for principal in (a, b):
+        cache.put(str(principal.id), principal, generation=cache.generation)
+    cache.invalidate(a.id)
+    assert cache.get(str(a.id)) is None
+    assert cache.get(str(b.id)) == b
+
+
+def test_stale_generation_is_not_stored() -> None:
+    cache = UserCache(ttl_seconds=30, max_entries=10)
+    principal = _principal()
+    generation = cache.generation
+    cache._on_notify(str(principal.id))
+    cache.put(str(principal.id), principal, generation=generation)
+    assert cache.get(str(principal.id)) is None
+
+
+def test_empty_notify_clears_everything() -> None:
+    cache = UserCache(ttl_seconds=30, max_entries=10)
+    a, b = _principal(), _principal()
+    for principal in (a, b):
+        cache.put(str(principal.id), principal, generation=cache.generation)
+    cache._on_notify("")
+    assert cache.get(str(a.id)) is None
+    assert cache.get(str(b.id)) is None
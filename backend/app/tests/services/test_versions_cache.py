@@ -0,0 +1,57 @@
+from datetime import date
+from unittest.mock import patch
+
+from app.models import BaseVersion
+from app.services.versions_cache import VersionsCache, version_etag
+
+GIORNO = date(2024, 1, 1)
+
+
+def _version(giorno: date = GIORNO, versione: str = "1") -> BaseVersion:
+    return BaseVersion(giorno=giorno, versione=versione)
+
+
+def test_put_and_get() -> None:
+    cache = VersionsCache(ttl_seconds=60, max_entries=10)
+    assert cache.get(GIORNO) is None
+    cached = cache.put(_version(), generation=cache.generation)
+    assert cache.get(GIORNO) == cached
+    assert cached.etag == version_etag(_version())
+    assert cached.etag != version_etag(_version(versione="2"))
+
+
+def test_entries_expire() -> None:
+    cache = VersionsCache(ttl_seconds=60, max_entries=10)
+    with patch("app.services.versions_cache.time.monotonic", return_value=0):
+        cache.put(_version(), generation=cache.generation)
+    with patch("app.services.versions_cache.time.monotonic", return_value=61):
+        assert cache.get(GIORNO) is None
+
+
+def test_least_recently_used_is_evicted() -> None:
+    cache = VersionsCache(ttl_seconds=60, max_entries=2)
+    for day in (1, 2):
+        cache.put(_version(date(2024, 1, day)), generation=cache.generation)
+    cache.get(date(2024, 1, 1))
+    cache.put(_version(date(2024, 1, 3)), generation=cache.generation)
+    assert cache.get(date(2024, 1, 1)) is not None
+    assert cache.get(date(2024, 1, 2)) is None
+
+
+def test_notify_invalidates() -> None:
+    cache = VersionsCache(ttl_seconds=60, max_entries=10)
+    for day in (1, 2):
+        cache.put(_version(date(2024, 1, day)), generation=cache.generation)
+    cache._on_notify("2024-01-01")
+    assert cache.get(date(2024, 1, 1)) is None
+    assert cache.get(date(2024, 1, 2)) is not None
+    cache._on_notify(None)
+    assert cache.get(date(2024, 1, 2)) is None
+
+
+def test_stale_read_is_not_cached() -> None:
+    cache = VersionsCache(ttl_seconds=60, max_entries=10)
+    generation = cache.generation
+    cache.invalidate(GIORNO)
+    cache.put(_version(), generation=generation)
+    assert cache.get(GIORNO) is None
@@ -0,0 +1,20 @@
+from sqlmodel import Session
+
+from app import crud
+from app.models import Azienda, AziendaCreate
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_azienda(db: Session, **fields: str) -> Azienda:
+    values = {
+        "codice": random_lower_string()[:10].upper(),
+        "ragione_sociale": random_lower_string(),
+        "nazione": "Italia",
+        "provincia": "MI",
+        "citta": "Milano",
+        "via": random_lower_string(),
+        "cap": "20100",
+    }
+    values.update(fields)
+    azienda_in = AziendaCreate(**values)
+    return crud.create_azienda(session=db, azienda_in=azienda_in)
@@ -1,16 +1,16 @@
 import logging
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from pathlib import Path
 from typing import Any
 
-import emails  # type: ignore
 import jwt
-from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
 
 from app.core import security
 from app.core.config import settings
+from app.services.email_outbox import email_outbox
+from app.services.email_templates import email_templates
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,11 +23,7 @@ class EmailData:
 
 
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
-    return html_content
+    return email_templates.render(template_name, context)
 
 
 def send_email(
@@ -36,23 +32,18 @@ def send_email(
     subject: str = "",
     html_content: str = "",
 ) -> None:
+    """Queue an email; the outbox workers deliver it in the background."""
     assert settings.emails_enabled, "no provided configuration for email variables"
-    message = emails.Message(
-        subject=subject,
-        html=html_content,
-        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
+    email_outbox.enqueue(email_to=email_to, subject=subject, html_content=html_content)
+    logger.info(f"email to {email_to} queued")
+
+
+def send_emails(emails: Iterable[tuple[str, EmailData]]) -> None:
+    """Queue many emails at once, given as (email_to, email data) pairs."""
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    email_outbox.enqueue_many(
+        (email_to, data.subject, data.html_content) for email_to, data in emails
     )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
-    logger.info(f"send email result: {response}")
 
 
 def generate_test_email(email_to: str) -> EmailData:
@@ -100,6 +91,38 @@ def generate_new_account_email(
     return EmailData(html_content=html_content, subject=subject)
 
 
+def generate_new_account_emails(
+    accounts: Iterable[tuple[str, str, str]],
+) -> list[EmailData]:
+    """
+    New-account emails for many users at once, e.g. after a bulk import.
+
+    `accounts` holds (email_to, username, password) triples.
+    """
+    accounts = list(accounts)
+    project_name = settings.PROJECT_NAME
+    html_contents = email_templates.render_batch(
+        "new_account.html",
+        (
+            {
+                "project_name": project_name,
+                "username": username,
+                "password": password,
+                "email": email_to,
+                "link": settings.FRONTEND_HOST,
+            }
+            for email_to, username, password in accounts
+        ),
+    )
+    return [
+        EmailData(
+            html_content=html_content,
+            subject=f"{project_name} - New account for user {username}",
+        )
+        for (_, username, _), html_content in zip(accounts, html_contents, strict=True)
+    ]
+
+
 def generate_password_reset_token(email: str) -> str:
     delta = timedelta(hours=settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS)
     now = datetime.now(timezone.utc)